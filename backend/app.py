@@ -1,32 +1,58 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, g
 from flask_cors import CORS
 import requests
-from bs4 import BeautifulSoup
 import re
-import json
 import os
+import json
+import time
+import base64
+import bisect
+import logging
+import functools
+import importlib.util
+import contextvars
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait as wait_futures
 from datetime import datetime, timedelta
+from urllib.parse import quote
 from dotenv import load_dotenv
 
-# Import selenium for JavaScript-rendered pages (required for HEB)
-try:
-    from selenium import webdriver
-    from selenium.webdriver.firefox.options import Options as FirefoxOptions
-    from selenium.webdriver.firefox.service import Service as FirefoxService
-    from selenium.webdriver.common.by import By
-    from selenium.webdriver.support.ui import WebDriverWait
-    from selenium.webdriver.support import expected_conditions as EC
-    from selenium.common.exceptions import TimeoutException, WebDriverException
-    try:
-        from webdriver_manager.firefox import GeckoDriverManager
-        WEBDRIVER_MANAGER_AVAILABLE = True
-    except ImportError:
-        WEBDRIVER_MANAGER_AVAILABLE = False
-    SELENIUM_AVAILABLE = True
-except ImportError:
-    SELENIUM_AVAILABLE = False
-    WEBDRIVER_MANAGER_AVAILABLE = False
-    print("ERROR: Selenium not installed. Install with: pip install selenium webdriver-manager")
+import metrics
+import responses
+import stores
+import tracing
+from caches import TTLCache
+from filtering import normalize_text, IndexedResults
+from filter_store import FilterStore
+from queries import KeyCardinality, SingleFlight, canonicalize_query, query_text
+from suggest import SuggestIndex
+from local_search import LocalProductIndex, product_key
+from enrichment import EnrichmentQueue
+from identity import ProductIdentityIndex
+from price_history import PriceHistory
+from nutrition import nutrition_from_api, parse_rule
+from prices import PRICE_FIELDS, effective_cents, format_cents, set_price_fields, to_cents
+from locations import LocationIndex, PreferredLocations, location_from_api
+from stores import StoreAdapter, StoreRegistry
+
+logging.basicConfig(
+    level=os.getenv("LOG_LEVEL", "INFO").upper(),
+    format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+)
+log = logging.getLogger("healthy_food_finder")
+
+# Scraping (Selenium + BeautifulSoup) lives in scraping.py and is imported on first use, so a
+# worker that only talks to the Kroger API never pays for those imports. find_spec doesn't import.
+SELENIUM_AVAILABLE = importlib.util.find_spec("selenium") is not None
+if not SELENIUM_AVAILABLE:
+    log.warning("Selenium not installed; scraping fallback disabled. Install with: pip install selenium webdriver-manager")
+
+
+def scraper():
+    """The scraping module (see scraping.py for its interface), imported on first call."""
+    import scraping
+    return scraping
 
 # Load environment variables from .env file
 load_dotenv()
@@ -64,35 +90,136 @@ DEFAULT_FILTERS = [
     "monosodium glutamate", "msg", "carrageenan", "polysorbate"
 ]
 
-# In-memory storage (can be replaced with a database)
-user_filters = {}
-product_cache = {}
-cache_expiry = {}
-# Incremented whenever a user's filters change, so cached searches are invalidated.
-user_filter_versions = {}
+# Named filter profiles users can start from. Users only store their own
+# additions/removals on top of a profile; see filter_store.py.
+FILTER_PROFILES = {
+    "default": DEFAULT_FILTERS,
+    "keto": DEFAULT_FILTERS + [
+        "sugar", "cane sugar", "corn syrup", "dextrose", "maltodextrin", "maltitol",
+        "wheat flour", "enriched flour", "rice flour", "corn starch", "potato starch",
+    ],
+    "no-seed-oils": [
+        "seed oil", "vegetable oil", "canola oil", "soybean oil", "corn oil",
+        "sunflower oil", "safflower oil", "rapeseed oil", "cottonseed oil",
+        "grapeseed oil", "rice bran oil",
+    ],
+}
 
+# User filters persist in SQLite (shared across workers). Users whose profile + changes
+# resolve to the same filter set share one compiled matcher and one search cache entry.
+FILTER_DB_PATH = os.getenv("FILTER_DB_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "filters.db"))
+filter_store = FilterStore(FILTER_DB_PATH, FILTER_PROFILES)
 
-def _bump_filter_version(user_id: str) -> int:
-    user_filter_versions[user_id] = int(user_filter_versions.get(user_id, 0)) + 1
-    return user_filter_versions[user_id]
+# Every product seen upstream is kept in a local full-text index (SQLite FTS5): head queries
+# are answered from it, and it keeps search working while Kroger is unreachable.
+local_index = LocalProductIndex(
+    os.getenv("LOCAL_INDEX_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "products.db"))
+)
 
+# In-memory search cache (keyed by store, query and filter-set fingerprint). The search caches below
+# are bounded: expired entries are swept out on insert, and past the size limit the LRU one goes.
+SEARCH_CACHE_MAX_ENTRIES = int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", "5000"))
+product_cache = TTLCache(SEARCH_CACHE_MAX_ENTRIES)
+# Each cached search is serialized + compressed once per view (hidden products or not, field projection,
+# sort and price limit), and its products put in price / unit-price order once; both are kept on the
+# cache entry ('_views', '_orders'), so they go when it does.
+SORTS = ("relevance", "price", "unit_price")
+MAX_VIEWS_PER_SEARCH = 64
+# compact=true: what a result grid needs; ingredients etc. are fetched per product via /api/products/details.
+COMPACT_FIELDS = ("productId", "name", "price", "promo_price", "unit_price", "image", "url", "store", "offers",
+                  "lowest_recent_price", "unverified")
+MAX_PROJECTED_FIELDS = 20
+# Unfiltered upstream results per store + query, with a term -> product index shared by all
+# filter sets; a new filter set for a cached query is evaluated from the index, not re-fetched.
+results_cache = TTLCache(SEARCH_CACHE_MAX_ENTRIES, on_evict=lambda key, _: upstream_next.pop(key))
+# Concurrent misses for the same store + canonical query share one upstream call.
+_search_flights = SingleFlight()
+# Distinct queries as typed vs. after canonicalization (exported on /metrics).
+query_cardinality = KeyCardinality()
+# page_size + cursor: pages are slices of the cached filtered (and sorted) products; the cursor is opaque
+# to clients (cache entry, its generation, offsets). Single-store searches grow one upstream page at a
+# time: the next page is prefetched when a cursor nears the end of what is cached.
+MAX_PAGE_SIZE = 100
+UPSTREAM_PAGE_SIZE = 20
+SEARCH_MAX_DEPTH = int(os.getenv("SEARCH_MAX_DEPTH", "250"))
+# results key -> the upstream page to fetch next; dropped with its results_cache entry (and bounded the same).
+upstream_next = TTLCache(SEARCH_CACHE_MAX_ENTRIES)
+_prefetch_pool = ThreadPoolExecutor(
+    max_workers=int(os.getenv("PREFETCH_WORKERS", "4")), thread_name_prefix="search-prefetch"
+)
+# Multi-location searches: each location's offers (price, availability) are cached separately
+# and the location-independent product data is interned by productId, so it is held once.
+LOCATION_FIELDS = PRICE_FIELDS + ("fulfillment",)
+MAX_SEARCH_LOCATIONS = 10
+location_cache = TTLCache(SEARCH_CACHE_MAX_ENTRIES)
+_product_catalog = OrderedDict()
+_PRODUCT_CATALOG_MAX = 50_000
+_location_pool = ThreadPoolExecutor(
+    max_workers=int(os.getenv("LOCATION_FANOUT_WORKERS", "16")), thread_name_prefix="location-search"
+)
+# Past queries + cached product names, for /api/suggest.
+suggest_index = SuggestIndex()
+# Products the API returned without an ingredient statement are enriched in the background
+# (rate-limited product-page fetches); until then they are only filtered on name/brand/categories
+# and marked "unverified". Products whose page had no ingredients are retried after a week.
+ENRICH_INGREDIENTS = os.getenv("ENRICH_INGREDIENTS", "true" if SELENIUM_AVAILABLE else "false").lower() == "true"
+ENRICH_EMPTY_RETRY_S = 7 * 24 * 3600
+enrichment_queue = EnrichmentQueue(
+    lambda item: _enrich_ingredients(*item),
+    rate_per_minute=float(os.getenv("ENRICH_RATE_PER_MINUTE", "20")),
+    workers=int(os.getenv("ENRICH_WORKERS", "1")),
+    on_result=lambda result, backlog: (metrics.ENRICHMENT.inc(result=result),
+                                       metrics.ENRICHMENT_BACKLOG.set(backlog)),
+)
+# /api/products/details: products by ID from memory, the local index, the Kroger API (batched),
+# and only then product-page scrapes, a few at a time on the shared Selenium pool. Scrapes outlive
+# the request that asked, so each request starts at most DETAILS_MAX_SCRAPES_PER_REQUEST and no more
+# than DETAILS_MAX_QUEUED_SCRAPES are queued or running at once.
+MAX_DETAIL_IDS = 200
+DETAILS_MAX_SCRAPES_PER_REQUEST = int(os.getenv("DETAILS_MAX_SCRAPES_PER_REQUEST", "5"))
+product_details_cache = TTLCache(int(os.getenv("PRODUCT_DETAILS_CACHE_MAX_ENTRIES", "20000")))
+_details_scrape_pool = ThreadPoolExecutor(
+    max_workers=int(os.getenv("SELENIUM_POOL_SIZE", "2")), thread_name_prefix="details-scrape"
+)
+_details_scrape_slots = threading.BoundedSemaphore(int(os.getenv("DETAILS_MAX_QUEUED_SCRAPES", "20")))
+_detail_flights = SingleFlight()
+# Store locations in a lat/lon grid: ZIP or coordinates -> nearest stores without an upstream call.
+# Loaded from a saved Locations API dump when given; otherwise each area is fetched from the
+# Locations API the first time someone looks there. Each user's chosen store sits next to their filters.
+location_index = LocationIndex()
+if os.getenv("KROGER_LOCATIONS_FILE"):
+    location_index.load_file(os.getenv("KROGER_LOCATIONS_FILE"))
+if os.getenv("LOCATIONS_ZIP_FILE"):
+    location_index.load_zip_file(os.getenv("LOCATIONS_ZIP_FILE"))
+LOCATIONS_RADIUS_MILES = float(os.getenv("LOCATIONS_RADIUS_MILES", "50"))
+_location_areas_fetched = set()
+_location_area_flights = SingleFlight()
+preferred_locations = PreferredLocations(FILTER_DB_PATH)
+# Stores are adapters in a registry (see stores.py and the adapters below). store=all searches every
+# enabled store at once; each has until its own timeout, all of them until STORE_FANOUT_TIMEOUT_S.
+HEB_ENABLED = os.getenv("HEB_ENABLED", "false").lower() == "true"
+STORE_FANOUT_TIMEOUT_S = float(os.getenv("STORE_FANOUT_TIMEOUT_S", "25"))
+_store_pool = ThreadPoolExecutor(
+    max_workers=int(os.getenv("STORE_FANOUT_WORKERS", "8")), thread_name_prefix="store-search"
+)
+# Every listing seen is linked to a cross-store identity (same UPC, or names alike enough); store=all
+# shows one product per identity with each store's offer, and ingredients are enriched once per identity.
+product_identities = ProductIdentityIndex(threshold=float(os.getenv("IDENTITY_NAME_SIMILARITY", "0.85")))
 
-def _invalidate_user_cache(user_id: str) -> None:
-    """Remove cached search results for a user (any store/query)."""
-    keys = [k for k in product_cache.keys() if k.endswith(f"_{user_id}")]
-    for k in keys:
-        product_cache.pop(k, None)
-        cache_expiry.pop(k, None)
+# Every price a search sees, as integer cents per product, location and day (SQLite). Searches only
+# queue observations; a background thread writes them in batches. Results carry the lowest price of
+# the last PRICE_LOWEST_DAYS days when there is history from before today.
+price_history = PriceHistory(
+    os.getenv("PRICE_HISTORY_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "prices.db")),
+    flush_every_s=float(os.getenv("PRICE_HISTORY_FLUSH_S", "5")),
+)
+PRICE_LOWEST_DAYS = int(os.getenv("PRICE_LOWEST_DAYS", "30"))
+MAX_PRICE_HISTORY_DAYS = 730
 
 # Kroger API token cache (service-to-service OAuth)
 _KROGER_TOKEN = None
 _KROGER_TOKEN_EXPIRY = None
-
-def normalize_text(text):
-    """Normalize text for comparison"""
-    if not text:
-        return ""
-    return text.lower().strip()
+_token_flight = SingleFlight()
 
 def check_ingredients(ingredients_text, filters):
     """Check if ingredients contain any filtered items"""
@@ -128,33 +255,35 @@ def _kroger_get_access_token() -> str:
 
     kroger_scope = os.getenv("KROGER_SCOPE", "product.compact").strip() or "product.compact"
 
-    resp = requests.post(
-        token_url,
-        data={"grant_type": "client_credentials", "scope": kroger_scope},
-        auth=(client_id, client_secret),
-        timeout=15,
-    )
-    if resp.status_code >= 400:
-        raise Exception(f"Kroger token request failed ({resp.status_code}): {resp.text[:300]}")
+    def fetch():
+        global _KROGER_TOKEN, _KROGER_TOKEN_EXPIRY
+        resp = requests.post(
+            token_url,
+            data={"grant_type": "client_credentials", "scope": kroger_scope},
+            auth=(client_id, client_secret),
+            timeout=15,
+        )
+        metrics.UPSTREAM_RESPONSES.inc(endpoint="token", status=resp.status_code)
+        if resp.status_code >= 400:
+            raise Exception(f"Kroger token request failed ({resp.status_code}): {resp.text[:300]}")
+
+        data = resp.json()
+        token = data.get("access_token")
+        expires_in = int(data.get("expires_in", 1800))
+        if not token:
+            raise Exception("Kroger token response missing access_token.")
 
-    data = resp.json()
-    token = data.get("access_token")
-    expires_in = int(data.get("expires_in", 1800))
-    if not token:
-        raise Exception("Kroger token response missing access_token.")
+        _KROGER_TOKEN = token
+        _KROGER_TOKEN_EXPIRY = datetime.now() + timedelta(seconds=expires_in)
+        return token
 
-    _KROGER_TOKEN = token
-    _KROGER_TOKEN_EXPIRY = datetime.now() + timedelta(seconds=expires_in)
+    # Parallel location searches share one token request.
+    token, _ = _token_flight.do(token_url, fetch)
     return token
 
 
-def kroger_api_product_search(search_term: str, limit: int = 20):
-    """
-    Search Kroger products via official Products API.
-    https://developer.kroger.com/documentation/api-products/public/products/product-search
-    """
-    token = _kroger_get_access_token()
-    location_id = os.getenv("KROGER_LOCATION_ID", "").strip()
+def _kroger_products_get(token, params):
+    """GET the Products endpoint (Catalog v2, falling back to v1 on insufficient_scope); raises on HTTP errors."""
     # Kroger's newer docs show Catalog API v2:
     # https://developer.kroger.com/api-products/api/catalog-api-v2#tag/Catalog-V2/paths/~1catalog~1v2~1products/get
     base_url = os.getenv("KROGER_API_BASE_URL", "https://api.kroger.com").rstrip("/")
@@ -162,20 +291,15 @@ def kroger_api_product_search(search_term: str, limit: int = 20):
     if not products_path.startswith("/"):
         products_path = "/" + products_path
 
-    params = {
-        "filter.term": search_term,
-        "filter.limit": str(min(int(limit), 50)),
-        "filter.start": "0",
-    }
-    if location_id:
-        params["filter.locationId"] = location_id
-
-    resp = requests.get(
-        f"{base_url}{products_path}",
-        headers={"Authorization": f"Bearer {token}", "Accept": "application/json"},
-        params=params,
-        timeout=20,
-    )
+    with metrics.stage("upstream"), tracing.span("kroger.products_v2", path=products_path) as sp:
+        resp = requests.get(
+            f"{base_url}{products_path}",
+            headers={"Authorization": f"Bearer {token}", "Accept": "application/json"},
+            params=params,
+            timeout=20,
+        )
+        sp.set(status=resp.status_code)
+    metrics.UPSTREAM_RESPONSES.inc(endpoint="products", status=resp.status_code)
     if resp.status_code == 403:
         # Catalog v2 may require different scopes depending on your app's permissions.
         # Fall back to the legacy v1 Products endpoint which works with `product.compact`
@@ -189,18 +313,124 @@ def kroger_api_product_search(search_term: str, limit: int = 20):
             legacy_path = os.getenv("KROGER_LEGACY_PRODUCTS_PATH", "/products").strip()
             if not legacy_path.startswith("/"):
                 legacy_path = "/" + legacy_path
-            resp = requests.get(
-                f"{legacy_base}{legacy_path}",
-                headers={"Authorization": f"Bearer {token}", "Accept": "application/json"},
-                params=params,
-                timeout=20,
-            )
+            with metrics.stage("upstream"), tracing.span("kroger.products_v1_fallback", path=legacy_path) as sp:
+                resp = requests.get(
+                    f"{legacy_base}{legacy_path}",
+                    headers={"Authorization": f"Bearer {token}", "Accept": "application/json"},
+                    params=params,
+                    timeout=20,
+                )
+                sp.set(status=resp.status_code)
+            metrics.UPSTREAM_RESPONSES.inc(endpoint="products_v1", status=resp.status_code)
     if resp.status_code >= 400:
         raise Exception(f"Kroger product search failed ({resp.status_code}): {resp.text[:300]}")
 
+    return resp
+
+
+def kroger_api_product_search(search_term: str, limit: int = 20, location_id: str = None, start: int = 0):
+    """
+    Search Kroger products via official Products API.
+    https://developer.kroger.com/documentation/api-products/public/products/product-search
+    Prices/availability are for `location_id` (default: KROGER_LOCATION_ID); `start` skips that many results.
+    """
+    with metrics.stage("token"), tracing.span("kroger.token"):
+        token = _kroger_get_access_token()
+    if location_id is None:
+        location_id = os.getenv("KROGER_LOCATION_ID", "").strip()
+    params = {
+        "filter.term": search_term,
+        "filter.limit": str(min(int(limit), 50)),
+        "filter.start": str(int(start)),
+    }
+    if location_id:
+        params["filter.locationId"] = location_id
+
+    resp = _kroger_products_get(token, params)
+
+    with metrics.stage("json_parse"), tracing.span("kroger.json_parse"):
+        payload = resp.json()
+    items = payload.get("data", []) if isinstance(payload, dict) else []
+
+    with metrics.stage("transform"):
+        return _kroger_api_items_to_products(items, limit)
+
+
+def kroger_api_products_by_id(product_ids, location_id=None, batch_size=50):
+    """
+    Look up products by productId via the Products API (filter.productId, up to 50 IDs per call).
+    Returns {productId: product}; IDs Kroger doesn't know are simply absent.
+    """
+    with metrics.stage("token"), tracing.span("kroger.token"):
+        token = _kroger_get_access_token()
+    if location_id is None:
+        location_id = os.getenv("KROGER_LOCATION_ID", "").strip()
+    found = {}
+    for start in range(0, len(product_ids), batch_size):
+        batch = product_ids[start:start + batch_size]
+        params = {"filter.productId": ",".join(batch), "filter.limit": str(len(batch))}
+        if location_id:
+            params["filter.locationId"] = location_id
+        with tracing.span("kroger.products_by_id", ids=len(batch)):
+            payload = _kroger_products_get(token, params).json()
+        items = payload.get("data", []) if isinstance(payload, dict) else []
+        for product in _kroger_api_items_to_products(items, len(items)):
+            found[product["productId"]] = product
+    return found
+
+
+def _kroger_locations_get(suffix="", params=None):
+    """GET the Locations endpoint (or one location under it); the response, 404 included, else raises."""
+    with metrics.stage("token"), tracing.span("kroger.token"):
+        token = _kroger_get_access_token()
+    base_url = os.getenv("KROGER_LEGACY_API_BASE_URL", "https://api.kroger.com/v1").rstrip("/")
+    locations_path = os.getenv("KROGER_LOCATIONS_PATH", "/locations").strip()
+    if not locations_path.startswith("/"):
+        locations_path = "/" + locations_path
+
+    with metrics.stage("upstream"), tracing.span("kroger.locations", path=locations_path) as sp:
+        resp = requests.get(
+            f"{base_url}{locations_path}{suffix}",
+            headers={"Authorization": f"Bearer {token}", "Accept": "application/json"},
+            params=params,
+            timeout=20,
+        )
+        sp.set(status=resp.status_code)
+    metrics.UPSTREAM_RESPONSES.inc(endpoint="locations", status=resp.status_code)
+    if resp.status_code >= 400 and resp.status_code not in (400, 404):
+        raise Exception(f"Kroger location search failed ({resp.status_code}): {resp.text[:300]}")
+    return resp
+
+
+def kroger_api_locations_near(zip_code=None, lat=None, lon=None, radius_miles=50, limit=200):
+    """
+    Stores near a ZIP code or lat/lon via the Kroger Locations API, as flattened location dicts.
+    https://developer.kroger.com/api-products/api/location-api-public
+    """
+    params = {"filter.radiusInMiles": str(int(radius_miles)), "filter.limit": str(min(int(limit), 200))}
+    if zip_code:
+        params["filter.zipCode.near"] = zip_code
+    else:
+        params["filter.latLong.near"] = f"{lat},{lon}"
+    resp = _kroger_locations_get(params=params)
+    if resp.status_code >= 400:
+        raise Exception(f"Kroger location search failed ({resp.status_code}): {resp.text[:300]}")
     payload = resp.json()
     items = payload.get("data", []) if isinstance(payload, dict) else []
+    return [loc for loc in map(location_from_api, items) if loc]
+
+
+def kroger_api_location(location_id):
+    """One store by locationId via the Kroger Locations API, flattened; None if Kroger doesn't know it."""
+    resp = _kroger_locations_get(f"/{quote(location_id, safe='')}")
+    if resp.status_code >= 400:
+        return None
+    payload = resp.json()
+    return location_from_api(payload.get("data") if isinstance(payload, dict) else None)
+
 
+def _kroger_api_items_to_products(items, limit):
+    """Convert Kroger Products API items into the product dicts returned by /api/search"""
     out = []
     for it in items[:limit]:
         if not isinstance(it, dict):
@@ -216,14 +446,20 @@ def kroger_api_product_search(search_term: str, limit: int = 20):
             pid = it.get("productId") or it.get("upc") or ""
             web_url = f"https://www.kroger.com/p/{pid}" if pid else ""
         price = "N/A"
+        regular = promo = None
+        size = ""
+        fulfillment = {}
         try:
             items0 = it.get("items")
             if isinstance(items0, list) and items0:
                 price_obj = items0[0].get("price") if isinstance(items0[0], dict) else None
                 if isinstance(price_obj, dict):
                     regular = price_obj.get("regular")
-                    if regular is not None:
-                        price = f"${regular}"
+                    promo = price_obj.get("promo")
+                if isinstance(items0[0], dict) and isinstance(items0[0].get("size"), str):
+                    size = items0[0]["size"]
+                if isinstance(items0[0], dict) and isinstance(items0[0].get("fulfillment"), dict):
+                    fulfillment = items0[0]["fulfillment"]
         except Exception:
             pass
 
@@ -237,14 +473,17 @@ def kroger_api_product_search(search_term: str, limit: int = 20):
         except Exception:
             pass
 
-        # Ingredients (fast): v1 often provides ingredientStatement inside nutritionInformation
+        # Ingredients (fast): v1 often provides ingredientStatement inside nutritionInformation,
+        # next to the nutrition panel (read into numbers per serving for nutrient rules)
         ingredients = ""
+        nutrients = {}
         try:
             nutrition = it.get("nutritionInformation")
             if isinstance(nutrition, list) and nutrition:
                 stmt = nutrition[0].get("ingredientStatement") if isinstance(nutrition[0], dict) else ""
                 if stmt and isinstance(stmt, str):
                     ingredients = stmt.strip()
+                nutrients = nutrition_from_api(nutrition[0])
         except Exception:
             pass
 
@@ -258,22 +497,30 @@ def kroger_api_product_search(search_term: str, limit: int = 20):
                 extra_text_parts.extend([x for x in v if isinstance(x, str)])
         extra_text = " ".join(extra_text_parts).strip()
 
-        out.append(
-            {
-                "name": str(desc)[:200],
-                "price": price,
-                "url": web_url,
-                "image": image,
-                "ingredients": ingredients,
-                "_filter_text": f"{desc} {ingredients} {extra_text}".strip(),
-                "store": "Kroger",
-            }
-        )
+        categories = it.get("categories")
+        product = {
+            "productId": str(it.get("productId") or it.get("upc") or ""),
+            "name": str(desc)[:200],
+            "brand": it.get("brand") if isinstance(it.get("brand"), str) else "",
+            "categories": [c for c in categories if isinstance(c, str)] if isinstance(categories, list) else [],
+            "price": price,
+            "size": size,
+            "fulfillment": fulfillment,
+            "url": web_url,
+            "image": image,
+            "ingredients": ingredients,
+            "_filter_text": f"{desc} {ingredients} {extra_text}".strip(),
+            "store": "Kroger",
+        }
+        if nutrients:
+            product["nutrition"] = nutrients
+        # price_cents, promo and unit price alongside the display price
+        out.append(set_price_fields(product, regular, promo, size))
     return out
 
 
 
-def get_mock_products(search_term, limit=20):
+def get_mock_products(search_term, limit=20, start=0):
     """Generate mock products for testing"""
     mock_products = [
         {
@@ -338,1377 +585,1228 @@ def get_mock_products(search_term, limit=20):
     filtered = [p for p in mock_products if search_term.lower() in p['name'].lower() or 
                 search_term.lower() in p.get('ingredients', '').lower()]
     
-    return filtered[:limit] if filtered else mock_products[:limit]
+    return (filtered or mock_products)[start:start + limit]
 
-def create_selenium_driver():
-    """Create a Selenium WebDriver using Firefox/LibreWolf with proper browser emulation"""
-    if not SELENIUM_AVAILABLE:
-        raise Exception("Selenium is not installed. Run: pip install selenium webdriver-manager")
-    
-    firefox_options = FirefoxOptions()
-    # Headless by default; allow opting out for manual CAPTCHA solving/debugging.
-    headless = os.getenv("HEADLESS", "true").lower() in ("1", "true", "yes", "y")
-    if headless:
-        firefox_options.add_argument('--headless')
-        print("Using headless mode")
+
+class KrogerAdapter(StoreAdapter):
+    """Kroger: the Products API when credentials are configured, else scraping kroger.com."""
+
+    name = "kroger"
+    display_name = "Kroger"
+    capabilities = frozenset({stores.SEARCH, stores.DETAILS, stores.LOCATIONS, stores.INGREDIENTS, stores.PAGES})
+    timeout_s = float(os.getenv("KROGER_TIMEOUT_S", "25"))
+
+    def search(self, term, limit=20, location_id=None, start=0):
+        # Prefer official APIs when configured; fall back to Selenium scraping otherwise.
+        if os.getenv("KROGER_CLIENT_ID") and os.getenv("KROGER_CLIENT_SECRET"):
+            return kroger_api_product_search(term, limit, location_id=location_id, start=start)
+        if start and not USE_MOCK_DATA:
+            return []  # the scraper only reads the first results page
+        with metrics.stage("scrape"), tracing.span("kroger.scrape"):
+            return get_mock_products(term, limit, start) if USE_MOCK_DATA else scraper().scrape_kroger_product(term, limit)
+
+    def default_location_id(self):
+        return os.getenv("KROGER_LOCATION_ID", "").strip()
+
+    def details(self, product_ids, location_id=None):
+        if not (os.getenv("KROGER_CLIENT_ID") and os.getenv("KROGER_CLIENT_SECRET")):
+            return {}
+        return kroger_api_products_by_id(product_ids, location_id)
+
+
+class HebAdapter(StoreAdapter):
+    """H-E-B: heb.com search pages through Selenium (there is no public API), so slow and rate-limited."""
+
+    name = "heb"
+    display_name = "H-E-B"
+    rate_limit_per_minute = float(os.getenv("HEB_RATE_PER_MINUTE", "6"))
+    timeout_s = float(os.getenv("HEB_TIMEOUT_S", "25"))
+
+    def enabled(self):
+        return HEB_ENABLED and (SELENIUM_AVAILABLE or USE_MOCK_DATA)
+
+    def search(self, term, limit=20, location_id=None, start=0):
+        if USE_MOCK_DATA:
+            return get_mock_products(term, limit, start)
+        self.acquire()
+        with metrics.stage("scrape"), tracing.span("heb.scrape"):
+            return scraper().scrape_heb_product(term, limit)
+
+
+store_registry = StoreRegistry()
+store_registry.register(KrogerAdapter())
+store_registry.register(HebAdapter())
+
+
+def _search_adapters(store):
+    """Adapters a search for `store` ("all" = every enabled one); ValueError for an unknown or disabled store."""
+    if store == 'all':
+        adapters = store_registry.enabled()
     else:
-        print("Using visible browser mode (HEADLESS=false)")
+        adapter = store_registry.get(store)
+        adapters = [adapter] if adapter is not None and adapter.enabled() else []
+    if not adapters:
+        supported = ', '.join([a.name for a in store_registry.enabled()] + ['all'])
+        raise ValueError(f'Unknown store: {store}. Supported stores: {supported}')
+    return adapters
+
+@app.route('/api/health', methods=['GET'])
+def health():
+    return jsonify({'status': 'healthy'})
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Prometheus scrape endpoint (per-process metrics)"""
+    return Response(metrics.REGISTRY.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+def _record_search_latency(view):
+    """Observe /api/search latency, labelled by store and outcome (cache_hit/ok/HTTP status)."""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        outcome = "exception"
+        try:
+            with tracing.trace("api.search") as root:
+                rv = view(*args, **kwargs)
+                status = rv[1] if isinstance(rv, tuple) else 200
+                outcome = g.get("search_outcome", "ok") if status < 400 else str(status)
+                root.set(store=g.get("search_store", "unknown"), outcome=outcome)
+            return rv
+        finally:
+            metrics.SEARCH_REQUEST_SECONDS.observe(
+                time.perf_counter() - start,
+                store=g.get("search_store", "unknown"),
+                outcome=outcome,
+            )
+    return wrapper
+
+
+@app.route('/api/search', methods=['POST'])
+@_record_search_latency
+def search_products():
+    """Search for products and filter based on user criteria"""
+    data = request.json
+    if data.get('cursor'):
+        # Next page of an earlier search: everything but the view options comes from the cursor.
+        return _search_next_page(data)
+    raw_term = data.get('query', '')
+    user_id = data.get('user_id', 'default')
+    store = data.get('store', 'kroger').lower()  # Default to kroger
+    g.search_store = store if store == 'all' or store_registry.get(store) else 'other'
+    
+    # "Milk", "milk " and "MILK" are one search: cache and single-flight keys use the canonical form,
+    # upstream gets the query as typed (of whichever request fetches first)
+    search_term = canonicalize_query(raw_term)
+    query = query_text(raw_term)
+    if not search_term:
+        return jsonify({'error': 'Search term required'}), 400
+    try:
+        adapters = _search_adapters(store)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    raw_keys, canonical_keys = query_cardinality.observe(f"{store}_{raw_term}", f"{store}_{search_term}")
+    metrics.QUERY_KEYS.set(raw_keys, kind="raw")
+    metrics.QUERY_KEYS.set(canonical_keys, kind="canonical")
     
-    # Stealth options to avoid detection
-    firefox_options.set_preference("dom.webdriver.enabled", False)
-    firefox_options.set_preference("useAutomationExtension", False)
+    # Get user's filters; the filter set (and its compiled matcher) is shared by everyone with the same terms
+    filter_set = filter_store.filter_set(user_id)
+    filters = filter_set.compiled
+    include_hidden = bool(data.get('include_hidden'))
+    try:
+        fields = _requested_fields(data)
+        sort, max_price = _requested_order(data)
+        page_size = _requested_page_size(data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    page = (0, 0, page_size) if page_size else None
     
-    # Realistic user agent (use a more common one)
-    firefox_options.set_preference("general.useragent.override", 
-        "Mozilla/5.0 (X11; Linux x86_64; rv:121.0) Gecko/20100101 Firefox/121.0")
+    locations = _requested_locations(data)
+    has_locations = any(a.supports(stores.LOCATIONS) for a in adapters)
+    if len(locations) > MAX_SEARCH_LOCATIONS:
+        return jsonify({'error': f'At most {MAX_SEARCH_LOCATIONS} locations per search'}), 400
+    if locations and not has_locations:
+        return jsonify({'error': f'{store} has no store locations to search'}), 400
+    if locations and not _location_search_available():
+        return jsonify({'error': 'Location search requires Kroger API credentials and USE_MOCK_DATA off'}), 400
+    if not locations and has_locations and _location_search_available():
+        # No explicit store: nearest to a zip/lat+lon in the request, else the user's saved store.
+        # (Without the API, mock data or the scraper searches the default location as before.)
+        try:
+            locations = _default_locations(data, user_id)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
     
-    # Accept language
-    firefox_options.set_preference("intl.accept_languages", "en-US,en")
+    # Check cache (include store + locations + filter set in cache key, so identical filter sets share entries)
+    results_key = f"{store}@{','.join(locations)}_{search_term}" if locations else f"{store}_{search_term}"
+    cache_key = f"{results_key}_fs{filter_set.fingerprint}"
+    with metrics.stage("cache_lookup"), tracing.span("cache.lookup") as sp:
+        cached, results = _cached_search(cache_key, results_key)
+        sp.set(hit=cached is not None, refilter=results is not None)
+    cache_result = "hit" if cached is not None else "refilter" if results is not None else "miss"
+    metrics.CACHE_REQUESTS.inc(store=g.search_store, result=cache_result)
+    if cached is not None:
+        g.search_outcome = "cache_hit"
+        with metrics.stage("serialize"), tracing.span("serialize"):
+            # Backward-compat: older cache entries may be just a list of products.
+            if isinstance(cached, list):
+                return jsonify({
+                    'products': cached,
+                    'total_found': len(cached),
+                    'filtered_count': len(cached),
+                    'store': store
+                })
+            if cached.get('total_found'):
+                suggest_index.add_query(search_term, query)
+            # Bytes encoded when the entry was first served.
+            return _send_search(cache_key, cached, include_hidden, fields, sort, max_price, page)
     
-    # Window size
-    firefox_options.set_preference("browser.window.size", "1920,1080")
+    if results is None:
+        try:
+            if store == 'all':
+                fetch = lambda: _fetch_all_stores_results(adapters, search_term, locations, query)  # noqa: E731
+            elif locations:
+                fetch = lambda: _fetch_location_results(store, search_term, locations, query=query)  # noqa: E731
+            else:
+                fetch = lambda: _fetch_search_results(store, search_term, query=query)  # noqa: E731
+            results, shared = _search_flights.do(results_key, fetch)
+        except stores.RateLimited as e:
+            return jsonify({'error': str(e), 'products': []}), 429
+        except TimeoutError:
+            return jsonify({
+                'error': 'Search timed out. Please try again with a different search term.',
+                'products': []
+            }), 408
+        except Exception as e:
+            log.exception(f"Search error: {e}")
+            return jsonify({
+                'error': f'Search failed: {str(e)}',
+                'products': []
+            }), 500
+        if shared:
+            # Another request for the same query fetched these while we waited.
+            g.search_outcome = "coalesced"
+    else:
+        g.search_outcome = "refilter"
     
-    # Additional stealth preferences
-    firefox_options.set_preference("privacy.trackingprotection.enabled", False)
-    firefox_options.set_preference("media.navigator.permission.disabled", True)
-    firefox_options.set_preference("dom.push.enabled", False)
+    # Filter products based on ingredients/text
+    # NOTE: Do NOT fetch product pages during search; it's slow and often blocked.
+    with metrics.stage("filter"), tracing.span("filter", products=len(results), filters=len(filters)) as sp:
+        # Only terms this result set hasn't been checked for are scanned; the rest come from the index.
+        entry = _cache_search(cache_key, results_key, results, filters, store, search_term)
+        for _, terms in entry['hidden']:
+            for term in terms:
+                metrics.FILTER_MATCHES.inc(term=normalize_text(term))
+        sp.set(kept=entry['filtered_count'], indexed_terms=len(results.postings))
+    metrics.PRODUCTS_SEEN.inc(entry['filtered_count'], store=g.search_store, stage="kept")
+    if len(results):
+        suggest_index.add_query(search_term, query)
     
-    # Try to find Firefox or LibreWolf binary
-    firefox_binary_paths = [
-        '/usr/bin/firefox',
-        '/usr/bin/librewolf',
-        '/usr/local/bin/firefox',
-        '/usr/local/bin/librewolf',
-        os.path.expanduser('~/.local/bin/firefox'),
-        os.path.expanduser('~/.local/bin/librewolf'),
-    ]
+    with metrics.stage("serialize"), tracing.span("serialize"):
+        return _send_search(cache_key, entry, include_hidden, fields, sort, max_price, page)
+
+
+@app.route('/api/search', methods=['GET'])
+@_record_search_latency
+def search_page():
+    """Next page of a search by cursor; a GET, so a repeat with the page's ETag in If-None-Match gets a 304"""
+    args = request.args
+    if not args.get('cursor'):
+        return jsonify({'error': 'cursor required (new searches are POSTed)'}), 400
+    return _search_next_page({
+        'cursor': args['cursor'],
+        'page_size': args.get('page_size'),
+        'fields': args.get('fields'),
+        'compact': args.get('compact', '').lower() in ('1', 'true'),
+        'include_hidden': args.get('include_hidden', '').lower() in ('1', 'true'),
+    })
+
+
+def _cache_search(cache_key, results_key, results, filters, store, search_term):
+    """Filter unfiltered results for one filter set and cache the response entry until the results expire."""
+    filtered_products, hidden = results.evaluate(filters)
+    entry = {
+        'products': filtered_products,
+        'total_found': len(results),
+        'filtered_count': len(filtered_products),
+        'store': store,
+        'query': search_term,
+        'source': results.source,
+        **results.meta,
+        'hidden': hidden,
+        # (not sent) what the entry was built from, so a cursor can take it deeper
+        '_results_key': results_key,
+        '_generation': results.generation,
+        '_filters': filters,
+        '_views': {},
+        '_orders': {},
+    }
+    # (Expires with the results it was filtered from.)
+    product_cache.set(cache_key, entry, results_cache.expiry(results_key) or datetime.now() + timedelta(minutes=1))
+    return entry
+
+
+def _cached_search(cache_key, results_key):
+    """(filtered response entry, unfiltered IndexedResults) still fresh in the caches, or None."""
+    entry = product_cache.get(cache_key)
+    if entry is not None:
+        return entry, None
+    return None, results_cache.get(results_key)
+
+
+def _fetch_search_results(store, search_term, limit=UPSTREAM_PAGE_SIZE, query=None):
+    """
+    Fetch unfiltered products (local index or upstream) and cache them (run once per single-flight key).
+
+    `search_term` is the canonical query (cache key, local index); `query` is sent upstream (default: the same).
+    """
+    query = query or search_term
+    min_local = int(os.getenv("LOCAL_SEARCH_MIN_RESULTS", "20"))
+    max_age_s = float(os.getenv("LOCAL_SEARCH_MAX_AGE_HOURS", "6")) * 3600
+    ttl = timedelta(minutes=5)
+    products = None
+    source = store
+    if min_local > 0:
+        with metrics.stage("local_search"), tracing.span("local_search", query=search_term) as sp:
+            local = local_index.search(store, search_term, limit=limit, max_age_s=max_age_s)
+            sp.set(results=len(local))
+        if len(local) >= min(min_local, limit):
+            # Enough fresh local matches: answer without calling upstream.
+            metrics.LOCAL_SEARCHES.inc(result="served")
+            products, source = local, "local"
     
-    firefox_binary = None
-    for path in firefox_binary_paths:
-        if os.path.exists(path):
-            firefox_binary = path
-            print(f"Found Firefox/LibreWolf at: {path}")
-            break
+    if products is None:
+        try:
+            products = store_registry.get(store).search(query, limit)
+        except Exception as e:
+            # Upstream down: serve whatever the local index has, however old, rather than an error.
+            products = local_index.search(store, search_term, limit=limit)
+            if not products:
+                raise
+            log.warning(f"Upstream search failed ({e}); serving {len(products)} locally indexed products")
+            metrics.LOCAL_SEARCHES.inc(result="stale_fallback")
+            source = "local_stale"
+            ttl = timedelta(minutes=1)  # retry upstream soon
+        else:
+            metrics.PRODUCTS_SEEN.inc(len(products), store=store, stage="upstream")
+    _ingest_products(store, products, upstream=source == store)
     
-    if firefox_binary:
-        firefox_options.binary_location = firefox_binary
+    # Uses a combined text field so we can filter even when ingredientStatement is missing;
+    # the index strips it from the products before they are returned to clients.
+    results = IndexedResults(products, source)
+    results_key = f"{store}_{search_term}"
+    results_cache.set(results_key, results, datetime.now() + ttl)
+    if source == "local":
+        # Nothing fetched upstream yet: its first page (minus what we have) is what comes next.
+        _set_next_page(results_key, _upstream_page(store, query, 0, limit))
+    elif source == store and len(products) >= limit:
+        _set_next_page(results_key, _upstream_page(store, query, len(products), limit))
+    else:
+        _set_next_page(results_key, None)
+    return results
+
+
+def _ingest_products(store, products, upstream=True):
+    """Prices, enrichment, local index, price history and suggestions for one store's search results."""
+    for p in products:
+        if 'price_cents' not in p:
+            # Scraped pages and older index entries only have the display price.
+            set_price_fields(p)
     
-    # webdriver-manager sometimes shells out to `firefox` to detect versions; on systems with
-    # LibreWolf but no `firefox` binary, that spams `/bin/sh: 1: firefox: not found` and can
-    # contribute to flakiness. Selenium 4+ can manage drivers automatically; prefer that path.
+    # Ingredients found by background enrichment are filled in (before indexing, so the index keeps them);
+    # products still without any are flagged unverified and queued.
+    with metrics.stage("enrichment"), tracing.span("enrichment.apply", products=len(products)):
+        _apply_enrichment(store, products)
+    if upstream:
+        with metrics.stage("local_index"), tracing.span("local_index.add", products=len(products)):
+            local_index.add(store, products)
+        _record_prices(store, store_registry.get(store).default_location_id(), products)
+    _annotate_lowest_prices(store, products)
+    suggest_index.add_products(p.get('name', '') for p in products)
+
+
+def _upstream_page(store, query, start, limit):
+    """(store, query, start, limit) of an upstream results page to fetch later, or None if the store can't page there."""
+    if start >= SEARCH_MAX_DEPTH or not store_registry.get(store).supports(stores.PAGES):
+        return None
+    return (store, query, start, limit)
+
+
+def _set_next_page(results_key, page):
+    """Remember the upstream page a cached search continues with (None: there is none) until its results expire."""
+    expires = results_cache.expiry(results_key)
+    if page is None or expires is None:
+        upstream_next.pop(results_key)
+    else:
+        upstream_next.set(results_key, page, expires)
+
+
+def _fetch_next_page(results_key):
+    """Append the next upstream page to a cached single-store search (run once per single-flight key)."""
+    results, pending = results_cache.get(results_key), upstream_next.get(results_key)
+    if results is None or pending is None:
+        return results
+    store, query, start, limit = pending
+    with metrics.stage("upstream_page"), tracing.span("search.next_page", store=store, start=start):
+        products = store_registry.get(store).search(query, limit, start=start)
+    metrics.PRODUCTS_SEEN.inc(len(products), store=store, stage="upstream")
+    # Pages can overlap (upstream reordering, or a first page served from the local index).
+    seen = {product_key(p) for p in results.products}
+    fresh = [p for p in products if product_key(p) not in seen]
+    _ingest_products(store, fresh)
+    more = results.extend(IndexedResults(fresh, results.source))
+    if results_cache.get(results_key) is results and results_cache.replace(results_key, more):
+        # (unless a refetch replaced the results meanwhile)
+        _set_next_page(
+            results_key, _upstream_page(store, query, start + len(products), limit) if len(products) >= limit else None
+        )
+    return more
+
+
+def _more_results(results_key):
+    """A cached search's unfiltered results with the next upstream page appended (joining a prefetch in flight)."""
+    results, _ = _search_flights.do(f"more:{results_key}", lambda: _fetch_next_page(results_key))
+    return results
+
+
+def _prefetch_next_page(results_key):
     try:
-        driver = webdriver.Firefox(options=firefox_options)
-        
-        # Execute script to hide webdriver property
-        driver.execute_script("""
-            Object.defineProperty(navigator, 'webdriver', {
-                get: () => undefined
-            });
-        """)
-        
-        return driver
+        _more_results(results_key)
     except Exception as e:
-        error_msg = f"Failed to create Firefox driver: {e}."
-        if not firefox_binary:
-            error_msg += " Firefox/LibreWolf not found. Install with: sudo apt install firefox (or download LibreWolf)"
+        log.warning(f"Prefetching the next page of {results_key} failed ({e})")
+
+
+def _apply_enrichment(store, products):
+    """Fill in enriched ingredients (or another store's for the same item); flag and queue products still without."""
+    missing = []
+    for p in products:
+        p.pop('unverified', None)
+        ident = product_identities.identify(store, product_key(p), p)
+        if p.get('ingredients'):
+            product_identities.set_ingredients(ident, p['ingredients'])
         else:
-            error_msg += " Make sure geckodriver is installed."
-        raise Exception(error_msg)
+            missing.append((p, ident))
+    if not missing:
+        return
+    known = local_index.enrichments(store, [product_key(p) for p, _ in missing], empty_max_age_s=ENRICH_EMPTY_RETRY_S)
+    for p, ident in missing:
+        key = product_key(p)
+        ingredients = known.get(key) or product_identities.ingredients(ident)
+        if ingredients:
+            p['ingredients'] = ingredients
+            p['_filter_text'] = f"{p.get('_filter_text', '')} {ingredients}".strip()
+            continue
+        p['unverified'] = True
+        if ENRICH_INGREDIENTS and key not in known and p.get('url'):
+            # One page fetch per identity, whichever store's listing asks first.
+            enrichment_queue.submit(ident, (store, key, p['url'], ident))
+    metrics.ENRICHMENT_BACKLOG.set(enrichment_queue.backlog())
 
 
-def _looks_like_product_url(store: str, url: str) -> bool:
-    """Heuristic guardrail to avoid non-product links (cart, cookie consent, terms, etc.)."""
-    if not url:
-        return False
-    u = url.lower()
-    # Common non-product pages that frequently appear in search DOMs
-    if any(x in u for x in ["/cart", "/account", "/signin", "/login", "/terms", "/privacy", "onetrust.com"]):
-        return False
-    if store == "kroger":
-        # Kroger product detail pages are commonly /p/<name>/<id> but we also see
-        # search-result links under /products/... depending on site experiments.
-        return (("/p/" in u) or ("/products/" in u)) and ("kroger.com" in u or u.startswith("/"))
-    return True
-
-def scrape_heb_product_selenium(search_term, limit=20):
-    """Scrape HEB using Selenium with browser emulation"""
-    import time
-    
-    driver = None
-    start_time = time.time()
-    max_total_time = 25  # Maximum 25 seconds total
-    
-    def check_timeout():
-        if time.time() - start_time > max_total_time:
-            raise TimeoutError("Scraping operation timed out")
-    
+def _enrich_ingredients(store, key, url, ident=None):
+    """Background worker: fetch one product page and store its ingredients ('' if it lists none) for every listing."""
+    details = scraper().get_product_details(url)
+    if details is None:
+        raise Exception(f"Could not load product page {url}")
+    ingredients = details.get('ingredients', '')
+    listings = product_identities.listings(ident) if ident is not None else []
+    for listing_store, listing_key in listings or [(store, key)]:
+        local_index.set_enrichment(listing_store, listing_key, ingredients)
+    if ident is not None:
+        product_identities.set_ingredients(ident, ingredients)
+    return "enriched" if ingredients else "none"
+
+
+def _record_prices(store, location_id, products):
+    """Queue today's price of each product at a location for the price history (no I/O here)."""
+    queued = price_history.record(store, location_id, (
+        (product_key(p), p.get('price_cents'), p.get('promo_cents')) for p in products
+    ))
+    metrics.PRICE_OBSERVATIONS.inc(queued, result="queued")
+
+
+def _annotate_lowest_prices(store, products):
+    """Set lowest_recent_price (any location, promos included, now included) where there is earlier history."""
+    if not products:
+        return
+    with tracing.span("price_history.lowest", products=len(products)):
+        lowest = price_history.lowest(store, [product_key(p) for p in products], days=PRICE_LOWEST_DAYS)
+    for p in products:
+        earlier = lowest.get(product_key(p))
+        if earlier is None:
+            p.pop('lowest_recent_price', None)
+            continue
+        current = effective_cents(p)
+        p['lowest_recent_price'] = format_cents(min(earlier, current) if current else earlier)
+
+
+def _requested_locations(data):
+    """Location IDs asked for (location_ids list / comma string, or location_id); [] means the default."""
+    ids = data.get('location_ids') or data.get('location_id') or []
+    if isinstance(ids, str):
+        ids = ids.split(',')
+    ids = [str(i).strip() for i in ids if str(i).strip()]
+    return list(dict.fromkeys(ids))
+
+
+def _location_query(params):
+    """(zip, lat, lon) from request args/body; ValueError unless a ZIP or a valid lat + lon is given."""
+    zip_code = str(params.get('zip') or '').strip()
+    if zip_code:
+        if not re.fullmatch(r'\d{5}(-\d{4})?', zip_code):
+            raise ValueError('zip must be a 5-digit ZIP code')
+        return zip_code[:5], None, None
+    if params.get('lat') in (None, '') or params.get('lon') in (None, ''):
+        raise ValueError('zip or lat and lon required')
     try:
-        driver = create_selenium_driver()
-        # Set page load timeout
-        driver.set_page_load_timeout(12)
-        driver.implicitly_wait(2)  # Reduce implicit wait
-        
-        search_url = f"https://www.heb.com/search/?q={search_term.replace(' ', '+')}"
-        
-        print(f"Loading HEB search page: {search_url}")
+        lat, lon = float(params.get('lat')), float(params.get('lon'))
+    except (TypeError, ValueError):
+        raise ValueError('lat and lon must be numbers')
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        raise ValueError('lat/lon out of range')
+    return None, lat, lon
+
+
+def _nearest_locations(zip_code=None, lat=None, lon=None, limit=5):
+    """[(distance_miles, location)] closest first, from the in-memory index (upstream only for a new area)."""
+    def lookup():
+        point = location_index.zip_point(zip_code) if zip_code else (lat, lon)
+        if point is None:
+            return []
+        return location_index.nearest(point[0], point[1], limit, max_miles=LOCATIONS_RADIUS_MILES)
+
+    found = lookup()
+    area = f"zip:{zip_code}" if zip_code else f"point:{round(lat * 2) / 2},{round(lon * 2) / 2}"
+    # Stores already indexed may come from another area's fetch (or a ZIP's 3-digit prefix) and be
+    # far from a closer one that isn't indexed yet: an area is fetched once, whatever was found.
+    if area in _location_areas_fetched or os.getenv("KROGER_LOCATIONS_FILE"):
+        return found
+    if not (os.getenv("KROGER_CLIENT_ID") and os.getenv("KROGER_CLIENT_SECRET")):
+        return found
+
+    def fetch():
+        # First lookup in this area: load its stores once, then answer from the index.
+        stores = kroger_api_locations_near(zip_code, lat, lon, radius_miles=LOCATIONS_RADIUS_MILES)
+        location_index.add(stores)
+        if zip_code and stores and location_index.zip_point(zip_code, exact=True) is None:
+            # The API returns stores nearest first; the closest one stands in for the ZIP's position.
+            location_index.set_zip_point(zip_code, stores[0]["lat"], stores[0]["lon"])
+        _location_areas_fetched.add(area)
+        return len(stores)
+
+    with tracing.span("locations.fetch_area", area=area):
+        _location_area_flights.do(area, fetch)
+    return lookup()
+
+
+def _location_search_available():
+    """True if searches can go to specific store locations (Kroger API credentials, not mock data)."""
+    return bool(os.getenv("KROGER_CLIENT_ID") and os.getenv("KROGER_CLIENT_SECRET")) and not USE_MOCK_DATA
+
+
+def _default_locations(data, user_id):
+    """Store for a search without location_ids: nearest to zip/lat+lon, else the saved one (not saved here)."""
+    if data.get('zip') or data.get('lat') not in (None, ''):
+        zip_code, lat, lon = _location_query(data)
         try:
-            driver.get(search_url)
+            nearest = _nearest_locations(zip_code, lat, lon, limit=1)
         except Exception as e:
-            print(f"Page load timeout or error: {e}")
-            # Continue anyway - page might have partially loaded
-        
-        check_timeout()
-        
-        # Wait for page to load and bypass Incapsula challenge
-        # Incapsula may need more time to verify
-        time.sleep(3)  # Increased wait for Incapsula challenge
-        
-        # Check if we're blocked by Incapsula
-        page_source_check = driver.page_source
-        if 'Incapsula' in page_source_check[:1000]:
-            print("Detected Incapsula challenge, waiting for it to complete...")
-            # Wait longer and try to interact with page
-            time.sleep(5)
-            check_timeout()
-            
-            # Try scrolling to trigger any lazy loading or verification
-            try:
-                driver.execute_script("window.scrollTo(0, 100);")
-                time.sleep(1)
-                driver.execute_script("window.scrollTo(0, 0);")
-                time.sleep(2)
-            except:
-                pass
-        
-        check_timeout()
-        
-        # Try to wait for product elements with multiple strategies
-        products = []
-        max_wait = 15
-        
-        # Skip element waiting - go straight to page source parsing (faster)
-        print("Parsing page source directly (faster approach)...")
-        product_elements = []  # Skip element-based extraction for speed
-        
-        # If we only found one element, it might be a container - try to find children
-        if len(product_elements) == 1:
-            print("Only one element found, looking for child product elements...")
-            try:
-                # Try to find child elements that might be individual products
-                child_selectors = [
-                    "article",
-                    "[data-testid*='product']",
-                    "[class*='product']",
-                    "a[href*='/product']",
-                    "a[href*='/p/']",
-                ]
-                for child_selector in child_selectors:
-                    children = product_elements[0].find_elements(By.CSS_SELECTOR, child_selector)
-                    if children and len(children) > 1:
-                        product_elements = children
-                        print(f"Found {len(children)} child product elements")
-                        break
-            except:
-                pass
-        
-        # Parse page source for product links (primary method - faster)
-        check_timeout()
-        
-        # Get page source and check if we're blocked
-        page_source = driver.page_source
-        print(f"Page source length: {len(page_source)} characters")
-        
-        # Check if page loaded properly (not just Incapsula block page)
-        if len(page_source) < 1000 or 'Incapsula' in page_source[:500]:
-            print("Warning: Page may be blocked by Incapsula. Waiting longer and retrying...")
-            # Wait longer for Incapsula challenge to complete
-            time.sleep(5)
-            check_timeout()
-            page_source = driver.page_source
-            print(f"After wait, page source length: {len(page_source)} characters")
-            
-            # Check again
-            if 'Incapsula' in page_source[:1000]:
-                print("ERROR: Still blocked by Incapsula. Page may require manual verification.")
-                # Try scrolling to trigger any lazy loading
-                try:
-                    driver.execute_script("window.scrollTo(0, document.body.scrollHeight/2);")
-                    time.sleep(2)
-                    page_source = driver.page_source
-                except:
-                    pass
-        
-        soup = BeautifulSoup(page_source, 'html.parser')
-        
-        # Look for product links - HEB uses various patterns
-        product_link_patterns = [
-            r'/product/',
-            r'/p/',
-            r'/shop/product',
-            r'/product-detail',
+            log.warning(f"Nearest-store lookup failed ({e}); searching the default location")
+            nearest = []
+        if nearest:
+            return [nearest[0][1]["locationId"]]
+    saved = preferred_locations.get(user_id)
+    return [saved] if saved else []
+
+
+def _known_location(location_id):
+    """The store with this locationId from the index, else the Locations API (then indexed); None if unknown."""
+    location = location_index.get(location_id)
+    if location is None and os.getenv("KROGER_CLIENT_ID") and os.getenv("KROGER_CLIENT_SECRET"):
+        with tracing.span("locations.fetch_one", location=location_id):
+            location = kroger_api_location(location_id)
+        if location is not None:
+            location_index.add([location])
+    return location
+
+
+def _intern_product(product):
+    """The shared (location-independent) fields of a product, one object per productId."""
+    shared = {k: v for k, v in product.items() if k not in LOCATION_FIELDS}
+    key = product_key(product)
+    existing = _product_catalog.get(key)
+    if existing == shared:
+        _product_catalog.move_to_end(key)
+        return existing
+    _product_catalog[key] = shared
+    if len(_product_catalog) > _PRODUCT_CATALOG_MAX:
+        _product_catalog.popitem(last=False)
+    return shared
+
+
+def _fetch_location_offers(store, search_term, location_id, limit, query=None):
+    """[(shared product, offer)] for one location, from the per-location cache or upstream."""
+    # (Distinct from the merged results key, which is also the single-flight key of our caller.)
+    key = f"offers:{store}@{location_id}_{search_term}"
+    offers = location_cache.get(key)
+    if offers is not None:
+        return offers
+
+    def fetch():
+        with tracing.span("kroger.location_search", location=location_id):
+            products = kroger_api_product_search(query or search_term, limit, location_id=location_id)
+        metrics.PRODUCTS_SEEN.inc(len(products), store=store, stage="upstream")
+        _apply_enrichment(store, products)
+        local_index.add(store, products)
+        _record_prices(store, location_id, products)
+        offers = [
+            (_intern_product(p), {"locationId": location_id, **{f: p[f] for f in LOCATION_FIELDS if f in p}})
+            for p in products
         ]
-        
-        all_product_links = []
-        for pattern in product_link_patterns:
-            links = soup.find_all('a', href=re.compile(pattern, re.I))
-            all_product_links.extend(links)
-        
-        # Remove duplicates based on href
-        seen_urls = set()
-        unique_links = []
-        for link in all_product_links:
-            href = link.get('href', '')
-            if href and href not in seen_urls:
-                seen_urls.add(href)
-                unique_links.append(link)
-        
-        print(f"Found {len(unique_links)} unique product links in page source")
-        
-        # If no links found and page seems blocked, try alternative extraction
-        if len(unique_links) == 0:
-            print("No product links found. Trying alternative extraction methods...")
-            # Try to find any links that might be products
-            all_links = soup.find_all('a', href=True)
-            print(f"Total links on page: {len(all_links)}")
-            
-            # Look for links with product-like characteristics
-            for link in all_links[:100]:
-                href = link.get('href', '')
-                link_text = link.get_text(strip=True)
-                
-                # Skip obvious non-product links
-                if any(skip in href.lower() for skip in ['/cart', '/account', '/help', '/store', '/deals', '/recipes', '/categories']):
-                    continue
-                
-                # Look for links that might be products
-                if href and len(href) > 5 and len(link_text) > 5 and len(link_text) < 200:
-                    # Check if it's not just navigation text
-                    if not any(nav in link_text.lower() for nav in ['shop', 'cart', 'account', 'help', 'menu', 'search', 'browse']):
-                        unique_links.append(link)
-                        if len(unique_links) >= limit:
-                            break
-            
-            print(f"Found {len(unique_links)} potential product links via alternative method")
-        
-        # Extract products from links (with timeout checks)
-        for link in unique_links[:limit*2]:
-            check_timeout()  # Check timeout periodically
+        location_cache.set(key, offers, datetime.now() + timedelta(minutes=5))
+        return offers
+
+    offers, _ = _search_flights.do(key, fetch)
+    return offers
+
+
+def _fetch_location_results(store, search_term, locations, limit=20, timeout=25, query=None):
+    """Search several store locations concurrently and merge their products by productId."""
+    if not _location_search_available():
+        raise Exception("Location search requires Kroger API credentials (KROGER_CLIENT_ID / KROGER_CLIENT_SECRET).")
+    with metrics.stage("location_fanout"), tracing.span("kroger.location_fanout", locations=len(locations)):
+        # Each worker runs in a copy of this context so its spans land in the request trace.
+        futures = {
+            _location_pool.submit(contextvars.copy_context().run, _fetch_location_offers,
+                                  store, search_term, loc, limit, query): loc
+            for loc in locations
+        }
+        done, _ = wait_futures(futures, timeout=timeout)
+    per_location = {}
+    failed = {}
+    first_error = None
+    for future, loc in futures.items():
+        if future not in done:
+            failed[loc] = "timeout"
+        elif future.exception() is not None:
+            failed[loc] = str(future.exception())[:200]
+            first_error = first_error or future.exception()
+        else:
+            per_location[loc] = future.result()
+    if not per_location:
+        raise first_error or TimeoutError("All location searches timed out")
+    if failed:
+        log.warning(f"Location search failed for {sorted(failed)}: {failed}")
+
+    # Merge in request order: a product keeps its first position, and its price is that of the
+    # first requested location carrying it; every location's offer is listed under "locations".
+    merged = {}
+    for loc in locations:
+        for shared, offer in per_location.get(loc, ()):
+            key = product_key(shared)
+            product = merged.get(key)
+            if product is None:
+                product = merged[key] = dict(shared, locations=[])
+                for f in LOCATION_FIELDS:
+                    if f in offer:
+                        product[f] = offer[f]
+            product["locations"].append(offer)
+    products = list(merged.values())
+    _annotate_lowest_prices(store, products)
+    suggest_index.add_products(p.get('name', '') for p in products)
+    results = IndexedResults(products, store, meta={
+        'locations': locations,
+        'failed_locations': sorted(failed),
+    })
+    results_key = f"{store}@{','.join(locations)}_{search_term}"
+    # Partial results are retried sooner.
+    results_cache.set(results_key, results, datetime.now() + timedelta(minutes=1 if failed else 5))
+    return results
+
+
+def _store_results(adapter, search_term, locations, query=None):
+    """One store's unfiltered results for a multi-store search: cached, or fetched (single-flight per store)."""
+    if locations and adapter.supports(stores.LOCATIONS):
+        key = f"{adapter.name}@{','.join(locations)}_{search_term}"
+        fetch = lambda: _fetch_location_results(adapter.name, search_term, locations, query=query)  # noqa: E731
+    else:
+        key = f"{adapter.name}_{search_term}"
+        fetch = lambda: _fetch_search_results(adapter.name, search_term, query=query)  # noqa: E731
+    results = results_cache.get(key)
+    if results is not None:
+        return results
+    results, _ = _search_flights.do(key, fetch)
+    return results
+
+
+def _fetch_all_stores_results(adapters, search_term, locations, query=None):
+    """Search every adapter concurrently under one deadline and concatenate their results (store=all)."""
+    start = time.monotonic()
+    with metrics.stage("store_fanout"), tracing.span("stores.fanout", stores=len(adapters)):
+        futures = {
+            adapter: _store_pool.submit(contextvars.copy_context().run, _store_results, adapter, search_term, locations,
+                                        query)
+            for adapter in adapters
+        }
+        # Each store gets until its own timeout, capped by the shared deadline. Stragglers keep
+        # running and land in their store's cache, so the next store=all search has them.
+        for adapter in sorted(adapters, key=lambda a: a.timeout_s):
+            remaining = start + min(adapter.timeout_s, STORE_FANOUT_TIMEOUT_S) - time.monotonic()
+            wait_futures([futures[adapter]], timeout=max(remaining, 0))
+    parts, sources, failed = [], {}, {}
+    first_error = None
+    for adapter in adapters:
+        future = futures[adapter]
+        if not future.done():
+            failed[adapter.name] = "timeout"
+        elif future.exception() is not None:
+            failed[adapter.name] = str(future.exception())[:200]
+            first_error = first_error or future.exception()
+        else:
+            parts.append((adapter, future.result()))
+            sources[adapter.name] = future.result().source
+    if not parts:
+        raise first_error or TimeoutError("All store searches timed out")
+    if failed:
+        log.warning(f"Store search failed for {sorted(failed)}: {failed}")
+
+    # The same item from several stores becomes one product listing each store's offer.
+    identities = {
+        id(p): product_identities.identify(adapter.name, product_key(p), p)
+        for adapter, part in parts for p in part.products
+    }
+    results = IndexedResults.concat([part for _, part in parts], "all", meta={
+        'stores': list(sources),
+        'store_sources': sources,
+        'failed_stores': sorted(failed),
+        **({'locations': locations} if locations else {}),
+    }, group_key=lambda p: identities[id(p)], merge=_merge_listings)
+    results_key = f"all@{','.join(locations)}_{search_term}" if locations else f"all_{search_term}"
+    # Partial results are retried sooner.
+    results_cache.set(results_key, results, datetime.now() + timedelta(minutes=1 if failed else 5))
+    return results
+
+
+def _merge_listings(listings):
+    """One product for the same item listed by several stores: the first listing plus every store's offer."""
+    product = dict(listings[0], offers=[
+        {k: p[k] for k in ('store', 'productId', 'price', 'price_cents', 'promo_price', 'promo_cents', 'unit_price', 'url')
+         if p.get(k) not in (None, '')}
+        for p in listings
+    ])
+    ingredients = next((p['ingredients'] for p in listings if p.get('ingredients')), '')
+    if ingredients:
+        product['ingredients'] = ingredients
+        product.pop('unverified', None)
+    nutrition = next((p['nutrition'] for p in listings if p.get('nutrition')), None)
+    if nutrition:
+        product['nutrition'] = nutrition
+    return product
+
+
+def _results_cached(store, search_term, location_sets=((),)):
+    """True if unfiltered results for this canonical query are still cached (for any of `location_sets`)."""
+    return any(
+        (f"{store}@{','.join(locations)}_{search_term}" if locations else f"{store}_{search_term}") in results_cache
+        for locations in location_sets
+    )
+
+
+def _suggest_locations(params, user_id):
+    """Store locations a search by this user would use, like _default_locations but from the index only."""
+    locations = _requested_locations(params)
+    if locations or not _location_search_available():
+        return locations
+    if params.get('zip'):
+        try:
+            zip_code, _, _ = _location_query(params)
+        except ValueError:
+            zip_code = None
+        point = location_index.zip_point(zip_code) if zip_code else None
+        nearest = location_index.nearest(point[0], point[1], 1, max_miles=LOCATIONS_RADIUS_MILES) if point else []
+        if nearest:
+            return [nearest[0][1]["locationId"]]
+    saved = preferred_locations.get(user_id)
+    return [saved] if saved else []
+
+
+def _send_search(cache_key, entry, include_hidden, fields=None, sort="relevance", max_price=None, page=None):
+    """
+    A cached search entry (cached under `cache_key`) as a response, encoded once per view (gzip or br).
+
+    `page` = (offset, hidden offset, page_size) sends one page and a cursor for the next.
+    """
+    views = entry['_views']
+    key = (include_hidden, fields, sort, max_price, page)
+    body = views.get(key)
+    if body is None:
+        if len(views) >= MAX_VIEWS_PER_SEARCH:
+            views.clear()  # (many distinct max_price values or pages)
+        products = _ordered_products(entry, sort, max_price)
+        if page is None:
+            payload = _search_response(entry, include_hidden, fields, products)
+        else:
+            offset, hidden_offset, page_size = page
+            hidden = entry.get('hidden', ())[hidden_offset:hidden_offset + page_size] if include_hidden else None
+            payload = _search_response(entry, include_hidden, fields, products[offset:offset + page_size], hidden)
+            payload['page_size'] = page_size
+            payload['next_cursor'] = _next_cursor(cache_key, entry, products, page, hidden, sort, max_price)
+            if sort == 'relevance' and len(products) < offset + 2 * page_size:
+                # The page after the next one runs past what is cached: fetch more upstream now.
+                _prefetch(entry)
+        if sort != "relevance":
+            payload['sort'] = sort
+        if max_price is not None:
+            payload['max_price'] = format_cents(max_price)
+            payload['in_price_range'] = len(products)
+        body = views[key] = responses.EncodedBody(payload)
+    response, encoding = responses.send(body)
+    metrics.SEARCH_RESPONSES.inc(encoding=encoding)
+    return response
+
+
+def _requested_order(data):
+    """(sort, max_price in cents or None) for a search; ValueError for an unknown sort or a bad price."""
+    sort = str(data.get('sort') or 'relevance').lower()
+    if sort not in SORTS:
+        raise ValueError(f"sort must be one of: {', '.join(SORTS)}")
+    if data.get('max_price') in (None, ''):
+        return sort, None
+    max_price = to_cents(data.get('max_price'), strict=True)
+    if max_price is None:
+        raise ValueError('max_price must be a positive price')
+    return sort, max_price
+
+
+def _requested_page_size(data):
+    """page_size of a paged search, or None for every product at once; ValueError unless 1..MAX_PAGE_SIZE."""
+    if data.get('page_size') in (None, ''):
+        return None
+    try:
+        page_size = int(data['page_size'])
+    except (TypeError, ValueError):
+        raise ValueError('page_size must be an integer')
+    if not 1 <= page_size <= MAX_PAGE_SIZE:
+        raise ValueError(f'page_size must be between 1 and {MAX_PAGE_SIZE}')
+    return page_size
+
+
+def _encode_cursor(state):
+    return base64.urlsafe_b64encode(json.dumps(state, separators=(',', ':')).encode()).decode().rstrip('=')
+
+
+def _decode_cursor(cursor):
+    """Cursor state from a client's cursor; ValueError if it isn't one we issued."""
+    try:
+        cursor = str(cursor)
+        state = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        valid = (
+            len(cursor) <= 2048 and isinstance(state, dict) and isinstance(state.get('k'), str)
+            and all(isinstance(state.get(f), int) and state[f] >= 0 for f in ('g', 'o', 'h', 'c'))
+            and isinstance(state.get('n'), int) and 1 <= state['n'] <= MAX_PAGE_SIZE
+            and state.get('s') in SORTS and (state.get('m') is None or isinstance(state['m'], int))
+        )
+    except (ValueError, TypeError):
+        valid = False
+    if not valid:
+        raise ValueError('Invalid cursor')
+    return state
+
+
+def _next_cursor(cache_key, entry, products, page, hidden, sort, max_price):
+    """Cursor for the page after `page` (products in view order, hidden ones sent on it), or None after the last."""
+    offset, hidden_offset, page_size = page
+    next_offset = min(offset + page_size, len(products))
+    next_hidden = hidden_offset + len(hidden) if hidden is not None else hidden_offset
+    more = (
+        next_offset < len(products)
+        or (hidden is not None and next_hidden < len(entry.get('hidden', ())))
+        or (sort == 'relevance' and _has_more_upstream(entry))
+    )
+    if not more:
+        return None
+    # g: results generation (a refetch invalidates offsets); c: list length a sorted view was cut from.
+    return _encode_cursor({'k': cache_key, 'g': entry.get('_generation', 0), 'o': next_offset, 'h': next_hidden,
+                           'n': page_size, 's': sort, 'm': max_price, 'c': entry['filtered_count']})
+
+
+def _has_more_upstream(entry):
+    """Whether a cached single-store search can grow: a page already fetched but not filtered in, or another upstream."""
+    results_key = entry.get('_results_key')
+    results = results_cache.get(results_key)
+    if results is None or results.generation != entry.get('_generation'):
+        return False
+    return len(results) > entry['total_found'] or upstream_next.get(results_key) is not None
+
+
+def _prefetch(entry):
+    """Fetch the next upstream page of a cached search in the background, unless it is fetched already."""
+    results_key = entry.get('_results_key')
+    results = results_cache.get(results_key)
+    if (upstream_next.get(results_key) is not None and results is not None
+            and results.generation == entry.get('_generation') and len(results) == entry['total_found']):
+        _prefetch_pool.submit(contextvars.copy_context().run, _prefetch_next_page, results_key)
+
+
+def _extend_search(cache_key, entry):
+    """Re-filter a cached search over its next upstream page (prefetched, else fetched now); None if there is none."""
+    if not _has_more_upstream(entry):
+        return None
+    results_key = entry['_results_key']
+    results = results_cache.get(results_key)
+    if results is not None and len(results) == entry['total_found']:
+        results = _more_results(results_key)
+    if results is None or results.generation != entry['_generation'] or len(results) == entry['total_found']:
+        return None
+    return _cache_search(cache_key, results_key, results, entry['_filters'], entry['store'], entry['query'])
+
+
+def _search_next_page(data):
+    """The page a cursor points at, cut from the cached search (grown by an upstream page if it runs past the end)."""
+    include_hidden = bool(data.get('include_hidden'))
+    try:
+        fields = _requested_fields(data)
+        cursor = _decode_cursor(data['cursor'])
+        page_size = _requested_page_size(data) or cursor['n']
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    cache_key, sort, max_price = cursor['k'], cursor['s'], cursor['m']
+    entry, _ = _cached_search(cache_key, None)
+    if (not isinstance(entry, dict) or entry.get('_generation') != cursor['g']
+            or (sort != 'relevance' and entry['filtered_count'] != cursor['c'])):
+        # Expired or refetched (offsets would skip or repeat products): the client starts over.
+        return jsonify({'error': 'These results have expired; search again'}), 410
+    g.search_store = entry['store'] if entry['store'] == 'all' or store_registry.get(entry['store']) else 'other'
+    g.search_outcome = "page"
+    if sort == 'relevance':
+        # Upstream pages only add products after the ones already paged through. A few per request at
+        # most; if filters hide nearly everything, the rest come with the next cursor.
+        for _ in range(3):
+            if len(_ordered_products(entry, sort, max_price)) >= cursor['o'] + page_size:
+                break
             try:
-                # Get product URL
-                url = link.get('href', '')
-                if not url:
-                    continue
-                if not url.startswith('http'):
-                    url = 'https://www.heb.com' + url
-                
-                # Find product name - try link text first
-                name = link.get_text(strip=True)
-                
-                # If link text is empty or too short, look in parent/sibling elements
-                if not name or len(name) < 3:
-                    # Walk up the DOM tree to find name
-                    parent = link.parent
-                    for _ in range(3):  # Check up to 3 levels up
-                        if parent:
-                            # Look for headings or spans with product name
-                            name_elem = parent.find(['h1', 'h2', 'h3', 'h4', 'span', 'div'], 
-                                                   class_=re.compile(r'name|title|product', re.I))
-                            if name_elem:
-                                name = name_elem.get_text(strip=True)
-                                if name and len(name) > 3:
-                                    break
-                            # Try any heading
-                            if not name or len(name) < 3:
-                                heading = parent.find(['h1', 'h2', 'h3', 'h4'])
-                                if heading:
-                                    name = heading.get_text(strip=True)
-                                    if name and len(name) > 3:
-                                        break
-                            parent = parent.parent if hasattr(parent, 'parent') else None
-                
-                # Clean up name - take first line, remove extra whitespace
-                if name:
-                    name = ' '.join(name.split()[:20])  # Limit to first 20 words
-                    if len(name) > 200:
-                        name = name[:200] + '...'
-                
-                if not name or len(name) < 3:
-                    continue
-                
-                # Find price - look in the same container as the link
-                price = 'N/A'
-                try:
-                    # Find parent container
-                    container = link.find_parent(['article', 'div', 'li'])
-                    if container:
-                        # Look for price patterns
-                        price_text = container.get_text()
-                        # Match price patterns like $4.99, $1.98, etc.
-                        price_match = re.search(r'\$[\d,]+\.?\d{0,2}', price_text)
-                        if price_match:
-                            price = price_match.group(0)
-                except:
-                    pass
-                
-                # Find image
-                image = ''
-                try:
-                    img = link.find('img')
-                    if not img:
-                        container = link.find_parent(['article', 'div'])
-                        if container:
-                            img = container.find('img')
-                    if img:
-                        image = img.get('src', img.get('data-src', ''))
-                        if image and not image.startswith('http'):
-                            image = 'https://www.heb.com' + image
-                except:
-                    pass
-                
-                product = {
-                    'name': name,
-                    'price': price,
-                    'url': url,
-                    'image': image,
-                    'ingredients': '',
-                    'store': 'HEB'
-                }
-                
-                # Avoid duplicates
-                if not any(p['name'].lower() == product['name'].lower() or 
-                          p['url'] == product['url'] for p in products):
-                    products.append(product)
-                    print(f"Extracted product from link: {name[:60]}...")
-                    
-                if len(products) >= limit:
+                with tracing.span("search.extend"):
+                    extended = _extend_search(cache_key, entry)
+                if extended is None:
                     break
+                entry = extended
             except Exception as e:
-                print(f"Error extracting product from link: {e}")
-                continue
+                log.warning(f"Fetching the next page of {cache_key} failed ({e}); serving what is cached")
+                break
+    with metrics.stage("serialize"), tracing.span("serialize"):
+        return _send_search(cache_key, entry, include_hidden, fields, sort, max_price,
+                            (cursor['o'], cursor['h'], page_size))
+
+
+def _sort_order(entry, sort):
+    """(products of a cached search in `sort` order, their ascending sort keys); products without one go last."""
+    orders = entry.setdefault('_orders', {})
+    order = orders.get(sort)
+    if order is None:
+        products = entry['products']
+        if sort == 'price':
+            key = effective_cents
         else:
-            # Parse found elements
-            print(f"Parsing {len(product_elements)} product elements...")
-            for i, element in enumerate(product_elements[:limit*2]):  # Get more to filter later
-                try:
-                    # Skip if element is too large (likely a container)
-                    try:
-                        element_text = element.text.strip()
-                        if len(element_text) > 1000:  # Too much text = probably a container
-                            print(f"Element {i}: Skipping - too large (container?)")
-                            continue
-                    except:
-                        pass
-                    
-                    # Try to get product name - look for specific HEB patterns
-                    name = None
-                    
-                    # Method 1: Look for links with product URLs
-                    try:
-                        links = element.find_elements(By.CSS_SELECTOR, "a[href*='/product'], a[href*='/p/']")
-                        if links:
-                            link_text = links[0].text.strip()
-                            if link_text and len(link_text) > 3 and len(link_text) < 200:
-                                name = link_text.split('\n')[0].strip()
-                    except:
-                        pass
-                    
-                    # Method 2: Look for headings (h1-h4) which often contain product names
-                    if not name:
-                        try:
-                            for tag in ['h1', 'h2', 'h3', 'h4']:
-                                headings = element.find_elements(By.TAG_NAME, tag)
-                                if headings:
-                                    heading_text = headings[0].text.strip()
-                                    if heading_text and len(heading_text) > 3 and len(heading_text) < 200:
-                                        name = heading_text.split('\n')[0].strip()
-                                        break
-                        except:
-                            pass
-                    
-                    # Method 3: Get element HTML and parse with BeautifulSoup
-                    if not name:
-                        try:
-                            element_html = element.get_attribute('outerHTML')
-                            soup = BeautifulSoup(element_html, 'html.parser')
-                            
-                            # Try to find name in various places
-                            name_selectors = [
-                                soup.find(['h1', 'h2', 'h3', 'h4']),
-                                soup.find('a', href=re.compile(r'/product|/p/', re.I)),
-                                soup.find(['span', 'div'], class_=re.compile(r'name|title|product-name', re.I)),
-                                soup.find('a'),
-                            ]
-                            
-                            for name_elem in name_selectors:
-                                if name_elem:
-                                    name_text = name_elem.get_text(strip=True)
-                                    if name_text and len(name_text) > 3 and len(name_text) < 200:
-                                        name = name_text.split('\n')[0].strip()
-                                        break
-                        except Exception as e:
-                            print(f"Error parsing element HTML: {e}")
-                            continue
-                    
-                    # Method 4: Last resort - use first line of element text
-                    if not name:
-                        try:
-                            element_text = element.text.strip()
-                            if element_text:
-                                first_line = element_text.split('\n')[0].strip()
-                                # Only use if it looks like a product name (not too long, has letters)
-                                if len(first_line) > 3 and len(first_line) < 200 and any(c.isalpha() for c in first_line):
-                                    name = first_line
-                        except:
-                            pass
-                    
-                    # Method 2: Get element HTML and parse with BeautifulSoup
-                    if not name or len(name) < 3:
-                        try:
-                            element_html = element.get_attribute('outerHTML')
-                            soup = BeautifulSoup(element_html, 'html.parser')
-                            
-                            # Try multiple ways to find name
-                            name_selectors = [
-                                soup.find(['h1', 'h2', 'h3', 'h4'], class_=re.compile(r'name|title|product-name', re.I)),
-                                soup.find('a', class_=re.compile(r'name|title', re.I)),
-                                soup.find(['span', 'div'], class_=re.compile(r'name|title|product-name', re.I)),
-                                soup.find(['h1', 'h2', 'h3', 'h4']),
-                                soup.find('a'),
-                            ]
-                            
-                            for name_elem in name_selectors:
-                                if name_elem:
-                                    name_text = name_elem.get_text(strip=True)
-                                    if name_text and len(name_text) > 3 and len(name_text) < 200:
-                                        name = name_text.split('\n')[0].strip()
-                                        break
-                        except Exception as e:
-                            print(f"Error parsing element HTML: {e}")
-                            continue
-                    
-                    if not name or len(name) < 3:
-                        print(f"Element {i}: Could not extract product name")
-                        continue
-                    
-                    print(f"Element {i}: Found product name: {name[:50]}...")
-                    
-                    # Find price - try multiple methods
-                    price = 'N/A'
-                    try:
-                        # Try to find price in element directly
-                        price_elements = element.find_elements(By.CSS_SELECTOR, "[class*='price'], [class*='cost'], [class*='amount'], [data-testid*='price']")
-                        if price_elements:
-                            price = price_elements[0].text.strip()
-                        else:
-                            # Fall back to BeautifulSoup parsing
-                            if 'soup' in locals():
-                                price_elem = soup.find(['span', 'div'], class_=re.compile(r'price|cost|amount', re.I))
-                                if price_elem:
-                                    price = price_elem.get_text(strip=True)
-                    except:
-                        pass
-                    
-                    # Find URL - try multiple methods
-                    url = ''
-                    try:
-                        # Try to find link in element directly
-                        link_elements = element.find_elements(By.TAG_NAME, 'a')
-                        if link_elements:
-                            url = link_elements[0].get_attribute('href')
-                        else:
-                            # Fall back to BeautifulSoup
-                            if 'soup' in locals():
-                                link = soup.find('a', href=True)
-                                if link:
-                                    url = link.get('href', '')
-                        
-                        if url and not url.startswith('http'):
-                            url = 'https://www.heb.com' + url
-                    except:
-                        pass
-                    
-                    # Find image - try multiple methods
-                    image = ''
-                    try:
-                        # Try to find image in element directly
-                        img_elements = element.find_elements(By.TAG_NAME, 'img')
-                        if img_elements:
-                            image = img_elements[0].get_attribute('src') or img_elements[0].get_attribute('data-src')
-                        else:
-                            # Fall back to BeautifulSoup
-                            if 'soup' in locals():
-                                img = soup.find('img', src=True)
-                                if img:
-                                    image = img.get('src', img.get('data-src', ''))
-                        
-                        if image and not image.startswith('http'):
-                            image = 'https://www.heb.com' + image
-                    except:
-                        pass
-                    
-                    product = {
-                        'name': name,
-                        'price': price,
-                        'url': url,
-                        'image': image,
-                        'ingredients': '',
-                        'store': 'HEB'
-                    }
-                    
-                    # Avoid duplicates
-                    if not any(p['name'].lower() == product['name'].lower() for p in products):
-                        products.append(product)
-                        print(f"Added product: {name[:50]}... (Price: {price}, URL: {url[:50] if url else 'N/A'}...)")
-                    else:
-                        print(f"Skipped duplicate: {name[:50]}...")
-                        
-                except Exception as e:
-                    print(f"Error parsing element: {e}")
-                    continue
-        
-        elapsed = time.time() - start_time
-        print(f"Total products extracted: {len(products)} (took {elapsed:.1f}s)")
-        if products:
-            print(f"Sample product: {products[0]}")
-        return products[:limit]
-        
-    except TimeoutError:
-        print(f"Scraping operation timed out after {max_total_time} seconds")
-        return []
-    except Exception as e:
-        print(f"Selenium scraping error: {e}")
-        import traceback
-        traceback.print_exc()
-        return []
-    finally:
-        if driver:
-            try:
-                driver.quit()
-            except:
-                pass
+            # Per-lb, per-gal and per-each prices don't compare: the most common unit comes first.
+            counts = {}
+            for p in products:
+                if p.get('unit_price_cents'):
+                    counts[p['unit']] = counts.get(p['unit'], 0) + 1
+            rank = {unit: i for i, unit in enumerate(sorted(counts, key=lambda u: (-counts[u], u)))}
+            key = lambda p: (rank[p['unit']], p['unit_price_cents']) if p.get('unit_price_cents') else None  # noqa: E731
+        keyed = sorted(((k, i) for i, p in enumerate(products) if (k := key(p)) is not None), key=lambda t: t[0])
+        positioned = {i for _, i in keyed}
+        order = orders[sort] = (
+            [products[i] for _, i in keyed] + [p for i, p in enumerate(products) if i not in positioned],
+            [k for k, _ in keyed],
+        )
+    return order
 
-def scrape_heb_product(search_term, limit=20):
-    """
-    Scrape HEB website for products using Selenium browser emulation
-    """
-    if USE_MOCK_DATA:
-        return get_mock_products(search_term, limit)
-    
-    if not SELENIUM_AVAILABLE:
-        print("ERROR: Selenium not available. Install with: pip install selenium webdriver-manager")
-        return []
-    
-    # Use Selenium for real scraping
-    products = scrape_heb_product_selenium(search_term, limit)
-    
-    print(f"Scraped {len(products)} products from HEB")
-    
-    # Filter products to ensure they're relevant to the search term
-    # But be lenient - if HEB returned them, they're probably relevant
-    if products:
-        search_terms = search_term.lower().split()
-        relevant_products = []
-        
-        for product in products:
-            product_name_lower = product.get('name', '').lower()
-            # Check if any search term appears in the product name
-            if any(term in product_name_lower for term in search_terms if len(term) > 2):
-                relevant_products.append(product)
-            # Also include if the full search term is in the name
-            elif search_term.lower() in product_name_lower:
-                relevant_products.append(product)
-            # If search term is short or we have few results, include all products
-            # (HEB's search is usually good, so trust their results)
-            elif len(search_term) < 4 or len(products) <= 5:
-                relevant_products.append(product)
-        
-        print(f"After filtering: {len(relevant_products)} relevant products (out of {len(products)} total)")
-        # Return relevant products if found, otherwise return all products (they might still be valid)
-        return relevant_products[:limit] if relevant_products else products[:limit]
-    
-    print("No products found")
-    return []
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8',
-        'Accept-Language': 'en-US,en;q=0.9',
-        'Accept-Encoding': 'gzip, deflate, br',
-        'Connection': 'keep-alive',
-        'Upgrade-Insecure-Requests': '1',
-        'Sec-Fetch-Dest': 'document',
-        'Sec-Fetch-Mode': 'navigate',
-        'Sec-Fetch-Site': 'none',
-        'Cache-Control': 'max-age=0',
-        'Referer': 'https://www.heb.com/',
-    }
-    
-    products = []
+
+def _ordered_products(entry, sort="relevance", max_price=None):
+    """A cached search's filtered products in `sort` order and, with max_price, only those costing at most that."""
+    if sort == 'price':
+        products, keys = _sort_order(entry, 'price')
+        # Price-sorted already: the limit is a bisection.
+        return products if max_price is None else products[:bisect.bisect_right(keys, max_price)]
+    if sort == 'unit_price':
+        products, _ = _sort_order(entry, 'unit_price')
+    else:
+        products = entry['products']
+    if max_price is None:
+        return products
+    return [p for p in products if (effective_cents(p) or max_price + 1) <= max_price]
+
+
+def _requested_fields(data):
+    """Product fields to return (sorted tuple), from fields=[...] / "a,b" or compact=true; None = all."""
+    fields = data.get('fields')
+    if isinstance(fields, str):
+        fields = fields.split(',')
+    if fields:
+        fields = {str(f).strip() for f in fields if str(f).strip()}
+        if len(fields) > MAX_PROJECTED_FIELDS:
+            raise ValueError(f'At most {MAX_PROJECTED_FIELDS} fields')
+        return tuple(sorted(fields))
+    if data.get('compact'):
+        return COMPACT_FIELDS
+    return None
+
+
+def _project(product, fields):
+    """Only `fields` of a product; one without a productId keeps its ingredients (they can't be fetched later)."""
+    if fields is None:
+        return product
+    out = {k: product[k] for k in fields if k in product}
+    if 'ingredients' not in out and not product.get('productId') and 'ingredients' in product:
+        out['ingredients'] = product['ingredients']
+    return out
+
+
+def _search_response(entry, include_hidden=False, fields=None, products=None, hidden=None):
+    """Client payload for a cached search; hidden products (with the terms that hid them) only on request."""
+    body = {k: v for k, v in entry.items() if k != 'hidden' and not k.startswith('_')}
+    if products is not None:
+        body['products'] = products
+    if fields is not None:
+        body['products'] = [_project(p, fields) for p in body['products']]
+    if include_hidden:
+        hidden = entry.get('hidden', ()) if hidden is None else hidden
+        body['hidden'] = [dict(_project(product, fields), hidden_because=terms) for product, terms in hidden]
+    return body
+
+def _product_details(store, product_ids, timeout=30):
+    """({productId: product}, {productId: source}) from the cheapest place that has each product."""
+    now = datetime.now()
+    max_age = timedelta(hours=float(os.getenv("PRODUCT_DETAILS_MAX_AGE_HOURS", "24")))
+    found, sources = {}, {}
+    for pid in product_ids:
+        cached = product_details_cache.get(pid)
+        if cached is not None:
+            found[pid], sources[pid] = cached, "cache"
+        elif pid in _product_catalog:
+            # (Shared fields only: no price, which is per location.)
+            found[pid], sources[pid] = _product_catalog[pid], "catalog"
     
-    # Strategy 1: Try HEB's various API endpoints
-    api_endpoints = [
-        'https://www.heb.com/commerce-api/v1/product/search',
-        'https://api.heb.com/v1/products/search',
-        'https://www.heb.com/api/products/search',
-        'https://www.heb.com/shop/api/products/search',
-    ]
+    missing = [pid for pid in product_ids if pid not in found]
+    if missing:
+        with tracing.span("local_index.get_many", ids=len(missing)):
+            for pid, product in local_index.get_many(store, missing, max_age_s=max_age.total_seconds()).items():
+                found[pid], sources[pid] = product, "local"
     
-    for api_url in api_endpoints:
+    missing = [pid for pid in product_ids if pid not in found]
+    if missing:
         try:
-            params = {
-                'q': search_term,
-                'query': search_term,
-                'searchTerm': search_term,
-                'page': 1,
-                'pageSize': limit,
-                'limit': limit
-            }
-            api_response = requests.get(api_url, headers=headers, params=params, timeout=10)
-            
-            if api_response.status_code == 200:
-                try:
-                    data = api_response.json()
-                    # Try common JSON structures
-                    items = data.get('products', data.get('items', data.get('results', data.get('data', []))))
-                    if isinstance(items, dict):
-                        items = items.get('products', items.get('items', []))
-                    
-                    for item in items[:limit*2]:
-                        if not isinstance(item, dict):
-                            continue
-                        product = {
-                            'name': item.get('name', item.get('productName', item.get('title', item.get('displayName', '')))),
-                            'price': item.get('price', item.get('salePrice', item.get('regularPrice', item.get('currentPrice', 'N/A')))),
-                            'url': item.get('url', item.get('productUrl', item.get('link', item.get('productLink', '')))),
-                            'image': item.get('image', item.get('imageUrl', item.get('thumbnail', item.get('thumbnailUrl', '')))),
-                            'ingredients': item.get('ingredients', item.get('ingredientList', '')),
-                            'store': 'HEB'
-                        }
-                        if product['name'] and len(product['name']) > 3:
-                            # Format price if it's a number
-                            if isinstance(product['price'], (int, float)):
-                                product['price'] = f"${product['price']:.2f}"
-                            # Avoid duplicates
-                            if not any(p['name'].lower() == product['name'].lower() for p in products):
-                                products.append(product)
-                    
-                    if products:
-                        # Filter for relevance before returning
-                        search_terms = search_term.lower().split()
-                        relevant = [p for p in products if any(term in p['name'].lower() for term in search_terms if len(term) > 2) or search_term.lower() in p['name'].lower()]
-                        if relevant:
-                            return relevant[:limit]
-                        return products[:limit]
-                except (json.JSONDecodeError, KeyError, AttributeError) as e:
-                    print(f"JSON parsing failed for {api_url}: {e}")
-                    continue
+            api_products = store_registry.get(store).details(missing)
         except Exception as e:
-            print(f"API attempt failed for {api_url}: {e}")
-            continue
+            log.warning(f"{store} product lookup failed ({e}); falling back to product pages")
+            api_products = {}
+        if api_products:
+            local_index.add(store, api_products.values())
+        for pid, product in api_products.items():
+            found[pid], sources[pid] = product, "api"
     
-    # Strategy 2: Try HTML scraping with multiple URL patterns
-    # Note: HEB uses Incapsula bot protection, so this may not work
-    search_urls = [
-        f"https://www.heb.com/search/?q={search_term}",
-        f"https://www.heb.com/shop/search?q={search_term}",
-        f"https://www.heb.com/products?q={search_term}",
-    ]
-    
-    for search_url in search_urls:
-        try:
-            # Use session to maintain cookies
-            session = requests.Session()
-            session.headers.update(headers)
-            
-            # First, visit the homepage to get cookies
-            try:
-                session.get('https://www.heb.com', timeout=5)
-            except:
-                pass
-            
-            response = session.get(search_url, timeout=15, allow_redirects=True)
-            
-            if response.status_code != 200:
-                continue
-            
-            # Check if we got blocked by Incapsula
-            if 'Incapsula' in response.text or len(response.content) < 500:
-                print(f"Blocked by bot protection for {search_url}")
-                continue
-            
-            # Check if response contains JSON data in script tags
-            soup = BeautifulSoup(response.content, 'html.parser')
-            
-            # Look for JSON data in script tags (common pattern)
-            script_tags = soup.find_all('script', type=re.compile(r'application/json|application/ld\+json'))
-            for script in script_tags:
-                try:
-                    data = json.loads(script.string)
-                    # Try to extract products from structured data
-                    if isinstance(data, dict):
-                        items = data.get('@graph', data.get('itemListElement', data.get('products', [])))
-                        for item in items:
-                            if isinstance(item, dict):
-                                name = item.get('name', item.get('title', ''))
-                                if name:
-                                    product = {
-                                        'name': name,
-                                        'price': item.get('offers', {}).get('price', 'N/A') if isinstance(item.get('offers'), dict) else 'N/A',
-                                        'url': item.get('url', item.get('@id', '')),
-                                        'image': item.get('image', item.get('thumbnailUrl', '')),
-                                        'ingredients': '',
-                                        'store': 'HEB'
-                                    }
-                                    if product['url'] and not product['url'].startswith('http'):
-                                        product['url'] = 'https://www.heb.com' + product['url']
-                                    # Validate product before adding
-                                    if product['name'] and len(product['name']) > 3:
-                                        # Avoid duplicates
-                                        if not any(p['name'].lower() == product['name'].lower() for p in products):
-                                            products.append(product)
-                except (json.JSONDecodeError, AttributeError):
-                    continue
-            
-            # Strategy 3: HTML parsing with multiple selector patterns
-            # Try various common e-commerce patterns
-            selectors = [
-                {'tag': 'div', 'attrs': {'class': re.compile(r'product', re.I)}},
-                {'tag': 'div', 'attrs': {'class': re.compile(r'product-item', re.I)}},
-                {'tag': 'div', 'attrs': {'class': re.compile(r'product-card', re.I)}},
-                {'tag': 'article', 'attrs': {'class': re.compile(r'product', re.I)}},
-                {'tag': 'li', 'attrs': {'class': re.compile(r'product', re.I)}},
-                {'tag': 'div', 'attrs': {'data-product-id': True}},
-                {'tag': 'div', 'attrs': {'data-sku': True}},
-            ]
-            
-            for selector in selectors:
-                product_elements = soup.find_all(selector['tag'], selector['attrs'])[:limit*2]
-                if product_elements:
-                    for element in product_elements:
-                        try:
-                            # Try to find product name
-                            name = None
-                            for tag in ['h1', 'h2', 'h3', 'h4', 'a']:
-                                name_elem = element.find(tag, class_=re.compile(r'name|title|product-name', re.I))
-                                if not name_elem:
-                                    name_elem = element.find(tag)
-                                if name_elem:
-                                    name = name_elem.get_text(strip=True)
-                                    if name and len(name) > 3:
-                                        break
-                            
-                            if not name:
-                                continue
-                            
-                            # Try to find price
-                            price = 'N/A'
-                            price_elem = element.find(['span', 'div', 'p'], class_=re.compile(r'price|cost|amount', re.I))
-                            if price_elem:
-                                price_text = price_elem.get_text(strip=True)
-                                if '$' in price_text or re.search(r'\d+\.\d{2}', price_text):
-                                    price = price_text
-                            
-                            # Try to find link
-                            url = ''
-                            link_elem = element.find('a', href=True)
-                            if link_elem:
-                                url = link_elem['href']
-                                if url and not url.startswith('http'):
-                                    url = 'https://www.heb.com' + url
-                            
-                            # Try to find image
-                            image = ''
-                            img_elem = element.find('img', src=True)
-                            if img_elem:
-                                image = img_elem.get('src', img_elem.get('data-src', ''))
-                                if image and not image.startswith('http'):
-                                    image = 'https://www.heb.com' + image
-                            
-                            product = {
-                                'name': name,
-                                'price': price,
-                                'url': url,
-                                'image': image,
-                                'ingredients': '',
-                                'store': 'HEB'
-                            }
-                            
-                            # Validate product has minimum required info
-                            if not product['name'] or len(product['name']) < 3:
-                                continue
-                            
-                            # Avoid duplicates
-                            if not any(p['name'].lower() == product['name'].lower() for p in products):
-                                products.append(product)
-                                
-                            if len(products) >= limit:
-                                break
-                        except Exception as e:
-                            continue
-                    
-                    if products:
-                        break
-                
-            if products:
+    # Last resort, concurrently but at most SELENIUM_POOL_SIZE browsers: product pages for IDs
+    # nobody knew and for products whose API data has no ingredient statement (a few per request,
+    # while the scrape queue has room; the rest stay missing or without ingredients).
+    to_scrape = [pid for pid in product_ids if sources.get(pid) != "cache" and not (found.get(pid) or {}).get('ingredients')]
+    if to_scrape and SELENIUM_AVAILABLE:
+        futures = {}
+        slots = _details_scrape_slots
+        for pid in to_scrape[:DETAILS_MAX_SCRAPES_PER_REQUEST]:
+            if not slots.acquire(blocking=False):
                 break
-                
-        except Exception as e:
-            print(f"Error with URL {search_url}: {e}")
-            continue
-    
-    # Filter products to ensure they're relevant to the search term
-    # Only return products that contain the search term in the name (case-insensitive)
-    search_terms = search_term.lower().split()
-    relevant_products = []
-    
-    for product in products:
-        product_name_lower = product.get('name', '').lower()
-        # Check if any search term appears in the product name
-        if any(term in product_name_lower for term in search_terms if len(term) > 2):
-            relevant_products.append(product)
-        # Also include if the full search term is in the name
-        elif search_term.lower() in product_name_lower:
-            relevant_products.append(product)
-    
-    # If we found relevant products, return them
-    if relevant_products:
-        return relevant_products[:limit]
+            futures[pid] = _details_scrape_pool.submit(contextvars.copy_context().run, _scrape_product_details,
+                                                       store, pid, found.get(pid))
+            futures[pid].add_done_callback(lambda _: slots.release())
+        done, _ = wait_futures(futures.values(), timeout=timeout)
+        for pid, future in futures.items():
+            # Stragglers keep running and land in the local index for the next request.
+            if future in done and not future.exception() and future.result():
+                found[pid], sources[pid] = future.result(), "scrape"
     
-    # Strategy 3: Try Selenium if available (for JavaScript-rendered content)
-    if SELENIUM_AVAILABLE and not products:
-        try:
-            print("Attempting to use Selenium for JavaScript-rendered content...")
-            chrome_options = Options()
-            chrome_options.add_argument('--headless')
-            chrome_options.add_argument('--no-sandbox')
-            chrome_options.add_argument('--disable-dev-shm-usage')
-            chrome_options.add_argument('--disable-blink-features=AutomationControlled')
-            chrome_options.add_argument('user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36')
-            
-            driver = webdriver.Chrome(options=chrome_options)
-            try:
-                search_url = f"https://www.heb.com/search/?q={search_term}"
-                driver.get(search_url)
-                
-                # Wait for products to load
-                WebDriverWait(driver, 10).until(
-                    EC.presence_of_element_located((By.CLASS_NAME, "product"))
-                )
-                
-                # Get page source and parse
-                soup = BeautifulSoup(driver.page_source, 'html.parser')
-                # Use the same parsing logic as before
-                # ... (could add Selenium-specific parsing here)
-                
-            finally:
-                driver.quit()
-        except Exception as e:
-            print(f"Selenium attempt failed: {e}")
-    
-    # If no products found, return empty list (don't use mock data)
-    if not products:
-        print(f"No products found from HEB for search: '{search_term}'")
-        print("Note: HEB uses bot protection (Incapsula) which blocks automated requests.")
-        print("To enable real HEB scraping, you need to:")
-        print("  1. Use a headless browser (Selenium/Playwright) - install: pip install selenium")
-        print("  2. Or find HEB's API endpoint by inspecting network requests in browser DevTools")
-        print("  3. Or use mock data mode: Set USE_MOCK_DATA=True in .env file")
-        return []
-
-def get_product_details(product_url):
-    """Fetch detailed product information including ingredients using Selenium"""
-    if not product_url or not product_url.startswith('http'):
+    expiry = now + max_age
+    for pid, product in found.items():
+        if sources[pid] not in ("cache", "catalog"):
+            product_details_cache.set(pid, product, expiry)
+    return found, sources
+
+
+def _scrape_product_details(store, product_id, product=None):
+    """Ingredients from the product page, merged into what we already know (None if the page had none)."""
+    url = (product or {}).get('url') or f"https://www.kroger.com/p/{quote(product_id, safe='')}"
+    details, _ = _detail_flights.do(url, lambda: scraper().get_product_details(url))
+    if not details or not details.get('ingredients'):
         return None
+    merged = dict(product or {'productId': product_id, 'name': '', 'url': url, 'store': 'Kroger'})
+    merged['ingredients'] = details['ingredients']
+    merged['_filter_text'] = f"{merged.get('_filter_text', merged.get('name', ''))} {details['ingredients']}".strip()
+    merged.pop('unverified', None)
+    local_index.add(store, [merged])
+    local_index.set_enrichment(store, product_key(merged), details['ingredients'])
+    return merged
+
+@app.route('/api/products/details', methods=['POST'])
+def products_details():
+    """Details (ingredients, price, images) for many products at once, by productId"""
+    data = request.json
+    store = data.get('store', 'kroger').lower()
+    ids = data.get('product_ids') or []
+    if isinstance(ids, str):
+        ids = ids.split(',')
+    ids = list(dict.fromkeys(str(i).strip() for i in ids if str(i).strip()))
     
-    if not SELENIUM_AVAILABLE:
-        # Fallback to requests if Selenium not available (will likely fail due to bot protection)
-        try:
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-                'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
-                'Accept-Language': 'en-US,en;q=0.5',
-            }
-            response = requests.get(product_url, headers=headers, timeout=10)
-            if response.status_code != 200:
-                return None
-            soup = BeautifulSoup(response.content, 'html.parser')
-        except:
-            return None
-    else:
-        # Use Selenium to fetch product page (bypasses bot protection)
-        driver = None
-        try:
-            driver = create_selenium_driver()
-            driver.set_page_load_timeout(10)  # 10 second timeout for ingredient pages
-            driver.implicitly_wait(2)
-            
-            print(f"Fetching ingredients from: {product_url}")
-            driver.get(product_url)
-            
-            # Wait a moment for page to load
-            import time
-            time.sleep(1.5)
-            
-            # Get page source and parse
-            soup = BeautifulSoup(driver.page_source, 'html.parser')
-        except Exception as e:
-            print(f"Error loading product page {product_url}: {e}")
-            return None
-        finally:
-            if driver:
-                try:
-                    driver.quit()
-                except:
-                    pass
-    
-    # Now parse ingredients from the page
-    ingredients_text = ""
-    
-    # Strategy 1: Look for HEB's specific ingredients structure
-    # <div class="sc-578c3839-3 frvaxi"><h4>Ingredients</h4><span>...</span></div>
-    ingredients_div = soup.find('div', class_=re.compile(r'sc-578c3839-3|frvaxi', re.I))
-    if ingredients_div:
-        # Look for h4 with "Ingredients" text
-        h4 = ingredients_div.find('h4', string=re.compile(r'ingredients?', re.I))
-        if h4:
-            # Find the span with actual ingredients
-            span = ingredients_div.find('span')
-            if span:
-                ingredients_text = span.get_text(strip=True)
-                print(f"Found ingredients using HEB structure: {ingredients_text[:100]}...")
-    
-    # Strategy 2: Look for any div containing "Ingredients" heading
-    if not ingredients_text:
-        ingredients_heading = soup.find(['h4', 'h3', 'h2'], string=re.compile(r'ingredients?', re.I))
-        if ingredients_heading:
-            # Look in parent or next sibling
-            parent = ingredients_heading.parent
-            if parent:
-                # Try to find span or div with ingredients text
-                ingredients_elem = parent.find(['span', 'div', 'p'])
-                if ingredients_elem:
-                    ingredients_text = ingredients_elem.get_text(strip=True)
+    if not ids:
+        return jsonify({'error': 'product_ids required'}), 400
+    if len(ids) > MAX_DETAIL_IDS:
+        return jsonify({'error': f'At most {MAX_DETAIL_IDS} product_ids per request'}), 400
+    adapter = store_registry.get(store)
+    if adapter is None or not adapter.enabled() or not adapter.supports(stores.DETAILS):
+        supported = ', '.join(a.name for a in store_registry.enabled() if a.supports(stores.DETAILS))
+        return jsonify({'error': f'No product details for store: {store}. Supported stores: {supported}'}), 400
     
-    # Strategy 3: Look for structured data (JSON-LD)
-    if not ingredients_text:
-        script_tags = soup.find_all('script', type=re.compile(r'application/json|application/ld\+json'))
-        for script in script_tags:
-            try:
-                data = json.loads(script.string)
-                if isinstance(data, dict):
-                    ingredients = data.get('ingredients', data.get('nutrition', {}).get('ingredients', ''))
-                    if ingredients:
-                        ingredients_text = ingredients if isinstance(ingredients, str) else ', '.join(ingredients) if isinstance(ingredients, list) else str(ingredients)
-                        break
-            except (json.JSONDecodeError, AttributeError):
-                continue
+    try:
+        fields = _requested_fields(data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
-    # Strategy 4: Generic search for ingredients section
-    if not ingredients_text:
-        # Look for any div with class containing "ingredient"
-        ingredient_divs = soup.find_all('div', class_=re.compile(r'ingredient', re.I))
-        for div in ingredient_divs:
-            text = div.get_text(strip=True)
-            if 'ingredient' in text.lower() and len(text) > 20:
-                # Extract text after "Ingredients" label
-                parts = re.split(r'ingredients?:?\s*', text, flags=re.I)
-                if len(parts) > 1:
-                    ingredients_text = parts[1].strip()
-                    break
+    found, sources = _product_details(store, ids)
+    missing = [pid for pid in ids if pid not in found]
+    counts = {}
+    for source in list(sources.values()) + ['missing'] * len(missing):
+        counts[source] = counts.get(source, 0) + 1
+        metrics.PRODUCT_DETAILS.inc(source=source)
+    return jsonify({
+        'products': [
+            dict(_project({k: v for k, v in found[pid].items() if not k.startswith('_')}, fields),
+                 productId=pid, source=sources[pid])
+            for pid in ids if pid in found
+        ],
+        'missing': missing,
+        'sources': counts,
+    })
+
+@app.route('/api/products/<product_id>/prices', methods=['GET'])
+def product_prices(product_id):
+    """Daily price history of a product (lowest price per day and location)"""
+    store = request.args.get('store', 'kroger').lower()
+    location_id = request.args.get('location_id') or None
+    try:
+        days = min(max(int(request.args.get('days', 90)), 1), MAX_PRICE_HISTORY_DAYS)
+    except ValueError:
+        return jsonify({'error': 'days must be an integer'}), 400
+    if store_registry.get(store) is None:
+        return jsonify({'error': f'Unknown store: {store}'}), 400
     
-    return {
-        'ingredients': ingredients_text.strip() if ingredients_text else ""
-    }
+    # (Includes what this worker saw moments ago and hasn't written yet.)
+    rows = price_history.history(store, product_id, location_id, days=days)
+    prices = []
+    for day, loc, cents, promo_cents in rows:
+        entry = {
+            'date': (datetime(1970, 1, 1) + timedelta(days=day)).strftime('%Y-%m-%d'),
+            'location_id': loc,
+            'price': format_cents(cents),
+            'price_cents': cents,
+        }
+        if promo_cents:
+            entry['promo_price'] = format_cents(promo_cents)
+            entry['promo_cents'] = promo_cents
+        prices.append(entry)
+    lowest = min(prices, key=lambda e: (e.get('promo_cents') or e['price_cents'], e['date']), default=None)
+    return jsonify({
+        'productId': product_id,
+        'store': store,
+        'days': days,
+        'prices': prices,
+        'lowest': lowest,
+    })
 
-@app.route('/api/health', methods=['GET'])
-def health():
-    return jsonify({'status': 'healthy'})
+@app.route('/api/enrichment/stats', methods=['GET'])
+def enrichment_stats():
+    """Background ingredient enrichment: backlog, totals and how the backlog moved over time (this worker)"""
+    return jsonify(dict(enrichment_queue.stats(), enabled=ENRICH_INGREDIENTS))
 
-def scrape_kroger_product(search_term, limit=20):
-    """Scrape Kroger website for products using Selenium"""
-    if USE_MOCK_DATA:
-        return get_mock_products(search_term, limit)
-    
-    if not SELENIUM_AVAILABLE:
-        print("ERROR: Selenium not available. Install with: pip install selenium webdriver-manager")
-        return []
-    
-    driver = None
-    import time
-    start_time = time.time()
-    max_total_time = 25
+@app.route('/api/stores', methods=['GET'])
+def get_stores():
+    """Stores that can be searched, with their capabilities and limits"""
+    return jsonify({'stores': store_registry.describe()})
+
+@app.route('/api/suggest', methods=['GET'])
+def suggest():
+    """Query and product-name completions for what the user has typed so far"""
+    prefix = request.args.get('q', '')
+    store = request.args.get('store', 'kroger').lower()
+    try:
+        limit = min(max(int(request.args.get('limit', 8)), 1), 25)
+    except ValueError:
+        return jsonify({'error': 'limit must be an integer'}), 400
     
+    # Served entirely from memory; never calls upstream. "Cached" is checked for the store's default
+    # location and the one this user's search would go to (location_ids, zip, else their saved store).
+    location_sets = [()]
+    locations = _suggest_locations(request.args, request.args.get('user_id', 'default'))
+    if locations:
+        location_sets.append(locations)
+    suggestions = suggest_index.suggest(prefix, limit, is_cached=lambda q: _results_cached(store, q, location_sets))
+    return jsonify({'query': prefix, 'suggestions': suggestions})
+
+@app.route('/api/locations', methods=['GET'])
+def get_locations():
+    """Stores nearest a ZIP code or lat/lon, closest first"""
     try:
-        driver = create_selenium_driver()
-        driver.set_page_load_timeout(15)
-        driver.implicitly_wait(3)
-        
-        # Kroger search URL
-        search_url = f"https://www.kroger.com/search?query={search_term.replace(' ', '+')}"
-        
-        print(f"Loading Kroger search page: {search_url}")
-        try:
-            driver.get(search_url)
-        except Exception as e:
-            print(f"Page load timeout or error: {e}")
-        
-        # Wait for page to load and scroll to trigger lazy loading
-        time.sleep(3)
-        try:
-            driver.execute_script("window.scrollTo(0, 500);")
-            time.sleep(1)
-        except:
-            pass
-        
-        # Parse page source
-        page_source = driver.page_source
-        print(f"Page source length: {len(page_source)} characters")
-        if "Access Denied" in page_source or "errors.edgesuite.net" in page_source:
-            raise Exception(
-                "Kroger blocked automated access (Akamai 'Access Denied'). "
-                "This can happen in headless mode or from restricted networks. "
-                "Try setting HEADLESS=false to solve any challenge manually, or try again from a different network."
-            )
-        soup = BeautifulSoup(page_source, 'html.parser')
-        products = []
-        
-        # Strategy 1: Look for JSON-LD structured data
-        script_tags = soup.find_all('script', type=re.compile(r'application/json|application/ld\+json'))
-        for script in script_tags:
-            try:
-                blob = (script.string or script.get_text() or "").strip()
-                if not blob or blob[0] not in "{[":
-                    continue
-                data = json.loads(blob)
-                if isinstance(data, dict):
-                    # Look for product lists
-                    items = data.get('itemListElement', data.get('@graph', []))
-                    if isinstance(items, list):
-                        for item in items[:limit*2]:
-                            if isinstance(item, dict):
-                                name = item.get('name', '')
-                                url = item.get('url', item.get('@id', ''))
-                                if name and url:
-                                    product = {
-                                        'name': name[:200],
-                                        'price': 'N/A',
-                                        'url': url if url.startswith('http') else 'https://www.kroger.com' + url,
-                                        'image': item.get('image', ''),
-                                        'ingredients': '',
-                                        'store': 'Kroger'
-                                    }
-                                    if not any(p['url'] == product['url'] for p in products):
-                                        products.append(product)
-                                        print(f"Found product from JSON-LD: {name[:50]}...")
-            except (json.JSONDecodeError, AttributeError):
-                continue
-
-        # Strategy 1b (fallback): Parse embedded JSON blobs that contain product objects.
-        # Kroger often embeds data containing fields like upc/description/seoUrl without JSON-LD.
-        def _walk(obj):
-            if isinstance(obj, dict):
-                yield obj
-                for v in obj.values():
-                    yield from _walk(v)
-            elif isinstance(obj, list):
-                for it in obj:
-                    yield from _walk(it)
-
-        def _product_from_obj(o):
-            if not isinstance(o, dict):
-                return None
-            name = o.get("description") or o.get("name") or ""
-            url = o.get("seoUrl") or o.get("url") or o.get("@id") or ""
-            upc = o.get("upc") or o.get("productId") or o.get("id") or ""
-            if not name or not url:
-                return None
-            # Require at least one Kroger-ish identifier to reduce false positives.
-            if not upc and "/p/" not in str(url) and "/products/" not in str(url):
-                return None
-            if not _looks_like_product_url("kroger", str(url)):
-                return None
-
-            price = "N/A"
-            try:
-                items = o.get("items")
-                if isinstance(items, list) and items:
-                    price_val = items[0].get("price") if isinstance(items[0], dict) else None
-                    if price_val:
-                        price = f"${price_val}" if isinstance(price_val, (int, float)) else str(price_val)
-            except Exception:
-                pass
-
-            image = ""
-            try:
-                imgs = o.get("images") or o.get("image")
-                if isinstance(imgs, list) and imgs:
-                    if isinstance(imgs[0], dict):
-                        image = imgs[0].get("url") or imgs[0].get("sizes", {}).get("medium", "")
-                    elif isinstance(imgs[0], str):
-                        image = imgs[0]
-                elif isinstance(imgs, str):
-                    image = imgs
-            except Exception:
-                pass
-
-            if isinstance(url, str) and not url.startswith("http"):
-                url = "https://www.kroger.com" + url
-            return {
-                "name": str(name)[:200],
-                "price": price,
-                "url": url,
-                "image": image,
-                "ingredients": "",
-                "store": "Kroger",
-            }
-
-        for script in script_tags:
-            try:
-                blob = (script.string or script.get_text() or "").strip()
-                if not blob or ("\"upc\"" not in blob and "\"seoUrl\"" not in blob and "\"description\"" not in blob):
-                    continue
-                if blob[0] not in "{[":
-                    continue
-                data = json.loads(blob)
-                for o in _walk(data):
-                    prod = _product_from_obj(o)
-                    if prod and not any(p["url"] == prod["url"] for p in products):
-                        products.append(prod)
-                        if len(products) >= limit:
-                            break
-            except Exception:
-                continue
-        
-        # Strategy 2: Look for product links with various patterns
-        # NOTE: Kroger sometimes uses /products/... in search results; include both.
-        product_link_patterns = [
-            r'/p/',
-            r'/products/',
-        ]
-        
-        all_product_links = []
-        for pattern in product_link_patterns:
-            links = soup.find_all('a', href=re.compile(pattern, re.I))
-            all_product_links.extend(links)
-            if links:
-                print(f"Found {len(links)} links matching pattern: {pattern}")
-        
-        # Strategy 3: Look for product containers with data attributes or product classes
-        product_containers = []
-        # Try containers with data attributes
-        containers_with_data = soup.find_all(['div', 'article', 'li'], attrs={'data-product-id': True})
-        product_containers.extend(containers_with_data)
-        containers_with_sku = soup.find_all(['div', 'article', 'li'], attrs={'data-sku': True})
-        product_containers.extend(containers_with_sku)
-        # Try containers with product/item classes
-        containers_with_class = soup.find_all(['div', 'article', 'li'], 
-                                             class_=re.compile(r'product|item', re.I))
-        product_containers.extend(containers_with_class)
-        # Remove duplicates
-        seen_containers = set()
-        unique_containers = []
-        for container in product_containers:
-            container_id = id(container)
-            if container_id not in seen_containers:
-                seen_containers.add(container_id)
-                unique_containers.append(container)
-        product_containers = unique_containers
-        print(f"Found {len(product_containers)} product containers")
-        
-        for container in product_containers[:limit*2]:
-            try:
-                link = container.find('a', href=re.compile(r'/p/|/products/', re.I))
-                if link:
-                    all_product_links.append(link)
-            except:
-                pass
-        
-        # Remove duplicates
-        seen_urls = set()
-        unique_links = []
-        for link in all_product_links:
-            href = link.get('href', '')
-            if href and href not in seen_urls:
-                seen_urls.add(href)
-                unique_links.append(link)
-        
-        print(f"Found {len(unique_links)} unique product links from Kroger")
-        
-        # Extract products from links
-        for link in unique_links[:limit*2]:
-            if time.time() - start_time > max_total_time:
-                break
-            try:
-                url = link.get('href', '')
-                if not url:
-                    continue
-                if not _looks_like_product_url("kroger", url):
-                    continue
-                if not url.startswith('http'):
-                    url = 'https://www.kroger.com' + url
-                if not _looks_like_product_url("kroger", url):
-                    continue
-                
-                name = link.get_text(strip=True)
-                if not name or len(name) < 3:
-                    # Try to find name in parent elements
-                    parent = link.parent
-                    for _ in range(3):
-                        if parent:
-                            name_elem = parent.find(['h1', 'h2', 'h3', 'h4', 'span', 'div'], 
-                                                   class_=re.compile(r'name|title|product', re.I))
-                            if name_elem:
-                                name = name_elem.get_text(strip=True)
-                                if name and len(name) > 3:
-                                    break
-                            parent = parent.parent if hasattr(parent, 'parent') else None
-                
-                if not name or len(name) < 3:
-                    continue
-                
-                # Find price
-                price = 'N/A'
-                try:
-                    container = link.find_parent(['article', 'div', 'li'])
-                    if container:
-                        price_text = container.get_text()
-                        price_match = re.search(r'\$[\d,]+\.?\d{0,2}', price_text)
-                        if price_match:
-                            price = price_match.group(0)
-                except:
-                    pass
-                
-                # Find image
-                image = ''
-                try:
-                    img = link.find('img')
-                    if not img:
-                        container = link.find_parent(['article', 'div'])
-                        if container:
-                            img = container.find('img')
-                    if img:
-                        image = img.get('src', img.get('data-src', ''))
-                        if image and not image.startswith('http'):
-                            image = 'https://www.kroger.com' + image
-                except:
-                    pass
-                
-                product = {
-                    'name': name[:200],
-                    'price': price,
-                    'url': url,
-                    'image': image,
-                    'ingredients': '',
-                    'store': 'Kroger'
-                }
-                
-                if not any(p['name'].lower() == product['name'].lower() or 
-                          p['url'] == product['url'] for p in products):
-                    products.append(product)
-                    if len(products) >= limit:
-                        break
-            except Exception as e:
-                print(f"Error extracting product from Kroger: {e}")
-                continue
-        
-        print(f"Scraped {len(products)} products from Kroger")
-        return products[:limit]
-        
+        zip_code, lat, lon = _location_query(request.args)
+        limit = min(max(int(request.args.get('limit', 5)), 1), 50)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        nearest = _nearest_locations(zip_code, lat, lon, limit)
     except Exception as e:
-        print(f"Kroger scraping error: {e}")
-        import traceback
-        traceback.print_exc()
-        return []
-    finally:
-        if driver:
-            try:
-                driver.quit()
-            except:
-                pass
+        log.exception(f"Location lookup error: {e}")
+        return jsonify({'error': f'Location lookup failed: {str(e)}', 'locations': []}), 500
+    return jsonify({'locations': [dict(loc, distance_miles=round(d, 2)) for d, loc in nearest]})
 
-@app.route('/api/search', methods=['POST'])
-def search_products():
-    """Search for products and filter based on user criteria"""
-    import signal
-    
+@app.route('/api/locations/preferred', methods=['GET'])
+def get_preferred_location():
+    """The store the user's searches default to"""
+    user_id = request.args.get('user_id', 'default')
+    location_id = preferred_locations.get(user_id)
+    return jsonify({'location_id': location_id, 'location': location_index.get(location_id) if location_id else None})
+
+@app.route('/api/locations/preferred', methods=['POST'])
+def set_preferred_location():
+    """Set the user's store: a location_id, or the nearest store to a zip / lat+lon"""
     data = request.json
-    search_term = data.get('query', '')
     user_id = data.get('user_id', 'default')
-    store = data.get('store', 'kroger').lower()  # Default to kroger
-    
-    if not search_term:
-        return jsonify({'error': 'Search term required'}), 400
-    
-    # Get user's filters
-    filters = user_filters.get(user_id, DEFAULT_FILTERS.copy())
-    
-    # Check cache (include store + user + filter version in cache key)
-    filter_version = int(user_filter_versions.get(user_id, 0))
-    cache_key = f"{store}_{search_term}_{user_id}_fv{filter_version}"
-    if cache_key in product_cache:
-        cache_time = cache_expiry.get(cache_key)
-        if cache_time and datetime.now() < cache_time:
-            cached = product_cache[cache_key]
-            # Backward-compat: older cache entries may be just a list of products.
-            if isinstance(cached, list):
-                return jsonify({
-                    'products': cached,
-                    'total_found': len(cached),
-                    'filtered_count': len(cached),
-                    'store': store
-                })
-            return jsonify(cached)
-    
-    # Prefer official APIs when configured; fall back to Selenium scraping otherwise.
-    try:
-        if store == 'kroger':
-            if os.getenv("KROGER_CLIENT_ID") and os.getenv("KROGER_CLIENT_SECRET"):
-                products = kroger_api_product_search(search_term)
-            else:
-                products = scrape_kroger_product(search_term)
-        else:
-            return jsonify({'error': f'Unknown store: {store}. Supported stores: kroger'}), 400
-    except TimeoutError:
-        return jsonify({
-            'error': 'Search timed out. Please try again with a different search term.',
-            'products': []
-        }), 408
-    except Exception as e:
-        print(f"Search error: {e}")
-        return jsonify({
-            'error': f'Search failed: {str(e)}',
-            'products': []
-        }), 500
-    
-    # Filter products based on ingredients/text
-    # NOTE: Do NOT fetch product pages during search; it's slow and often blocked.
-    filtered_products = []
-    for product in products:
-        # Check if product passes filters
-        # Use a combined text field so we can filter even when ingredientStatement is missing.
-        filter_text = product.get("_filter_text") or f"{product.get('name','')} {product.get('ingredients','')}"
-        if check_ingredients(filter_text, filters):
-            # Strip internal field before returning to client
-            if "_filter_text" in product:
-                del product["_filter_text"]
-            filtered_products.append(product)
-    
-    # Cache results for 5 minutes
-    product_cache[cache_key] = {
-        'products': filtered_products,
-        'total_found': len(products),
-        'filtered_count': len(filtered_products),
-        'store': store
-    }
-    cache_expiry[cache_key] = datetime.now() + timedelta(minutes=5)
+    location_id = str(data.get('location_id') or '').strip()
+    if not location_id:
+        try:
+            zip_code, lat, lon = _location_query(data)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        try:
+            nearest = _nearest_locations(zip_code, lat, lon, limit=1)
+        except Exception as e:
+            log.exception(f"Location lookup error: {e}")
+            return jsonify({'error': f'Location lookup failed: {str(e)}'}), 500
+        if not nearest:
+            return jsonify({'error': f'No store within {LOCATIONS_RADIUS_MILES:g} miles'}), 404
+        location_id = nearest[0][1]["locationId"]
+    else:
+        try:
+            location = _known_location(location_id)
+        except Exception as e:
+            log.exception(f"Location lookup error: {e}")
+            return jsonify({'error': f'Location lookup failed: {str(e)}'}), 500
+        if location is None:
+            return jsonify({'error': f'Unknown location_id: {location_id}'}), 400
     
-    return jsonify(product_cache[cache_key])
+    preferred_locations.set(user_id, location_id)
+    return jsonify({'location_id': location_id, 'location': location_index.get(location_id)})
 
 @app.route('/api/filters', methods=['GET'])
 def get_filters():
-    """Get user's current filters"""
+    """Get user's current filters (plus the profile and changes they come from)"""
     user_id = request.args.get('user_id', 'default')
-    filters = user_filters.get(user_id, DEFAULT_FILTERS.copy())
-    return jsonify({'filters': filters})
+    return jsonify(filter_store.describe(user_id))
 
 @app.route('/api/filters', methods=['POST'])
 def add_filter():
@@ -1719,16 +1817,17 @@ def add_filter():
     
     if not filter_term:
         return jsonify({'error': 'Filter term required'}), 400
+    try:
+        # "sodium < 300 mg" etc. are nutrient rules; a misspelled one shouldn't become an ingredient term.
+        parse_rule(filter_term)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
-    if user_id not in user_filters:
-        user_filters[user_id] = DEFAULT_FILTERS.copy()
-    
-    if filter_term.lower() not in [f.lower() for f in user_filters[user_id]]:
-        user_filters[user_id].append(filter_term)
-        _bump_filter_version(user_id)
-        _invalidate_user_cache(user_id)
-    
-    return jsonify({'filters': user_filters[user_id]})
+    # Duplicate check is case-insensitive; re-adding a removed profile term just restores it.
+    # Cached searches are not dropped: the next search derives the new filter set's results
+    # from the cached ones (see IndexedResults), without calling upstream.
+    filter_store.add(user_id, filter_term)
+    return jsonify(filter_store.describe(user_id))
 
 @app.route('/api/filters', methods=['DELETE'])
 def remove_filter():
@@ -1740,14 +1839,28 @@ def remove_filter():
     if not filter_term:
         return jsonify({'error': 'Filter term required'}), 400
     
-    if user_id in user_filters:
-        before = list(user_filters[user_id])
-        user_filters[user_id] = [f for f in user_filters[user_id] if f.lower() != filter_term.lower()]
-        if before != user_filters[user_id]:
-            _bump_filter_version(user_id)
-            _invalidate_user_cache(user_id)
+    filter_store.remove(user_id, filter_term)
+    return jsonify(filter_store.describe(user_id))
+
+@app.route('/api/profiles', methods=['GET'])
+def get_profiles():
+    """List the available filter profiles"""
+    return jsonify({'profiles': [
+        {'name': name, 'filters': list(terms)} for name, terms in FILTER_PROFILES.items()
+    ]})
+
+@app.route('/api/filters/profile', methods=['POST'])
+def set_filter_profile():
+    """Switch the user's filter profile (their own added filters are kept)"""
+    data = request.json
+    user_id = data.get('user_id', 'default')
+    profile = data.get('profile', '').strip()
+    
+    if profile not in FILTER_PROFILES:
+        return jsonify({'error': f'Unknown profile: {profile}. Available: {", ".join(FILTER_PROFILES)}'}), 400
     
-    return jsonify({'filters': user_filters.get(user_id, DEFAULT_FILTERS.copy())})
+    filter_store.set_profile(user_id, profile)
+    return jsonify(filter_store.describe(user_id))
 
 @app.route('/api/cart/add', methods=['POST'])
 def add_to_cart():
@@ -0,0 +1,8 @@
+"""
+Offline benchmarks for the Healthy Food Finder backend.
+
+Run from the backend/ directory:
+
+    python -m bench.run              # microbenchmarks against the local Kroger stand-in
+    python -m bench.kroger_stub      # just the stand-in server, for manual testing
+"""
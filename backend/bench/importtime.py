@@ -0,0 +1,64 @@
+"""
+Import-time profile of the backend (what a gunicorn worker pays at boot).
+
+    cd backend
+    python -m bench.importtime              # median of 15 runs + heaviest imports
+    python -m bench.importtime --runs 30 --top 20
+
+Each run is a fresh `python -X importtime -c "import app"` subprocess, so
+bytecode caches are warm but nothing else is shared. Reports the median
+cumulative time for `app`, the slowest top-level imports, and whether the
+scraping stack (selenium, bs4) was loaded.
+"""
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_LINE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+_SCRAPING = ("selenium", "webdriver_manager", "bs4", "lxml", "scraping")
+
+
+def profile_once(env):
+    out = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app"],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True,
+    ).stderr
+    modules = {}
+    for line in out.splitlines():
+        m = _LINE.match(line)
+        if m:
+            # Depth 1 = imported directly by app.py (or the interpreter's own startup).
+            depth = (len(m.group(3)) - 1) // 2
+            modules[m.group(4)] = (int(m.group(2)), depth)
+    return modules
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Backend import-time profile")
+    parser.add_argument("--runs", type=int, default=15)
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args(argv)
+
+    env = dict(os.environ, LOG_LEVEL="ERROR", FILTER_DB_PATH=":memory:", LOCAL_INDEX_PATH=":memory:",
+               PRICE_HISTORY_PATH=":memory:")
+    profile_once(env)  # warm the bytecode cache
+    runs = [profile_once(env) for _ in range(args.runs)]
+    totals = [r["app"][0] for r in runs if "app" in r]
+    print(f"import app: median {statistics.median(totals) / 1000:.1f} ms over {len(totals)} runs "
+          f"(min {min(totals) / 1000:.1f} ms)")
+
+    last = runs[-1]
+    direct = sorted(((us, name) for name, (us, depth) in last.items() if depth == 1 and name != "app"), reverse=True)
+    print("slowest imports made by app.py (last run):")
+    for us, name in direct[:args.top]:
+        print(f"  {us / 1000:8.1f} ms  {name}")
+    loaded = [name for name in _SCRAPING if name in last]
+    print("scraping stack imported at startup:", ", ".join(loaded) if loaded else "no")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,370 @@
+"""
+Local stand-in for the Kroger token and product search endpoints.
+
+Serves deterministic, realistic-looking product payloads so the real
+`kroger_api_product_search` parsing path can be exercised without
+credentials. Supports latency injection, 403 `insufficient_scope` on the
+catalog v2 endpoint (forcing the v1 fallback) and periodic 429s. Requests with
+filter.locationId get location-specific prices and in-store availability;
+filter.productId (comma-separated) looks products up by ID.
+/v1/locations serves a synthetic, seeded set of stores spread over the
+continental US (filter.latLong.near or filter.zipCode.near + radiusInMiles);
+/v1/locations/<locationId> returns one of them (404 for unknown IDs).
+
+    python -m bench.kroger_stub --port 8099 --latency-ms 40
+
+then point the backend at it with the printed environment variables.
+"""
+import argparse
+import itertools
+import json
+import math
+import random
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+BRANDS = ["Kroger", "Simple Truth", "Private Selection", "Horizon", "Annie's", "Kellogg's",
+          "Nature's Own", "Lay's", "Dannon", "Tyson", "Oscar Mayer", "Chobani", "Barilla"]
+CATEGORIES = ["Dairy", "Bakery", "Snacks", "Meat & Seafood", "Pantry", "Frozen", "Beverages",
+              "Breakfast", "Deli", "Natural & Organic"]
+CLEAN_INGREDIENTS = ["water", "sea salt", "organic whole milk", "vitamin d3", "whole wheat flour",
+                     "cane sugar", "olive oil", "butter", "eggs", "yeast", "chicken", "oats",
+                     "tomatoes", "garlic", "cultured pasteurized milk", "honey", "rice",
+                     "black pepper", "vinegar", "almonds", "coconut oil", "avocado oil"]
+FLAGGED_INGREDIENTS = ["canola oil", "soybean oil", "high fructose corn syrup", "red 40",
+                       "artificial flavor", "sodium nitrite", "tbhq", "carrageenan",
+                       "vegetable oil", "polysorbate 80", "yellow 5", "monosodium glutamate"]
+DESCRIPTORS = ["Organic", "Whole", "Reduced Fat", "Original", "Family Size", "Classic", "Natural",
+               "Unsweetened", "Lightly Salted", "Homestyle", "Greek", "Grass-Fed"]
+
+
+def _rng_for(term, seed):
+    return random.Random(seed ^ zlib.crc32(term.lower().encode("utf-8")))
+
+
+def make_product(rng, term, index, flagged_ratio=0.35, ingredients_ratio=0.85):
+    """Build one Kroger Products API item for a search term."""
+    product_id = f"{rng.randrange(10**12):013d}"
+    brand = rng.choice(BRANDS)
+    name = f"{brand} {rng.choice(DESCRIPTORS)} {term.title()} {rng.choice(['', '12 oz', '1 gal', '16 oz', '6 ct'])}".strip()
+    ingredients = rng.sample(CLEAN_INGREDIENTS, rng.randint(3, 9))
+    if rng.random() < flagged_ratio:
+        ingredients.insert(rng.randrange(len(ingredients) + 1), rng.choice(FLAGGED_INGREDIENTS))
+    regular = round(rng.uniform(0.99, 14.99), 2)
+    item = {
+        "productId": product_id,
+        "upc": product_id,
+        "brand": brand,
+        "description": name,
+        "categories": rng.sample(CATEGORIES, rng.randint(1, 2)),
+        "productPageURI": f"/p/{name.lower().replace(' ', '-')}/{product_id}?cid=dis.api.tpi_products-api_20240521_b:all_c:p_t:",
+        "images": [{
+            "perspective": "front",
+            "featured": True,
+            "sizes": [{"size": s, "url": f"https://www.kroger.com/product/images/{s}/front/{product_id}"}
+                      for s in ("thumbnail", "small", "medium", "large", "xlarge")],
+        }],
+        "items": [{
+            "itemId": product_id,
+            "size": rng.choice(["12 oz", "1 gal", "16 oz", "6 ct", "32 fl oz"]),
+            "price": {"regular": regular, "promo": round(regular * 0.8, 2) if rng.random() < 0.2 else 0},
+            "fulfillment": {"curbside": True, "delivery": True, "inStore": True, "shipToHome": False},
+        }],
+    }
+    if rng.random() < ingredients_ratio:
+        item["nutritionInformation"] = [{
+            "ingredientStatement": "INGREDIENTS: " + ", ".join(ingredients).upper() + ".",
+            "servingSize": {"quantity": 1, "unitOfMeasure": {"name": "Cup"}},
+            "nutrients": make_nutrients(product_id),
+        }]
+    return item
+
+
+def make_nutrients(product_id):
+    """A nutrition panel (Products API `nutrients` shape) for a product; own RNG, so the catalog is unchanged."""
+    rng = random.Random(int(product_id))
+    grams = {"g": ("GRM", "Grams"), "mg": ("MGM", "Milligrams")}
+
+    def nutrient(name, quantity, unit):
+        if unit == "kcal":
+            measure = {"abbreviation": "kcal", "code": "E14", "name": "Calorie"}
+        else:
+            measure = {"abbreviation": unit, "code": grams[unit][0], "name": grams[unit][1]}
+        return {"code": name.upper().replace(" ", "_"), "displayName": name, "description": name,
+                "quantity": quantity, "unitOfMeasure": measure}
+
+    sugar = round(rng.uniform(0, 24), 1)
+    return [
+        nutrient("Calories", rng.randrange(20, 400), "kcal"),
+        nutrient("Total Fat", round(rng.uniform(0, 20), 1), "g"),
+        nutrient("Saturated Fat", round(rng.uniform(0, 8), 1), "g"),
+        nutrient("Sodium", rng.randrange(0, 900, 5), "mg"),
+        nutrient("Total Carbohydrate", round(sugar + rng.uniform(0, 30), 1), "g"),
+        nutrient("Dietary Fiber", round(rng.uniform(0, 8), 1), "g"),
+        nutrient("Total Sugars", sugar, "g"),
+        nutrient("Includes Added Sugars", round(sugar * rng.random(), 1), "g"),
+        nutrient("Protein", round(rng.uniform(0, 30), 1), "g"),
+    ]
+
+
+def search_catalog(term, start=0, limit=20, seed=1234, total=250):
+    """Deterministic result page for a term; the same (term, seed) always yields the same products."""
+    rng = _rng_for(term, seed)
+    products = [make_product(rng, term, i) for i in range(min(total, start + limit))]
+    return products[start:start + limit]
+
+
+def catalog_by_id(product_ids, seed=1234):
+    """Items for a productId lookup; only 13-digit IDs exist (anything else is unknown to the stub)."""
+    items = []
+    for pid in product_ids:
+        if len(pid) != 13 or not pid.isdigit():
+            continue
+        item = make_product(_rng_for(pid, seed), "item", 0)
+        item["productId"] = item["upc"] = item["items"][0]["itemId"] = pid
+        items.append(item)
+    return items
+
+
+def localize(items, location_id, seed=1234):
+    """Per-store view of a result page: prices and in-store availability vary by location."""
+    for item in items:
+        rng = random.Random(seed ^ zlib.crc32(f"{location_id}:{item['productId']}".encode("utf-8")))
+        for sku in item.get("items", []):
+            price = sku["price"]
+            price["regular"] = round(price["regular"] * rng.uniform(0.85, 1.15), 2)
+            price["promo"] = round(price["regular"] * 0.8, 2) if rng.random() < 0.2 else 0
+            sku["fulfillment"]["inStore"] = rng.random() < 0.9
+    return items
+
+
+def make_locations(n=2700, seed=1234):
+    """Deterministic Kroger Locations API objects scattered over the continental US."""
+    rng = random.Random(seed)
+    chains = ["KROGER", "RALPHS", "FRED MEYER", "KING SOOPERS", "SMITHS", "FRYS", "HARRIS TEETER"]
+    locations = []
+    for i in range(n):
+        lat, lon = round(rng.uniform(25.5, 48.5), 6), round(rng.uniform(-123.5, -70.5), 6)
+        # ZIPs roughly follow longitude (east = low, west = high) so nearby stores share prefixes.
+        zip_code = f"{int((-70 - lon) / 54 * 89999) + 10000:05d}"[:3] + f"{rng.randrange(100):02d}"
+        locations.append({
+            "locationId": f"{700 + i // 1000:03d}{i % 1000:05d}",
+            "chain": rng.choice(chains),
+            "name": f"Store #{i}",
+            "address": {"addressLine1": f"{rng.randint(100, 9999)} Main St", "city": "Springfield",
+                        "state": "OH", "zipCode": zip_code},
+            "geolocation": {"latitude": lat, "longitude": lon, "latLng": f"{lat},{lon}"},
+        })
+    return locations
+
+
+def _miles(lat1, lon1, lat2, lon2):
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    a = (math.sin((p2 - p1) / 2) ** 2
+         + math.cos(p1) * math.cos(p2) * math.sin(math.radians(lon2 - lon1) / 2) ** 2)
+    return 2 * 3958.8 * math.asin(min(1.0, math.sqrt(a)))
+
+
+class StubConfig:
+    def __init__(self, latency_ms=0.0, jitter_ms=0.0, v2_insufficient_scope=False,
+                 rate_limit_every=0, token_expires_in=1800, seed=1234):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.v2_insufficient_scope = v2_insufficient_scope
+        # Return 429 for every Nth product request (0 disables).
+        self.rate_limit_every = rate_limit_every
+        self.token_expires_in = token_expires_in
+        self.seed = seed
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server_version = "KrogerStub/1.0"
+
+    def log_message(self, fmt, *args):  # keep benchmark output clean
+        pass
+
+    def _send_json(self, status, body, headers=None):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _sleep(self):
+        cfg = self.server.config
+        delay = cfg.latency_ms + (random.uniform(0, cfg.jitter_ms) if cfg.jitter_ms else 0.0)
+        if delay > 0:
+            time.sleep(delay / 1000.0)
+
+    def do_POST(self):
+        stats = self.server.stats
+        if urlparse(self.path).path != "/v1/connect/oauth2/token":
+            return self._send_json(404, {"error": "not_found"})
+        length = int(self.headers.get("Content-Length") or 0)
+        self.rfile.read(length)
+        stats["token"] += 1
+        self._sleep()
+        self._send_json(200, {
+            "access_token": f"stub-token-{stats['token']}",
+            "token_type": "bearer",
+            "expires_in": self.server.config.token_expires_in,
+        })
+
+    def do_GET(self):
+        cfg = self.server.config
+        stats = self.server.stats
+        parsed = urlparse(self.path)
+        if parsed.path == "/v1/locations":
+            return self._locations(parse_qs(parsed.query))
+        if parsed.path.startswith("/v1/locations/"):
+            return self._location(parsed.path.rsplit("/", 1)[1])
+        if parsed.path not in ("/catalog/v2/products", "/v1/products"):
+            return self._send_json(404, {"error": "not_found"})
+        if not self.headers.get("Authorization", "").startswith("Bearer "):
+            return self._send_json(401, {"error": "invalid_token"})
+
+        n = next(self.server.request_counter)
+        self._sleep()
+        if cfg.rate_limit_every and n % cfg.rate_limit_every == 0:
+            stats["429"] += 1
+            return self._send_json(429, {"errors": {"reason": "Too Many Requests"}}, {"Retry-After": "1"})
+        if parsed.path == "/catalog/v2/products" and cfg.v2_insufficient_scope:
+            stats["403"] += 1
+            return self._send_json(403, {"error": "insufficient_scope",
+                                         "error_description": "The token does not have the required scope"})
+
+        qs = parse_qs(parsed.query)
+        if qs.get("filter.productId"):
+            stats["by_id"] += 1
+            data = catalog_by_id(qs["filter.productId"][0].split(","), seed=cfg.seed)
+            return self._send_json(200, {"data": data, "meta": {}})
+        term = (qs.get("filter.term") or [""])[0]
+        limit = int((qs.get("filter.limit") or ["10"])[0])
+        start = int((qs.get("filter.start") or ["0"])[0])
+        stats[parsed.path] += 1
+        data = search_catalog(term, start, limit, seed=cfg.seed)
+        location_id = (qs.get("filter.locationId") or [""])[0]
+        if location_id:
+            stats["localized"] += 1
+            data = localize(data, location_id, seed=cfg.seed)
+        self._send_json(200, {"data": data, "meta": {"pagination": {"start": start, "limit": limit, "total": 250}}})
+
+    def _locations(self, qs):
+        if not self.headers.get("Authorization", "").startswith("Bearer "):
+            return self._send_json(401, {"error": "invalid_token"})
+        self._sleep()
+        self.server.stats["/v1/locations"] += 1
+        stores = self.server.locations
+        radius = float((qs.get("filter.radiusInMiles") or ["10"])[0])
+        limit = int((qs.get("filter.limit") or ["10"])[0])
+        if qs.get("filter.latLong.near"):
+            lat, lon = (float(v) for v in qs["filter.latLong.near"][0].split(","))
+        else:
+            zip_code = (qs.get("filter.zipCode.near") or [""])[0]
+            same = [s["geolocation"] for s in stores if s["address"]["zipCode"] == zip_code]
+            if not same:
+                return self._send_json(200, {"data": [], "meta": {}})
+            lat, lon = same[0]["latitude"], same[0]["longitude"]
+        ranked = sorted(
+            ((_miles(lat, lon, s["geolocation"]["latitude"], s["geolocation"]["longitude"]), s) for s in stores),
+            key=lambda pair: pair[0],
+        )
+        data = [s for d, s in ranked if d <= radius][:limit]
+        self._send_json(200, {"data": data, "meta": {}})
+
+
+    def _location(self, location_id):
+        if not self.headers.get("Authorization", "").startswith("Bearer "):
+            return self._send_json(401, {"error": "invalid_token"})
+        self._sleep()
+        self.server.stats["/v1/locations"] += 1
+        found = next((s for s in self.server.locations if s["locationId"] == location_id), None)
+        if found is None:
+            return self._send_json(404, {"errors": {"reason": "Location not found"}})
+        self._send_json(200, {"data": found, "meta": {}})
+
+
+class KrogerStub:
+    """Run the stand-in server on a background thread (usable as a context manager)."""
+
+    def __init__(self, config=None, host="127.0.0.1", port=0):
+        self.config = config or StubConfig()
+        self.server = ThreadingHTTPServer((host, port), _Handler)
+        self.server.daemon_threads = True
+        self.server.config = self.config
+        self.server.stats = {"token": 0, "403": 0, "429": 0, "/catalog/v2/products": 0, "/v1/products": 0,
+                             "localized": 0, "/v1/locations": 0, "by_id": 0}
+        self.server.locations = make_locations(seed=self.config.seed)
+        self.server.request_counter = itertools.count(1)
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def stats(self):
+        return self.server.stats
+
+    def env(self):
+        """Environment variables that point backend/app.py at this stub."""
+        return {
+            "KROGER_CLIENT_ID": "bench-client",
+            "KROGER_CLIENT_SECRET": "bench-secret",
+            "KROGER_TOKEN_URL": f"{self.url}/v1/connect/oauth2/token",
+            "KROGER_API_BASE_URL": self.url,
+            "KROGER_PRODUCTS_PATH": "/catalog/v2/products",
+            "KROGER_LEGACY_API_BASE_URL": f"{self.url}/v1",
+            "KROGER_LEGACY_PRODUCTS_PATH": "/products",
+        }
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, name="kroger-stub", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+        return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local Kroger API stand-in")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--v2-insufficient-scope", action="store_true",
+                        help="answer catalog v2 with 403 insufficient_scope (forces the v1 fallback)")
+    parser.add_argument("--rate-limit-every", type=int, default=0, help="return 429 for every Nth product request")
+    parser.add_argument("--seed", type=int, default=1234)
+    args = parser.parse_args()
+
+    stub = KrogerStub(StubConfig(args.latency_ms, args.jitter_ms, args.v2_insufficient_scope,
+                                 args.rate_limit_every, seed=args.seed), args.host, args.port)
+    for k, v in stub.env().items():
+        print(f"export {k}={v}")
+    try:
+        stub.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stub.server.server_close()
+
+
+if __name__ == "__main__":
+    main()
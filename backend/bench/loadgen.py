@@ -0,0 +1,343 @@
+"""
+Load generator that replays realistic /api/search traffic.
+
+Queries follow a Zipf distribution over a fixed vocabulary, spread across many
+simulated user_ids. Each user gets its own filter list (defaults, or defaults
+plus a few custom terms). The upstream is always the local Kroger stand-in.
+
+    cd backend
+    python -m bench.loadgen --mode inprocess --duration 30 --concurrency 16
+    python -m bench.loadgen --mode gunicorn --workers 4 --duration 60
+    python -m bench.loadgen --url http://127.0.0.1:5000 --duration 30   # already running
+
+Reports throughput, p50/p95/p99 latency, the cache hit ratio (derived from
+upstream calls seen by the stub, so it is correct across gunicorn workers) and
+server RSS over time, which shows whether the caches keep growing.
+
+With --query-noise, a share of queries is sent the way people type them
+("Milk", "milk ", "MILK!", "whole  milk") and the report compares distinct
+query keys as typed vs. after canonicalization.
+"""
+import argparse
+import logging
+import os
+import random
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+
+from bench.kroger_stub import KrogerStub, StubConfig
+from bench.stats import summarize
+from queries import canonicalize_query
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+VOCABULARY = [
+    "milk", "eggs", "bread", "bananas", "chicken breast", "ground beef", "yogurt", "cheese",
+    "butter", "apples", "orange juice", "cereal", "coffee", "rice", "pasta", "tomatoes",
+    "potatoes", "onions", "peanut butter", "chips", "salsa", "tortillas", "bacon", "salmon",
+    "spinach", "strawberries", "ice cream", "frozen pizza", "granola", "almond milk", "oatmeal",
+    "crackers", "hummus", "avocado", "lettuce", "carrots", "broccoli", "grapes", "honey",
+    "olive oil", "sparkling water", "soda", "cookies", "bagels", "cream cheese", "sour cream",
+    "mayonnaise", "ketchup", "mustard", "pickles", "hot dogs", "deli turkey", "ham", "tofu",
+    "black beans", "chickpeas", "lentils", "quinoa", "flour", "sugar",
+]
+CUSTOM_FILTERS = ["gluten", "dairy", "peanut", "soy lecithin", "maltodextrin", "dextrose",
+                  "natural flavors", "xanthan gum", "sucralose", "aspartame", "gelatin", "corn starch"]
+
+
+def noisy_query(query, rng):
+    """The same search as a person might type it: case, spacing and punctuation variations."""
+    variant = rng.choice([str.title, str.upper, str.lower, str.capitalize])(query)
+    if rng.random() < 0.3:
+        variant = variant.replace(" ", "  ")
+    if rng.random() < 0.3:
+        variant += rng.choice([" ", "!", ".", " ?"])
+    if rng.random() < 0.2:
+        variant = " " + variant
+    return variant
+
+
+class ZipfSampler:
+    def __init__(self, items, s=1.1, rng=None):
+        self.items = list(items)
+        self.rng = rng or random.Random()
+        weights = [1.0 / (rank ** s) for rank in range(1, len(self.items) + 1)]
+        total = 0.0
+        self.cum_weights = []
+        for w in weights:
+            total += w
+            self.cum_weights.append(total)
+
+    def sample(self):
+        return self.rng.choices(self.items, cum_weights=self.cum_weights, k=1)[0]
+
+
+def _rss_bytes(pid):
+    try:
+        with open(f"/proc/{pid}/status") as fh:
+            for line in fh:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return 0
+
+
+def _process_tree(pid):
+    pids = [pid]
+    try:
+        for task in os.listdir(f"/proc/{pid}/task"):
+            with open(f"/proc/{pid}/task/{task}/children") as fh:
+                for child in fh.read().split():
+                    pids.extend(_process_tree(int(child)))
+    except OSError:
+        pass
+    return pids
+
+
+def tree_rss_bytes(pid):
+    """RSS of a process and all of its descendants (gunicorn master + workers)."""
+    return sum(_rss_bytes(p) for p in _process_tree(pid))
+
+
+class InProcessServer:
+    """Serve backend/app.py from this process on a real socket (threaded werkzeug server)."""
+
+    def __init__(self, env):
+        os.environ.update(env)
+        os.environ.setdefault("LOG_LEVEL", "WARNING")
+        os.environ.setdefault("FILTER_DB_PATH", ":memory:")
+        os.environ.setdefault("LOCAL_INDEX_PATH", ":memory:")
+        os.environ.setdefault("PRICE_HISTORY_PATH", ":memory:")
+        if BACKEND_DIR not in sys.path:
+            sys.path.insert(0, BACKEND_DIR)
+        import app as backend_app
+        from werkzeug.serving import make_server
+
+        self.app_module = backend_app
+        # werkzeug logs every request at INFO unless its logger already has a level.
+        logging.getLogger("werkzeug").setLevel(os.environ["LOG_LEVEL"])
+        self.server = make_server("127.0.0.1", 0, backend_app.app, threaded=True)
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        self.pid = os.getpid()
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+
+    def cache_entries(self):
+        return len(self.app_module.product_cache)
+
+
+class GunicornServer:
+    def __init__(self, env, workers, port):
+        self.port = port
+        self.url = f"http://127.0.0.1:{port}"
+        # Workers share throwaway filter / product databases, like a real deployment.
+        self.db_dir = tempfile.mkdtemp(prefix="hff-loadgen-")
+        self.env = dict(os.environ, LOG_LEVEL="WARNING", FILTER_DB_PATH=os.path.join(self.db_dir, "filters.db"),
+                        LOCAL_INDEX_PATH=os.path.join(self.db_dir, "products.db"),
+                        PRICE_HISTORY_PATH=os.path.join(self.db_dir, "prices.db"), **env)
+        self.workers = workers
+        self.proc = None
+
+    @property
+    def pid(self):
+        return self.proc.pid
+
+    def start(self):
+        cmd = [sys.executable, "-m", "gunicorn", "app:app", "--bind", f"127.0.0.1:{self.port}",
+               "--workers", str(self.workers), "--threads", "4", "--log-level", "warning"]
+        self.proc = subprocess.Popen(cmd, cwd=BACKEND_DIR, env=self.env)
+        deadline = time.time() + 30
+        while time.time() < deadline:
+            try:
+                if requests.get(f"{self.url}/api/health", timeout=1).ok:
+                    return self
+            except requests.RequestException:
+                time.sleep(0.2)
+        self.stop()
+        raise RuntimeError("gunicorn did not become healthy within 30s")
+
+    def stop(self):
+        if self.proc and self.proc.poll() is None:
+            self.proc.send_signal(signal.SIGTERM)
+            try:
+                self.proc.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                self.proc.kill()
+        shutil.rmtree(self.db_dir, ignore_errors=True)
+
+    def cache_entries(self):
+        return None
+
+
+class ExternalServer:
+    def __init__(self, url):
+        self.url = url.rstrip("/")
+        self.pid = None
+
+    def start(self):
+        return self
+
+    def stop(self):
+        pass
+
+    def cache_entries(self):
+        return None
+
+
+def setup_users(base_url, n_users, custom_ratio, rng):
+    """Give a share of the simulated users their own filter additions."""
+    users = [f"load-user-{i}" for i in range(n_users)]
+    session = requests.Session()
+    for user_id in users:
+        if rng.random() < custom_ratio:
+            for term in rng.sample(CUSTOM_FILTERS, rng.randint(1, 3)):
+                session.post(f"{base_url}/api/filters", json={"user_id": user_id, "filter": term}, timeout=10)
+    return users
+
+
+def run_load(base_url, users, args, server, stub):
+    sampler_seed = random.Random(args.seed)
+    stop_at = time.time() + args.duration
+    lock = threading.Lock()
+    latencies = []
+    errors = [0]
+    timeline = []
+    sent = set()
+
+    def worker(worker_id):
+        rng = random.Random(sampler_seed.random() + worker_id)
+        sampler = ZipfSampler(VOCABULARY, args.zipf_s, rng)
+        user_sampler = ZipfSampler(users, 0.8, rng)
+        session = requests.Session()
+        while time.time() < stop_at:
+            query = sampler.sample()
+            if args.query_noise and rng.random() < args.query_noise:
+                query = noisy_query(query, rng)
+            body = {"query": query, "user_id": user_sampler.sample(), "store": "kroger"}
+            start = time.perf_counter()
+            try:
+                resp = session.post(f"{base_url}/api/search", json=body, timeout=30)
+                ok = resp.status_code == 200
+            except requests.RequestException:
+                ok = False
+            elapsed = time.perf_counter() - start
+            with lock:
+                sent.add(query)
+                if ok:
+                    latencies.append(elapsed)
+                else:
+                    errors[0] += 1
+
+    threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(args.concurrency)]
+    wall_start = time.time()
+    for t in threads:
+        t.start()
+
+    # Sample throughput / memory while the workers run.
+    last_count = 0
+    while any(t.is_alive() for t in threads):
+        time.sleep(args.sample_interval)
+        with lock:
+            count = len(latencies)
+        elapsed = time.time() - wall_start
+        rss = tree_rss_bytes(server.pid) if server.pid else 0
+        timeline.append({
+            "t_s": round(elapsed, 1),
+            "requests": count,
+            "rps": round((count - last_count) / args.sample_interval, 1),
+            "rss_mb": round(rss / 1e6, 1),
+            "cache_entries": server.cache_entries(),
+            "upstream_calls": stub.stats["/catalog/v2/products"] + stub.stats["/v1/products"],
+        })
+        last_count = count
+    for t in threads:
+        t.join()
+    wall = time.time() - wall_start
+
+    summary = summarize(latencies, wall)
+    upstream = stub.stats["/catalog/v2/products"] + stub.stats["/v1/products"]
+    total = len(latencies) + errors[0]
+    summary.update({
+        "errors": errors[0],
+        "upstream_calls": upstream,
+        "cache_hit_ratio": round(1 - upstream / total, 4) if total else 0.0,
+        "query_keys_raw": len(sent),
+        "query_keys_canonical": len({canonicalize_query(q) for q in sent}),
+        "timeline": timeline,
+    })
+    return summary
+
+
+def print_report(summary):
+    print(f"\nrequests={summary['n']} errors={summary['errors']} throughput={summary['ops_per_s']} req/s")
+    print(f"latency p50={summary['p50_ms']}ms p95={summary['p95_ms']}ms p99={summary['p99_ms']}ms max={summary['max_ms']}ms")
+    print(f"upstream calls={summary['upstream_calls']} cache hit ratio={summary['cache_hit_ratio']:.2%}")
+    print(f"distinct query keys: as typed={summary['query_keys_raw']} canonical={summary['query_keys_canonical']}")
+    print(f"\n{'t(s)':>6} {'requests':>9} {'req/s':>8} {'rss MB':>8} {'cache':>7} {'upstream':>9}")
+    for row in summary["timeline"]:
+        cache = "-" if row["cache_entries"] is None else row["cache_entries"]
+        print(f"{row['t_s']:>6} {row['requests']:>9} {row['rps']:>8} {row['rss_mb']:>8} {cache:>7} {row['upstream_calls']:>9}")
+    tl = summary["timeline"]
+    if len(tl) >= 4 and tl[0]["rss_mb"]:
+        half = tl[len(tl) // 2]["rss_mb"]
+        print(f"\nRSS growth over second half of run: {tl[-1]['rss_mb'] - half:+.1f} MB")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay Zipf-distributed /api/search traffic")
+    parser.add_argument("--mode", choices=["inprocess", "gunicorn"], default="inprocess")
+    parser.add_argument("--url", help="target an already-running server instead (its upstream must be the stub)")
+    parser.add_argument("--workers", type=int, default=2, help="gunicorn workers")
+    parser.add_argument("--port", type=int, default=5055, help="gunicorn port")
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds")
+    parser.add_argument("--concurrency", type=int, default=8, help="concurrent simulated clients")
+    parser.add_argument("--users", type=int, default=500, help="distinct user_ids")
+    parser.add_argument("--custom-filter-ratio", type=float, default=0.3, help="share of users with custom filters")
+    parser.add_argument("--query-noise", type=float, default=0.0,
+                        help="share of queries sent with case/spacing/punctuation variations")
+    parser.add_argument("--zipf-s", type=float, default=1.1, help="query popularity skew")
+    parser.add_argument("--latency-ms", type=float, default=60.0, help="stubbed upstream latency")
+    parser.add_argument("--jitter-ms", type=float, default=40.0)
+    parser.add_argument("--sample-interval", type=float, default=2.0)
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--json", help="also write the report to this file")
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    with KrogerStub(StubConfig(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, seed=args.seed)) as stub:
+        if args.url:
+            server = ExternalServer(args.url)
+        elif args.mode == "gunicorn":
+            server = GunicornServer(stub.env(), args.workers, args.port)
+        else:
+            server = InProcessServer(stub.env())
+        server.start()
+        try:
+            users = setup_users(server.url, args.users, args.custom_filter_ratio, rng)
+            summary = run_load(server.url, users, args, server, stub)
+        finally:
+            server.stop()
+
+    print_report(summary)
+    if args.json:
+        import json
+        with open(args.json, "w") as fh:
+            json.dump({"args": vars(args), "results": summary}, fh, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,513 @@
+"""
+Reproducible offline benchmarks for the search pipeline.
+
+    cd backend
+    python -m bench.run                         # all benchmarks
+    python -m bench.run --only extract,filter   # a subset
+    python -m bench.run --latency-ms 40 --json bench_output.json
+
+Everything runs against bench.kroger_stub and the HTML pages in
+bench/fixtures/ (drop additional saved Kroger search pages there to extend
+the corpus), so no Kroger credentials or browser are needed. Inputs are
+seeded, so two runs on the same machine are directly comparable.
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+
+from bench.kroger_stub import KrogerStub, StubConfig, make_locations, search_catalog
+from bench.stats import format_row, summarize
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures")
+QUERIES = ["milk", "bread", "chips", "yogurt", "chicken breast", "peanut butter", "cereal",
+           "orange juice", "eggs", "pasta sauce", "crackers", "ice cream"]
+
+
+def _timed(fn, iterations, warmup=2):
+    for _ in range(warmup):
+        fn()
+    latencies = []
+    wall_start = time.perf_counter()
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - start)
+    return latencies, time.perf_counter() - wall_start
+
+
+def matched_filters(text, filters):
+    """Filter terms found in a text, term by term with app.check_ingredients' rules (batch_filter's reference)."""
+    from filtering import normalize_text
+
+    if not text:
+        return []
+    normalized = normalize_text(text)
+    return [f for f in filters if normalize_text(f) in normalized]
+
+
+def load_fixture_pages():
+    pages = []
+    for path in sorted(glob.glob(os.path.join(FIXTURES_DIR, "*.html"))):
+        with open(path, encoding="utf-8") as fh:
+            pages.append((os.path.basename(path), fh.read()))
+    return pages
+
+
+def product_corpus(app, n, seed=1234):
+    """n API-shaped products pushed through the real item->product conversion."""
+    items = []
+    i = 0
+    while len(items) < n:
+        items.extend(search_catalog(f"{QUERIES[i % len(QUERIES)]} {i}", 0, 50, seed=seed))
+        i += 1
+    return app._kroger_api_items_to_products(items[:n], n)
+
+
+def bench_filter(app, args, results):
+    products = product_corpus(app, args.corpus_size)
+    texts = [p["_filter_text"] for p in products]
+    filters = list(app.DEFAULT_FILTERS)
+
+    def run():
+        for text in texts:
+            app.check_ingredients(text, filters)
+
+    latencies, wall = _timed(run, args.iterations)
+    results["check_ingredients"] = summarize(latencies, wall, ops=len(texts) * len(latencies))
+
+
+def bench_batch_filter(app, args, results):
+    """check_ingredients loop vs. filtering.batch_filter at 10k and 100k products."""
+    import filtering
+
+    filters = list(app.DEFAULT_FILTERS)
+    compiled = filtering.compile_filters(filters)
+    for size in args.batch_sizes:
+        products = product_corpus(app, size)
+        texts = [filtering.product_filter_text(p) for p in products]
+        iterations = max(3, args.iterations // 10)
+
+        expected = [matched_filters(t, filters) for t in texts]
+        mask, matched = filtering.batch_filter(products, compiled)
+        assert matched == expected and mask == [not m for m in expected], "batch_filter diverged from check_ingredients"
+
+        latencies, wall = _timed(lambda: [app.check_ingredients(t, filters) for t in texts], iterations, warmup=1)
+        results[f"check_ingredients loop[{size}]"] = summarize(latencies, wall, ops=size * iterations)
+        latencies, wall = _timed(lambda: filtering.batch_filter(products, compiled), iterations, warmup=1)
+        results[f"batch_filter[{size}]"] = summarize(latencies, wall, ops=size * iterations)
+        indexed = filtering.IndexedResults([dict(p) for p in products])
+        indexed.evaluate(compiled)
+        edits = iter(range(10**9))
+        indexed.max_views = 10**9  # keep every view, so each edit derives from the previous one
+        current = list(filters)
+
+        def edit():
+            # One filter added to the previous set: scan that term, patch the closest cached view.
+            current.append(f"additive {next(edits)}")
+            indexed.evaluate(filtering.compile_filters(current))
+
+        latencies, wall = _timed(edit, iterations, warmup=1)
+        results[f"IndexedResults add one filter[{size}]"] = summarize(latencies, wall, ops=size * iterations)
+
+        # Nutrient thresholds next to the ingredient terms: one pass for the batch, a bisection per
+        # rule on the indexed results (after the nutrient column is sorted once).
+        with_rules = filtering.compile_filters(filters + ["sodium < 300 mg", "added sugar <= 5 g", "protein >= 5 g"])
+        latencies, wall = _timed(lambda: filtering.batch_filter(products, with_rules), iterations, warmup=1)
+        results[f"batch_filter + 3 nutrient rules[{size}]"] = summarize(latencies, wall, ops=size * iterations)
+
+        def add_rule():
+            current.append(f"sodium < {600 + next(edits) % 300} mg")
+            indexed.evaluate(filtering.compile_filters(current))
+
+        latencies, wall = _timed(add_rule, iterations, warmup=1)
+        results[f"IndexedResults add one nutrient rule[{size}]"] = summarize(latencies, wall, ops=size * iterations)
+        if args.batch_workers > 1:
+            latencies, wall = _timed(lambda: filtering.batch_filter(products, compiled, workers=args.batch_workers),
+                                     iterations, warmup=1)
+            results[f"batch_filter[{size}, {args.batch_workers} procs]"] = summarize(latencies, wall, ops=size * iterations)
+
+
+def bench_extract(app, args, results):
+    pages = load_fixture_pages()
+    if not pages:
+        print(f"  (no fixtures in {FIXTURES_DIR}; skipping extraction benchmarks)")
+        return
+    for name, html in pages:
+        latencies, wall = _timed(lambda: app.scraper().extract_kroger_products(html, limit=50), args.iterations)
+        label = name.replace("kroger_search_", "").replace(".html", "")
+        results[f"extract_kroger_products[{label}]"] = summarize(latencies, wall)
+
+
+def _with_stub(app, config, fn):
+    with KrogerStub(config) as stub:
+        saved = {k: os.environ.get(k) for k in stub.env()}
+        os.environ.update(stub.env())
+        app._KROGER_TOKEN = None
+        app._KROGER_TOKEN_EXPIRY = None
+        try:
+            return fn(stub)
+        finally:
+            for k, v in saved.items():
+                if v is None:
+                    os.environ.pop(k, None)
+                else:
+                    os.environ[k] = v
+
+
+def bench_api(app, args, results):
+    scenarios = [
+        ("kroger_api_product_search[v2]", StubConfig(latency_ms=args.latency_ms, seed=args.seed)),
+        ("kroger_api_product_search[403->v1]", StubConfig(latency_ms=args.latency_ms, v2_insufficient_scope=True,
+                                                          seed=args.seed)),
+        ("kroger_api_product_search[429 1/5]", StubConfig(latency_ms=args.latency_ms, rate_limit_every=5,
+                                                          seed=args.seed)),
+    ]
+    for name, config in scenarios:
+        errors = [0]
+
+        def run_scenario(stub):
+            queries = iter(QUERIES * (args.iterations // len(QUERIES) + 2))
+
+            def call():
+                try:
+                    app.kroger_api_product_search(next(queries), limit=args.limit)
+                except Exception:
+                    errors[0] += 1
+
+            latencies, wall = _timed(call, args.iterations, warmup=1)
+            summary = summarize(latencies, wall)
+            summary["errors"] = errors[0]
+            summary["upstream"] = dict(stub.stats)
+            return summary
+
+        results[name] = _with_stub(app, config, run_scenario)
+
+
+def bench_search(app, args, results):
+    client = app.app.test_client()
+
+    def run_scenario(stub):
+        counter = [0]
+
+        def cold():
+            # A distinct query each time -> cache miss, full upstream + filter path.
+            counter[0] += 1
+            resp = client.post("/api/search", json={"query": f"milk {counter[0]}", "user_id": "bench"})
+            assert resp.status_code == 200, resp.data[:200]
+
+        def warm():
+            resp = client.post("/api/search", json={"query": "milk", "user_id": "bench"})
+            assert resp.status_code == 200, resp.data[:200]
+
+        def warm_gzip():
+            resp = client.post("/api/search", json={"query": "milk", "user_id": "bench"},
+                               headers={"Accept-Encoding": "gzip"})
+            assert resp.status_code == 200, resp.data[:200]
+
+        def refilter():
+            # A filter edit -> new filter set for a cached query, answered from the term index.
+            counter[0] += 1
+            client.post("/api/filters", json={"user_id": "bench-edit", "filter": f"additive {counter[0]}"})
+            resp = client.post("/api/search", json={"query": "milk", "user_id": "bench-edit"})
+            assert resp.status_code == 200, resp.data[:200]
+
+        out = {}
+        latencies, wall = _timed(cold, args.iterations)
+        out["search_products[cold]"] = summarize(latencies, wall)
+        latencies, wall = _timed(warm, args.iterations * 5)
+        out["search_products[warm]"] = summarize(latencies, wall)
+        out["search_products[warm]"]["bytes"] = len(client.post("/api/search", json={"query": "milk", "user_id": "bench"}).data)
+        latencies, wall = _timed(warm_gzip, args.iterations * 5)
+        out["search_products[warm, gzip]"] = summarize(latencies, wall)
+        out["search_products[warm, gzip]"]["bytes"] = len(client.post(
+            "/api/search", json={"query": "milk", "user_id": "bench"}, headers={"Accept-Encoding": "gzip"}).data)
+        upstream_before = stub.stats["/catalog/v2/products"]
+        latencies, wall = _timed(refilter, args.iterations)
+        out["search_products[filter edit + search]"] = summarize(latencies, wall)
+        assert stub.stats["/catalog/v2/products"] == upstream_before, "filter edit triggered an upstream search"
+
+        def local():
+            # Uncached query whose words the local FTS index has seen plenty of ("milk").
+            counter[0] += 1
+            resp = client.post("/api/search", json={"query": f"whole milk {counter[0] % 2 and 'organic' or ''}",
+                                                    "user_id": f"bench-local-{counter[0]}"})
+            assert resp.status_code == 200, resp.data[:200]
+            app.results_cache.clear()
+            app.product_cache.clear()
+
+        def locations(n):
+            def call():
+                # Distinct query each time so every location goes upstream.
+                counter[0] += 1
+                resp = client.post("/api/search", json={"query": f"yogurt {counter[0]}",
+                                                        "location_ids": [f"0140{i:04d}" for i in range(n)]})
+                assert resp.status_code == 200, resp.data[:200]
+            return call
+
+        for n in (1, 5):
+            latencies, wall = _timed(locations(n), args.iterations)
+            out[f"search_products[{n} location{'s' if n > 1 else ''}]"] = summarize(latencies, wall)
+
+        def details(cached):
+            def call():
+                counter[0] += 1
+                ids = [f"{counter[0] if not cached else 0:06d}{i:07d}" for i in range(100)]
+                resp = client.post("/api/products/details", json={"product_ids": ids})
+                assert resp.status_code == 200 and not resp.json["missing"], resp.data[:200]
+            return call
+
+        by_id_before = stub.stats["by_id"]
+        latencies, wall = _timed(details(False), args.iterations)
+        out["products_details[100 ids, api]"] = summarize(latencies, wall)
+        out["products_details[100 ids, api]"]["upstream"] = stub.stats["by_id"] - by_id_before
+        latencies, wall = _timed(details(True), args.iterations)
+        out["products_details[100 ids, cached]"] = summarize(latencies, wall)
+
+        saved = os.environ.get("LOCAL_SEARCH_MIN_RESULTS")
+        os.environ["LOCAL_SEARCH_MIN_RESULTS"] = "5"
+        try:
+            upstream_before = stub.stats["/catalog/v2/products"]
+            latencies, wall = _timed(local, args.iterations)
+            out["search_products[local index]"] = summarize(latencies, wall)
+            out["search_products[local index]"]["upstream"] = stub.stats["/catalog/v2/products"] - upstream_before
+        finally:
+            os.environ["LOCAL_SEARCH_MIN_RESULTS"] = saved
+
+        def next_pages(pause_s):
+            # A fresh search paged through like a scrolling client; each next page is timed. With a
+            # pause the upstream page prefetched near the end of the cache has landed by the time it's
+            # needed; without one the request waits for it.
+            latencies = []
+            for _ in range(args.iterations):
+                counter[0] += 1
+                resp = client.post("/api/search", json={"query": f"cereal {counter[0]}", "user_id": "bench",
+                                                        "page_size": 10, "compact": True})
+                cursor = resp.json["next_cursor"]
+                for _ in range(8):
+                    time.sleep(pause_s)
+                    start = time.perf_counter()
+                    resp = client.post("/api/search", json={"cursor": cursor, "compact": True})
+                    latencies.append(time.perf_counter() - start)
+                    assert resp.status_code == 200, resp.data[:200]
+                    cursor = resp.json["next_cursor"]
+            return latencies, sum(latencies)
+
+        pause = 2 * args.latency_ms / 1000 + 0.01
+        out["search_products[next page, prefetched]"] = summarize(*next_pages(pause))
+        out["search_products[next page, no pause]"] = summarize(*next_pages(0))
+        return out
+
+    results.update(_with_stub(app, StubConfig(latency_ms=args.latency_ms, seed=args.seed), run_scenario))
+
+
+def bench_payload(app, args, results):
+    """First-serve encoding cost and size of a deep search response: all fields vs. compact vs. fields=."""
+    from responses import EncodedBody
+
+    products = product_corpus(app, args.corpus_size)
+    for p in products:
+        p.pop("_filter_text", None)
+    entry = {"products": products, "total_found": len(products), "filtered_count": len(products),
+             "store": "kroger", "query": "bench", "source": "kroger", "hidden": []}
+    for label, fields in (("full", None), ("compact", app.COMPACT_FIELDS), ("fields=name,price", ("name", "price"))):
+        body = EncodedBody(app._search_response(entry, False, fields))
+        latencies, wall = _timed(lambda: EncodedBody(app._search_response(entry, False, fields)), args.iterations)
+        name = f"encode search response[{label}, {len(products)} products]"
+        results[name] = summarize(latencies, wall)
+        results[name]["bytes"] = len(body)
+        results[name]["gzip_bytes"] = len(body.gzip or body.identity)
+
+    # Price sort / max_price over the same cached entry: the first request sorts, later ones
+    # (other limits, other views) reuse the order and cut it with a bisection.
+    it = iter(range(10**9))
+
+    def first_sort():
+        entry.pop('_orders', None)
+        app._ordered_products(entry, "price", 300 + next(it) % 500)
+
+    def sorted_again():
+        app._ordered_products(entry, "price", 300 + next(it) % 500)
+
+    latencies, wall = _timed(first_sort, args.iterations)
+    results[f"sort=price&max_price[first, {len(products)} products]"] = summarize(latencies, wall)
+    latencies, wall = _timed(sorted_again, args.iterations * 5)
+    results[f"sort=price&max_price[cached order, {len(products)} products]"] = summarize(latencies, wall)
+
+
+def bench_locations(app, args, results):
+    """Nearest-store lookups: grid index vs. a scan of every store, and /api/locations end to end."""
+    import random
+    from locations import LocationIndex, haversine_miles, location_from_api
+
+    stores = [location_from_api(o) for o in make_locations(seed=args.seed)]
+    index = LocationIndex()
+    index.add(stores)
+    rng = random.Random(args.seed)
+    points = [(rng.uniform(26, 48), rng.uniform(-123, -71)) for _ in range(1000)]
+    it = iter(range(10**9))
+
+    def grid():
+        lat, lon = points[next(it) % len(points)]
+        index.nearest(lat, lon, 5)
+
+    def scan():
+        lat, lon = points[next(it) % len(points)]
+        sorted(stores, key=lambda s: haversine_miles(lat, lon, s["lat"], s["lon"]))[:5]
+
+    latencies, wall = _timed(grid, args.iterations * 20)
+    results[f"nearest 5 stores[grid, {len(stores)}]"] = summarize(latencies, wall)
+    latencies, wall = _timed(scan, args.iterations)
+    results[f"nearest 5 stores[scan, {len(stores)}]"] = summarize(latencies, wall)
+
+    app.location_index.add(stores)
+    client = app.app.test_client()
+
+    def endpoint():
+        lat, lon = points[next(it) % len(points)]
+        resp = client.get(f"/api/locations?lat={lat}&lon={lon}&limit=5")
+        assert resp.status_code == 200, resp.data[:200]
+
+    latencies, wall = _timed(endpoint, args.iterations * 5)
+    results["/api/locations[nearest 5]"] = summarize(latencies, wall)
+
+
+def bench_stores(app, args, results):
+    """Several stores with upstream latency: one store after another vs. a store=all search."""
+    from stores import StoreAdapter, StoreRegistry
+
+    latency = (args.latency_ms or 40.0) / 1000.0
+    corpus = product_corpus(app, args.limit, seed=args.seed)
+
+    class SlowStore(StoreAdapter):
+        def search(self, term, limit=20, location_id=None):
+            time.sleep(latency)
+            return [dict(p, store=self.name) for p in corpus[:limit]]
+
+    registry = StoreRegistry()
+    for i in range(4):
+        registry.register(type(f"Store{i}", (SlowStore,), {"name": f"store{i}"})())
+    saved, app.store_registry = app.store_registry, registry
+    client = app.app.test_client()
+    it = iter(range(10**9))
+    try:
+        def sequential():
+            n = next(it)
+            for adapter in registry.enabled():
+                resp = client.post("/api/search", json={"query": f"seq{n}", "store": adapter.name})
+                assert resp.status_code == 200, resp.data[:200]
+
+        def fanout():
+            resp = client.post("/api/search", json={"query": f"all{next(it)}", "store": "all"})
+            assert resp.status_code == 200 and not resp.json["failed_stores"], resp.data[:200]
+
+        latencies, wall = _timed(sequential, args.iterations)
+        results[f"4 stores[one by one, {latency * 1000:g}ms each]"] = summarize(latencies, wall)
+        latencies, wall = _timed(fanout, args.iterations)
+        results[f"4 stores[store=all, {latency * 1000:g}ms each]"] = summarize(latencies, wall)
+    finally:
+        app.store_registry = saved
+
+    # Linking listings across stores: each corpus product re-listed by a second store under a reworded name.
+    from identity import ProductIdentityIndex
+
+    corpus = product_corpus(app, args.corpus_size, seed=args.seed)
+    relisted = [
+        {"name": " ".join(reversed(p["name"].split())), "size": p.get("size", ""), "url": f"other/{i}"}
+        for i, p in enumerate(corpus)
+    ]
+
+    def identify_all():
+        index = ProductIdentityIndex()
+        for p in corpus:
+            index.identify("kroger", p["productId"], p)
+        for p in relisted:
+            index.identify("other", p["url"], p)
+
+    latencies, wall = _timed(identify_all, max(args.iterations // 5, 3))
+    results[f"identify[{len(corpus)} + {len(relisted)} listings]"] = summarize(latencies, wall)
+
+
+def bench_prices(app, args, results):
+    """Price history on the search path (queueing observations, lowest-price lookup) and its batched writes."""
+    corpus = product_corpus(app, args.corpus_size, seed=args.seed)
+    batches = [corpus[i:i + args.limit] for i in range(0, len(corpus), args.limit)]
+    it = iter(range(10**9))
+
+    def record():
+        app._record_prices("kroger", f"loc{next(it)}", batches[next(it) % len(batches)])
+
+    latencies, wall = _timed(record, args.iterations * 5)
+    results[f"record prices[{args.limit} products]"] = summarize(latencies, wall)
+    pending = app.price_history.pending()
+    start = time.perf_counter()
+    app.price_history.flush()
+    results[f"price history flush[{pending} rows]"] = summarize([time.perf_counter() - start], time.perf_counter() - start)
+
+    def annotate():
+        app._annotate_lowest_prices("kroger", batches[next(it) % len(batches)])
+
+    latencies, wall = _timed(annotate, args.iterations * 5)
+    results[f"lowest recent price[{args.limit} products]"] = summarize(latencies, wall)
+
+
+BENCHMARKS = {
+    "filter": bench_filter,
+    "batch": bench_batch_filter,
+    "extract": bench_extract,
+    "api": bench_api,
+    "search": bench_search,
+    "payload": bench_payload,
+    "locations": bench_locations,
+    "stores": bench_stores,
+    "prices": bench_prices,
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline search-pipeline benchmarks")
+    parser.add_argument("--only", default=",".join(BENCHMARKS), help="comma-separated subset of: " + ", ".join(BENCHMARKS))
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--corpus-size", type=int, default=2000, help="products for the filter benchmark")
+    parser.add_argument("--batch-sizes", type=lambda v: [int(x) for x in v.split(",")], default=[10000, 100000],
+                        help="comma-separated product counts for the batch filter benchmark")
+    parser.add_argument("--batch-workers", type=int, default=0, help="also run batch_filter with N processes")
+    parser.add_argument("--limit", type=int, default=50, help="products per upstream search")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="injected upstream latency")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--json", help="also write results to this file")
+    args = parser.parse_args(argv)
+
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    os.environ.setdefault("FILTER_DB_PATH", ":memory:")
+    os.environ.setdefault("LOCAL_INDEX_PATH", ":memory:")
+    os.environ.setdefault("PRICE_HISTORY_PATH", ":memory:")
+    # Measure the upstream path by default; bench_search turns the local index on for its own scenario.
+    os.environ.setdefault("LOCAL_SEARCH_MIN_RESULTS", "0")
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    import app  # noqa: E402  (imported late so LOG_LEVEL applies)
+
+    results = {}
+    for name in args.only.split(","):
+        name = name.strip()
+        if name not in BENCHMARKS:
+            parser.error(f"unknown benchmark: {name}")
+        print(f"== {name}")
+        BENCHMARKS[name](app, args, results)
+
+    print()
+    for name, summary in results.items():
+        line = format_row(name, summary)
+        if summary.get("errors"):
+            line += f"  errors={summary['errors']}"
+        print(line)
+
+    if args.json:
+        with open(args.json, "w") as fh:
+            json.dump({"args": vars(args), "results": results}, fh, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+"""Small latency/throughput helpers shared by the benchmark scripts."""
+import math
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already-sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100.0 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def summarize(latencies_s, wall_s=None, ops=None):
+    """p50/p95/p99/max (ms) and throughput (ops/s) for a list of latencies in seconds.
+
+    `ops` is the number of operations the calls covered (defaults to one per call).
+    """
+    values = sorted(latencies_s)
+    total = wall_s if wall_s is not None else sum(values)
+    ops = len(values) if ops is None else ops
+    return {
+        "n": len(values),
+        "p50_ms": round(percentile(values, 50) * 1000, 3),
+        "p95_ms": round(percentile(values, 95) * 1000, 3),
+        "p99_ms": round(percentile(values, 99) * 1000, 3),
+        "max_ms": round((values[-1] if values else 0.0) * 1000, 3),
+        "ops_per_s": round(ops / total, 1) if total else 0.0,
+    }
+
+
+def format_row(name, summary):
+    return (
+        f"{name:<44} n={summary['n']:<6} p50={summary['p50_ms']:>9.3f}ms "
+        f"p95={summary['p95_ms']:>9.3f}ms p99={summary['p99_ms']:>9.3f}ms "
+        f"{summary['ops_per_s']:>10.1f} ops/s"
+    )
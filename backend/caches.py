@@ -0,0 +1,102 @@
+"""
+Bounded expiring caches.
+
+`TTLCache` replaces the pairs of dicts (values, expiry times) the search
+caches used to be. Expired entries were only skipped on read, so every
+distinct query, filter set and location added an entry for the life of the
+worker. Here expired entries are swept out on insert (at most every
+`sweep_every_s`), and past `maxsize` entries the least recently used is
+evicted, as `_product_catalog` in app.py does. `on_evict(key, value)` is
+called for entries that expire or are evicted, to drop what hangs off them.
+"""
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+
+class TTLCache:
+    """key -> value until its expiry time (a datetime), at most `maxsize` entries; thread-safe."""
+
+    def __init__(self, maxsize, sweep_every_s=30.0, on_evict=None):
+        self.maxsize = maxsize
+        self.sweep_every_s = sweep_every_s
+        self.on_evict = on_evict
+        self._data = OrderedDict()  # key -> (value, expires), least recently used first
+        self._lock = threading.Lock()
+        self._last_sweep = time.monotonic()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        """True if `key` has an entry that hasn't expired (doesn't count as a use)."""
+        item = self._data.get(key)
+        return item is not None and datetime.now() < item[1]
+
+    def __getitem__(self, key):
+        """The value stored under `key`, expired or not (KeyError once it has been evicted)."""
+        return self._data[key][0]
+
+    def get(self, key, default=None):
+        """The value under `key` if it hasn't expired, else `default`."""
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            if datetime.now() < item[1]:
+                self._data.move_to_end(key)
+                return item[0]
+            del self._data[key]
+        self._evicted([(key, item)])
+        return default
+
+    def expiry(self, key):
+        """When the entry under `key` expires (None if there is none)."""
+        item = self._data.get(key)
+        return item[1] if item is not None else None
+
+    def set(self, key, value, expires):
+        """Store `value` under `key` until `expires`, sweeping expired entries and evicting past maxsize."""
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            removed = []
+            now = time.monotonic()
+            if now - self._last_sweep >= self.sweep_every_s:
+                self._last_sweep = now
+                removed = self._sweep()
+            while len(self._data) > self.maxsize:
+                removed.append(self._data.popitem(last=False))
+        self._evicted(removed)
+
+    def replace(self, key, value):
+        """Swap the value under `key` for `value`, keeping its expiry; False if the entry is gone."""
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return False
+            self._data[key] = (value, item[1])
+            return True
+
+    def pop(self, key, default=None):
+        with self._lock:
+            item = self._data.pop(key, None)
+        return default if item is None else item[0]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def _sweep(self):
+        now = datetime.now()
+        expired = [(k, item) for k, item in self._data.items() if item[1] <= now]
+        for key, _ in expired:
+            del self._data[key]
+        return expired
+
+    def _evicted(self, removed):
+        # (Outside the lock: the callback may touch other caches.)
+        if self.on_evict is not None:
+            for key, (value, _) in removed:
+                self.on_evict(key, value)
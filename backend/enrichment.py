@@ -0,0 +1,168 @@
+"""
+Background ingredient enrichment.
+
+Kroger API products without `ingredientStatement` can only be filtered on
+their name, brand and categories, so an unhealthy product can slip through.
+Scraping ingredients inline would make every search take seconds, so those
+products are flagged `unverified` in the response and handed to an
+`EnrichmentQueue` instead: a few background workers fetch them one at a time
+under a rate limit, the handler stores what it finds, and later searches
+filter on the full ingredients.
+
+The queue is per process (each gunicorn worker enriches what it has seen);
+the results are shared through the local product index.
+"""
+import collections
+import os
+import threading
+import time
+
+
+class RateLimiter:
+    """Token bucket: `per_minute` acquisitions per minute, with bursts of up to `burst`."""
+
+    def __init__(self, per_minute, burst=1):
+        self.interval = 60.0 / per_minute if per_minute > 0 else 0.0
+        self.burst = burst
+        self._tokens = float(burst)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait_time(self):
+        """Take a token if one is available (returns 0), else how long to wait before trying again."""
+        if not self.interval:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._last) / self.interval)
+            self._last = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) * self.interval
+
+
+class EnrichmentQueue:
+    """
+    Deduplicated FIFO of items worked off by background threads.
+
+    `handler(item)` does the work and returns a short result label
+    ("enriched", "none", ...); an exception counts as a failure and the
+    item is retried (at the back of the queue) up to `max_attempts` times.
+    """
+
+    def __init__(self, handler, rate_per_minute=20, workers=1, max_backlog=10_000, max_attempts=3,
+                 history=360, sample_every_s=10.0, on_result=None):
+        self.handler = handler
+        self.limiter = RateLimiter(rate_per_minute)
+        self.workers = workers
+        self.max_backlog = max_backlog
+        self.max_attempts = max_attempts
+        self.sample_every_s = sample_every_s
+        self.on_result = on_result
+        self._queue = collections.deque()
+        self._queued = {}
+        self._in_flight = set()
+        self._counts = collections.Counter()
+        self._history = collections.deque(maxlen=history)
+        self._last_sample = 0.0
+        self._cond = threading.Condition()
+        self._threads = []
+        self._pid = None
+        self._stopped = False
+
+    def _ensure_workers(self):
+        # Threads don't survive fork (gunicorn --preload): start them in the process that uses the queue.
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._threads = []
+            for i in range(self.workers):
+                t = threading.Thread(target=self._run, name=f"enrichment-{i}", daemon=True)
+                t.start()
+                self._threads.append(t)
+
+    def submit(self, key, item):
+        """Queue an item unless it is already queued/in flight or the backlog is full. True if queued."""
+        with self._cond:
+            if self._stopped or key in self._queued or key in self._in_flight:
+                return False
+            if len(self._queue) >= self.max_backlog:
+                self._counts["dropped"] += 1
+                return False
+            self._queued[key] = 0
+            self._queue.append((key, item))
+            self._counts["queued"] += 1
+            self._ensure_workers()
+            self._sample_locked()
+            self._cond.notify()
+            return True
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._queue and not self._stopped:
+                    self._cond.wait()
+                if self._stopped:
+                    return
+            delay = self.limiter.wait_time()
+            if delay:
+                time.sleep(delay)
+                continue
+            with self._cond:
+                if not self._queue:
+                    # Another worker took it while we waited for the limiter; give the token back next round.
+                    continue
+                key, item = self._queue.popleft()
+                attempts = self._queued.pop(key) + 1
+                self._in_flight.add(key)
+            try:
+                result = self.handler(item)
+            except Exception:
+                result = None
+            with self._cond:
+                self._in_flight.discard(key)
+                if result is None:
+                    if attempts < self.max_attempts:
+                        self._queued[key] = attempts
+                        self._queue.append((key, item))
+                        self._counts["retried"] += 1
+                    else:
+                        self._counts["failed"] += 1
+                        result = "failed"
+                else:
+                    self._counts[result] += 1
+                self._sample_locked()
+            if result is not None and self.on_result:
+                self.on_result(result, self.backlog())
+
+    def _sample_locked(self, force=False):
+        now = time.time()
+        if force or now - self._last_sample >= self.sample_every_s:
+            self._last_sample = now
+            self._history.append({
+                "t": round(now, 3),
+                "backlog": len(self._queue),
+                "in_flight": len(self._in_flight),
+                **{k: self._counts[k] for k in ("queued", "enriched", "none", "failed")},
+            })
+
+    def backlog(self):
+        with self._cond:
+            return len(self._queue)
+
+    def stats(self):
+        with self._cond:
+            self._sample_locked()
+            return {
+                "backlog": len(self._queue),
+                "in_flight": len(self._in_flight),
+                "workers": self.workers if self._pid == os.getpid() else 0,
+                "rate_per_minute": round(60.0 / self.limiter.interval, 3) if self.limiter.interval else None,
+                "totals": dict(self._counts),
+                "history": list(self._history),
+            }
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
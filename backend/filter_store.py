@@ -0,0 +1,260 @@
+"""
+Persistent per-user filter storage built on shared filter profiles.
+
+Users reference a named profile ("default", "keto", "no-seed-oils", ...) and
+only their own additions/removals are stored, as deltas, in SQLite
+(FILTER_DB_PATH, default backend/filters.db). Rows survive restarts and are
+shared by every gunicorn worker.
+
+Effective filter sets are interned by fingerprint (the set of normalized
+terms): every user whose profile + deltas resolve to the same set shares one
+`FilterSet`, hence one compiled matcher and one search cache entry. Users who
+never changed anything have no row and no private copy of their profile.
+
+Every write bumps the user's version and a global change sequence in the same
+transaction. Before serving a read, a process checks `PRAGMA data_version`
+(which only changes when another connection commits) and then reloads just the
+rows with a newer sequence number, so a change in one worker reaches the others
+without scanning every user.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+
+from filtering import compile_filters, normalize_text
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS user_filter_deltas (
+    user_id TEXT PRIMARY KEY,
+    profile TEXT NOT NULL,
+    added TEXT NOT NULL,
+    removed TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    seq INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS user_filter_deltas_seq ON user_filter_deltas (seq);
+CREATE TABLE IF NOT EXISTS filter_store_meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO filter_store_meta (key, value) VALUES ('seq', 0);
+"""
+
+
+class UnknownProfile(ValueError):
+    pass
+
+
+def fingerprint_for(normalized_terms):
+    """Stable id for a set of normalized filter terms."""
+    digest = hashlib.sha1("\n".join(sorted(normalized_terms)).encode("utf-8")).hexdigest()
+    return digest[:16]
+
+
+class FilterSet:
+    """An effective filter set, shared by every user that resolves to it."""
+    __slots__ = ("fingerprint", "normalized", "compiled")
+
+    def __init__(self, fingerprint, normalized):
+        self.fingerprint = fingerprint
+        self.normalized = normalized
+        # Canonical term order, so the matcher doesn't depend on which user built it first.
+        self.compiled = compile_filters(sorted(normalized))
+
+
+class _UserEntry:
+    __slots__ = ("profile", "added", "removed", "version", "filters", "lowered", "filter_set")
+
+    def __init__(self, profile, added, removed, version):
+        self.profile = profile
+        self.added = tuple(added)
+        self.removed = tuple(removed)
+        self.version = version
+        self.filters = ()
+        self.lowered = frozenset()
+        self.filter_set = None
+
+
+class FilterStore:
+    def __init__(self, path, profiles, default_profile="default"):
+        self.path = path
+        self.profiles = {name: tuple(terms) for name, terms in profiles.items()}
+        self.default_profile = default_profile
+        self._lock = threading.RLock()
+        self._conn = None
+        self._pid = None
+        self._data_version = None
+        self._seen_seq = 0
+        self._users = {}
+        # Interned FilterSets by fingerprint, and one shared entry per untouched profile.
+        self._sets = {}
+        self._profile_entries = {}
+
+    # --- connection / cross-process sync ---------------------------------
+
+    def _connection(self):
+        # Reconnect after fork (gunicorn --preload) so workers don't share a handle.
+        if self._conn is None or self._pid != os.getpid():
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=10)
+            if self.path != ":memory:":
+                conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+            self._conn = conn
+            self._pid = os.getpid()
+            self._data_version = None
+            self._seen_seq = 0
+            self._users.clear()
+        return self._conn
+
+    def _sync(self):
+        """Pull rows changed by other connections since the last sync."""
+        conn = self._connection()
+        data_version = conn.execute("PRAGMA data_version").fetchone()[0]
+        if data_version == self._data_version:
+            return
+        self._data_version = data_version
+        rows = conn.execute(
+            "SELECT user_id, profile, added, removed, version, seq FROM user_filter_deltas "
+            "WHERE seq > ? ORDER BY seq",
+            (self._seen_seq,),
+        ).fetchall()
+        for user_id, profile, added, removed, version, seq in rows:
+            self._seen_seq = max(self._seen_seq, seq)
+            cached = self._users.get(user_id)
+            # Users this process hasn't served are loaded lazily on first read.
+            if cached is None or cached.version >= version:
+                continue
+            self._users[user_id] = self._resolve(profile, json.loads(added), json.loads(removed), version)
+
+    # --- resolution -------------------------------------------------------
+
+    def _resolve(self, profile, added, removed, version):
+        """Build a user entry: profile terms minus removals plus additions, interned by fingerprint."""
+        entry = _UserEntry(profile, added, removed, version)
+        dropped = {f.lower() for f in entry.removed}
+        filters = [f for f in self.profiles.get(profile, ()) if f.lower() not in dropped]
+        lowered = {f.lower() for f in filters}
+        for f in entry.added:
+            if f.lower() not in lowered:
+                lowered.add(f.lower())
+                filters.append(f)
+        entry.filters = tuple(filters)
+        entry.lowered = frozenset(lowered)
+        normalized = frozenset(normalize_text(f) for f in filters)
+        fingerprint = fingerprint_for(normalized)
+        filter_set = self._sets.get(fingerprint)
+        if filter_set is None:
+            filter_set = self._sets[fingerprint] = FilterSet(fingerprint, normalized)
+        entry.filter_set = filter_set
+        return entry
+
+    def _profile_entry(self, profile):
+        entry = self._profile_entries.get(profile)
+        if entry is None:
+            entry = self._profile_entries[profile] = self._resolve(profile, (), (), 0)
+        return entry
+
+    def _load(self, user_id):
+        row = self._connection().execute(
+            "SELECT profile, added, removed, version FROM user_filter_deltas WHERE user_id = ?", (user_id,)
+        ).fetchone()
+        if row is None:
+            return self._profile_entry(self.default_profile)
+        return self._resolve(row[0], json.loads(row[1]), json.loads(row[2]), row[3])
+
+    def _entry(self, user_id):
+        with self._lock:
+            self._sync()
+            entry = self._users.get(user_id)
+            if entry is None:
+                entry = self._users[user_id] = self._load(user_id)
+            return entry
+
+    # --- reads ------------------------------------------------------------
+
+    def describe(self, user_id):
+        """Effective filters plus the profile and deltas they come from."""
+        entry = self._entry(user_id)
+        return {
+            "filters": list(entry.filters),
+            "profile": entry.profile,
+            "added": list(entry.added),
+            "removed": list(entry.removed),
+        }
+
+    def filter_set(self, user_id):
+        """The shared FilterSet (fingerprint + compiled matcher) the user resolves to."""
+        return self._entry(user_id).filter_set
+
+    # --- writes -----------------------------------------------------------
+
+    def _write(self, user_id, mutate):
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                current = self._load(user_id)
+                change = mutate(current)
+                if change is None:
+                    conn.execute("ROLLBACK")
+                    self._users[user_id] = current
+                    return list(current.filters), False
+                profile, added, removed = change
+                conn.execute("UPDATE filter_store_meta SET value = value + 1 WHERE key = 'seq'")
+                seq = conn.execute("SELECT value FROM filter_store_meta WHERE key = 'seq'").fetchone()[0]
+                version = current.version + 1
+                conn.execute(
+                    "INSERT INTO user_filter_deltas (user_id, profile, added, removed, version, seq) "
+                    "VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT(user_id) DO UPDATE SET profile = excluded.profile, "
+                    "added = excluded.added, removed = excluded.removed, "
+                    "version = excluded.version, seq = excluded.seq",
+                    (user_id, profile, json.dumps(list(added)), json.dumps(list(removed)), version, seq),
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            # (data_version only moves for other connections' commits, so this write won't be re-synced.)
+            entry = self._users[user_id] = self._resolve(profile, added, removed, version)
+        return list(entry.filters), True
+
+    def add(self, user_id, term):
+        """Add a filter unless it is already active (case-insensitive). Returns (filters, changed)."""
+        key = term.lower()
+
+        def mutate(entry):
+            if any(f.lower() == key for f in entry.removed):
+                # Re-enabling a profile term just drops the removal.
+                return entry.profile, entry.added, [f for f in entry.removed if f.lower() != key]
+            if key in entry.lowered:
+                return None
+            return entry.profile, entry.added + (term,), entry.removed
+        return self._write(user_id, mutate)
+
+    def remove(self, user_id, term):
+        """Remove a filter (case-insensitive). Returns (filters, changed)."""
+        key = term.lower()
+
+        def mutate(entry):
+            if key not in entry.lowered:
+                return None
+            added = [f for f in entry.added if f.lower() != key]
+            removed = list(entry.removed)
+            if any(f.lower() == key for f in self.profiles.get(entry.profile, ())):
+                removed.append(term)
+            return entry.profile, added, removed
+        return self._write(user_id, mutate)
+
+    def set_profile(self, user_id, profile):
+        """Switch the user's base profile, keeping their own additions. Returns (filters, changed)."""
+        if profile not in self.profiles:
+            raise UnknownProfile(profile)
+
+        def mutate(entry):
+            if entry.profile == profile:
+                return None
+            # Removals were relative to the old profile, so they don't carry over.
+            return profile, entry.added, ()
+        return self._write(user_id, mutate)
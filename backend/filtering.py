@@ -0,0 +1,347 @@
+"""
+Batched ingredient filtering.
+
+`check_ingredients` tests one product against every filter term in a Python
+loop. For large result sets (deep searches, bulk scans) `batch_filter` does
+the same check for a whole list of products in one call:
+
+- the filter list is compiled once (`compile_filters`, memoized per list);
+- the normalized product texts are joined into one string and each distinct
+  term is located with a C-level str.find pass over the whole batch, jumping
+  to the next product after a hit;
+- matched terms come straight out of the scan, so callers get attribution
+  ("hidden because: canola oil") at no extra cost.
+
+`IndexedResults` keeps the inverted form for one cached search: normalized
+term -> indexes of the products it hides. Postings are built lazily, one scan
+per term the first time any filter set uses it, so evaluating a filter set
+that differs by one term from an already-served one only scans that term and
+then updates a copy of the cached result for the closest filter set with that
+term's postings (O(affected products)).
+
+Results are identical to `check_ingredients` (bench/run.py checks it): same
+lower()+strip() normalization, plain substring semantics, and products with
+no text always pass. Filter terms that spell a nutrient threshold ("sodium <
+300 mg", see nutrition.py) are rules on the products' `nutrition` records
+instead; in `IndexedResults` their postings come from sorted nutrient columns. Batches can also be split across worker processes
+(`workers=`); that only pays off when texts are long enough to outweigh the
+cost of pickling them.
+"""
+import bisect
+import functools
+import itertools
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from nutrition import NutrientIndex, compile_rules, rule_for
+
+# Separator between product texts in the joined batch; never part of a filter term.
+_SEP = "\x00"
+_generations = itertools.count(1)
+
+
+def normalize_text(text):
+    """Normalize text for comparison"""
+    if not text:
+        return ""
+    return text.lower().strip()
+
+
+def product_filter_text(product):
+    """Text a product is filtered on (name + ingredients + metadata when available)"""
+    return product.get("_filter_text") or f"{product.get('name','')} {product.get('ingredients','')}"
+
+
+class CompiledFilters:
+    """A filter list prepared for batch matching."""
+
+    def __init__(self, filters):
+        self.terms = tuple(filters)
+        self.normalized = tuple(normalize_text(f) for f in self.terms)
+        # Nutrient thresholds are checked on nutrition records, not searched for in the text.
+        self.rules = tuple({r.term: r for r in map(rule_for, self.normalized) if r is not None}.values())
+        self.evaluate_rules = compile_rules(self.rules)
+        rule_terms = {r.term for r in self.rules}
+        self._text_terms = tuple((t, n) for t, n in zip(self.terms, self.normalized) if n not in rule_terms)
+        text = [n for _, n in self._text_terms]
+        # Distinct non-empty terms, scanned once each. An empty term matches
+        # every non-empty text (substring semantics) and needs no scan.
+        self.has_empty = any(n == "" for n in text)
+        self.unique = tuple(dict.fromkeys(n for n in text if n and _SEP not in n))
+        # Terms containing the separator can't be found in the joined batch; checked per text.
+        self.separator_terms = tuple(n for n in text if _SEP in n)
+
+    def __len__(self):
+        return len(self.terms)
+
+    def matched_terms(self, normalized_text):
+        """Filter terms (original spelling, filter order) contained in an already-normalized text."""
+        return [t for t, n in self._text_terms if n in normalized_text]
+
+    def terms_for(self, found):
+        """Original filter terms (filter order) for a set of matched normalized terms."""
+        return [t for t, n in zip(self.terms, self.normalized) if n in found]
+
+
+@functools.lru_cache(maxsize=1024)
+def _compile_cached(filters):
+    return CompiledFilters(filters)
+
+
+def compile_filters(filters):
+    """Compile (and memoize) a filter list."""
+    return _compile_cached(tuple(filters))
+
+
+def _join(normalized):
+    """Joined batch text plus the start offset of each text in it."""
+    offsets = []
+    pos = 0
+    for text in normalized:
+        offsets.append(pos)
+        pos += len(text) + 1
+    return _SEP.join(normalized), offsets
+
+
+def _scan(normalized, terms, joined=None):
+    """
+    Map text index -> set of matched normalized terms (non-empty, separator-free terms only).
+
+    Each distinct term is located with str.find over the joined batch; after a
+    hit the scan jumps straight to the next text, so the cost is one C-level
+    pass per term plus one bisect per matching (text, term) pair.
+    """
+    hits = {}
+    if not normalized:
+        return hits
+    joined, offsets = joined or _join(normalized)
+    n = len(offsets)
+    find = joined.find
+    for term in terms:
+        at = find(term)
+        while at != -1:
+            idx = bisect.bisect_right(offsets, at) - 1
+            found = hits.get(idx)
+            if found is None:
+                hits[idx] = {term}
+            else:
+                found.add(term)
+            if idx + 1 >= n:
+                break
+            at = find(term, offsets[idx + 1])
+    return hits
+
+
+def _match_chunk(args):
+    texts, filters = args
+    return match_texts(texts, compile_filters(filters))
+
+
+def match_texts(texts, compiled, workers=None, chunk_size=25000):
+    """
+    Match raw texts against compiled filters.
+
+    Returns (mask, matched): mask[i] is True when texts[i] passes (same as
+    check_ingredients), matched[i] lists the terms that removed it.
+    """
+    if workers and workers > 1 and len(texts) > chunk_size:
+        chunks = [(texts[i:i + chunk_size], compiled.terms) for i in range(0, len(texts), chunk_size)]
+        mask, matched = [], []
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for chunk_mask, chunk_matched in pool.map(_match_chunk, chunks):
+                mask.extend(chunk_mask)
+                matched.extend(chunk_matched)
+        return mask, matched
+
+    normalized = [t.lower().strip() if t else "" for t in texts]
+    mask = [True] * len(texts)
+    matched = [[] for _ in texts]
+    if compiled.has_empty or compiled.separator_terms:
+        # Rare edge cases: fall back to the per-text check for exactness.
+        for i, text in enumerate(texts):
+            if text:
+                terms = compiled.matched_terms(normalized[i])
+                if terms:
+                    mask[i] = False
+                    matched[i] = terms
+        return mask, matched
+    for i, found in _scan(normalized, compiled.unique).items():
+        mask[i] = False
+        matched[i] = compiled.terms_for(found)
+    return mask, matched
+
+
+def batch_filter(products, compiled, workers=None):
+    """Pass/fail mask and matched terms (nutrient rules included) for a list of product dicts."""
+    if not isinstance(compiled, CompiledFilters):
+        compiled = compile_filters(compiled)
+    mask, matched = match_texts([product_filter_text(p) for p in products], compiled, workers=workers)
+    if compiled.rules:
+        # One bit per rule: which rules each product breaks.
+        broken = compiled.evaluate_rules([p.get("nutrition") for p in products])
+        rule_terms = list(broken)
+        codes = [0] * len(products)
+        for bit, indexes in enumerate(broken.values()):
+            flag = 1 << bit
+            for i in indexes:
+                codes[i] |= flag
+        # Many products break the same rules next to the same terms; order each combination once.
+        ordered = {}
+        for i in itertools.compress(range(len(codes)), codes):
+            mask[i] = False
+            key = (tuple(matched[i]), codes[i])
+            terms = ordered.get(key)
+            if terms is None:
+                found = {n for t, n in zip(compiled.terms, compiled.normalized) if t in key[0]}
+                found.update(t for bit, t in enumerate(rule_terms) if codes[i] >> bit & 1)
+                terms = ordered[key] = compiled.terms_for(found)
+            matched[i] = terms
+    return mask, matched
+
+
+class IndexedResults:
+    """Unfiltered products from one search plus a lazily built term -> product index."""
+
+    max_views = 64
+
+    def __init__(self, products, source=None, meta=None):
+        # Where the products came from (e.g. upstream vs. a local index) and any other
+        # details about the fetch, for callers to report.
+        self.source = source
+        self.meta = meta or {}
+        # The filter text moves out of the product dicts, so they can be returned as-is to every user.
+        texts = [product_filter_text(p) for p in products]
+        for p in products:
+            p.pop("_filter_text", None)
+        self.products = products
+        self._nutrients = None
+        self._present = [bool(t) for t in texts]
+        self._normalized = [t.lower().strip() if t else "" for t in texts]
+        self._joined = None
+        self.postings = {}
+        # Hidden maps per filter term set, so filter edits are applied as deltas to a cached one.
+        self._views = {}
+        self._lock = threading.Lock()
+        # Result sets fetched anew get a new generation; `extend` keeps it (earlier indexes stay valid).
+        self.generation = next(_generations)
+
+    @classmethod
+    def concat(cls, parts, source=None, meta=None, group_key=None, merge=None):
+        """
+        One result set holding the products of several (e.g. one per store), with their filter texts.
+
+        With `group_key`, products with the same (non-None) key become one product, `merge(products)`,
+        at the position of the first; it is filtered on all of their texts, so any of them can hide it.
+        """
+        merged = cls([], source, meta)
+        positions = {}
+        groups = []
+        for part in parts:
+            for product, present, text in zip(part.products, part._present, part._normalized):
+                key = group_key(product) if group_key is not None else None
+                at = positions.get(key) if key is not None else None
+                if at is None:
+                    if key is not None:
+                        positions[key] = len(merged.products)
+                    groups.append([product])
+                    merged.products.append(product)
+                    merged._present.append(present)
+                    merged._normalized.append(text)
+                else:
+                    groups[at].append(product)
+                    merged._present[at] = merged._present[at] or present
+                    merged._normalized[at] = f"{merged._normalized[at]}\n{text}"
+        for i, group in enumerate(groups):
+            if len(group) > 1:
+                merged.products[i] = merge(group)
+        return merged
+
+    def extend(self, more):
+        """These products followed by those of `more` (e.g. the next upstream page), as the same generation."""
+        extended = IndexedResults.concat([self, more], self.source, self.meta)
+        extended.generation = self.generation
+        return extended
+
+    def __len__(self):
+        return len(self.products)
+
+    def _build(self, terms):
+        rules = {t: rule for t in terms if (rule := rule_for(t)) is not None}
+        if rules and self._nutrients is None:
+            self._nutrients = NutrientIndex([p.get("nutrition") for p in self.products])
+        postings = {t: self._nutrients.failing(rule) for t, rule in rules.items()}
+        scanned = [t for t in terms if t not in rules and t and _SEP not in t]
+        postings.update((t, []) for t in scanned)
+        if self._joined is None:
+            self._joined = _join(self._normalized)
+        for i, found in _scan(self._normalized, scanned, self._joined).items():
+            for t in found:
+                postings[t].append(i)
+        for t in terms:
+            if t not in postings:
+                # Edge cases (empty term / separator inside the term), checked per text.
+                postings[t] = [i for i, n in enumerate(self._normalized) if self._present[i] and t in n]
+        return {t: frozenset(ids) for t, ids in postings.items()}
+
+    def postings_for(self, normalized_terms):
+        """term -> frozenset of product indexes containing it, scanning only terms not seen before."""
+        missing = [t for t in dict.fromkeys(normalized_terms) if t not in self.postings]
+        if missing:
+            with self._lock:
+                missing = [t for t in missing if t not in self.postings]
+                if missing:
+                    self.postings.update(self._build(missing))
+        return {t: self.postings[t] for t in normalized_terms}
+
+    def _derive(self, terms):
+        """
+        Hidden map (index -> frozenset of matched terms) for a term set.
+
+        Starts from the cached view whose term set is closest: an added term can
+        only hide more products and a removed one can only bring products back, so
+        only the products in the postings of the changed terms are touched.
+        """
+        base_terms, base_hidden = frozenset(), {}
+        for view_terms, view_hidden in list(self._views.items()):
+            if len(view_terms ^ terms) < len(base_terms ^ terms):
+                base_terms, base_hidden = view_terms, view_hidden
+        added, removed = terms - base_terms, base_terms - terms
+        postings = self.postings_for(added | removed)
+        hidden = dict(base_hidden)
+        for term in removed:
+            for i in postings[term]:
+                rest = hidden[i] - {term}
+                if rest:
+                    hidden[i] = rest
+                else:
+                    del hidden[i]
+        for term in added:
+            for i in postings[term]:
+                hidden[i] = hidden.get(i, frozenset()) | {term}
+        return hidden
+
+    def hidden_by(self, compiled):
+        """product index -> filter terms (original spelling, filter order) that hide it."""
+        terms = frozenset(compiled.normalized)
+        hidden = self._views.get(terms)
+        if hidden is None:
+            hidden = self._derive(terms)
+            with self._lock:
+                while len(self._views) >= self.max_views:
+                    self._views.pop(next(iter(self._views)))
+                self._views[terms] = hidden
+        # Many products share the same matched set; order each distinct set once.
+        ordered = {}
+        out = {}
+        for i, found in hidden.items():
+            terms = ordered.get(found)
+            if terms is None:
+                terms = ordered[found] = compiled.terms_for(found)
+            out[i] = terms
+        return out
+
+    def evaluate(self, compiled):
+        """(kept products, [(product, matched terms)] for hidden ones) for a compiled filter list."""
+        hidden = self.hidden_by(compiled)
+        kept = [p for i, p in enumerate(self.products) if i not in hidden]
+        return kept, [(self.products[i], hidden[i]) for i in sorted(hidden)]
@@ -0,0 +1,209 @@
+"""
+Cross-store product identity.
+
+The same item is listed once per store: Kroger knows it by productId (a
+zero-padded UPC), HEB only by URL and name. `ProductIdentityIndex` gives
+every listing an identity and links listings from different stores to the
+same one:
+
+- by UPC when both listings have one (leading zeros ignored);
+- otherwise by name: brand + name tokens (accents, case and punctuation
+  folded; numbers, percentages and one-letter variants kept, so "2%" and
+  "whole" milk stay apart), pack sizes pulled out as "32oz". Listings are
+  only linked by name when both have a pack size and the sizes agree, and
+  the Dice coefficient of the token sets reaches `threshold`. Two listings
+  with different UPCs are never linked.
+
+Candidates come from a token -> identities index. A name can only reach the
+threshold with an identity that shares at least one of its few rarest tokens
+(prefix filtering), so a lookup touches the postings of those tokens only,
+never the common ones ("organic", "milk").
+
+The index is per process and in memory; listings are re-identified as
+searches see them.
+"""
+import math
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+
+_SIZE = re.compile(r"(?<![\d/.])(\d+/\d+|\d+(?:\.\d+)?)\s*(fl\.?\s*oz|oz|lbs?|g|kg|ml|l|gal|qt|pt|ct|count|doz|pk|pack)\b")
+_TOKEN = re.compile(r"\d+(?:\.\d+)?%|[a-z0-9]+")
+_SIZE_UNITS = {"lbs": "lb", "count": "ct", "pack": "pk"}
+_STOP = frozenset({"an", "and", "the", "of", "with", "in", "for", "by"})
+MIN_UPC_DIGITS = 6
+
+
+def normalize_upc(value):
+    """Significant digits of a UPC/EAN/productId ('' if it doesn't look like one)."""
+    digits = re.sub(r"\D", "", str(value or "")).lstrip("0")
+    return digits if len(digits) >= MIN_UPC_DIGITS else ""
+
+
+def _sizes(text):
+    sizes = set()
+    for number, unit in _SIZE.findall(text):
+        if "/" in number:
+            numerator, denominator = (int(n) for n in number.split("/"))
+            if not denominator:
+                continue
+            amount = numerator / denominator
+        else:
+            amount = float(number)
+        unit = unit.replace(" ", "").replace(".", "")
+        sizes.add(f"{amount:g}{_SIZE_UNITS.get(unit, unit)}")
+    return sizes
+
+
+def name_signature(name, brand="", size=""):
+    """(frozenset of name tokens, tuple of pack sizes from the name and `size`) used to compare products across stores."""
+    text = f"{brand} {name}" if brand and brand not in name else name
+    if not text.isascii():
+        text = unicodedata.normalize("NFKD", text).encode("ascii", "ignore").decode()
+    text = text.lower()
+    sizes = set()
+    if any(c.isdigit() for c in text):
+        sizes = _sizes(text)
+        if sizes:
+            text = _SIZE.sub(" ", text)
+    if size:
+        sizes |= _sizes(str(size).lower())
+    tokens = frozenset(t for t in _TOKEN.findall(text) if t not in _STOP)
+    return tokens, tuple(sorted(sizes))
+
+
+def name_similarity(a, b):
+    """Dice coefficient of two token sets."""
+    if not a or not b:
+        return 0.0
+    return 2 * len(a & b) / (len(a) + len(b))
+
+
+class _Identity:
+    __slots__ = ("id", "upc", "tokens", "sizes", "listings", "stores", "ingredients")
+
+    def __init__(self, ident, upc, tokens, sizes):
+        self.id = ident
+        self.upc = upc
+        self.tokens = tokens
+        self.sizes = sizes
+        self.listings = set()
+        self.stores = set()
+        self.ingredients = ""
+
+
+class ProductIdentityIndex:
+    """Listing (store, product key) -> identity, linking the same item across stores."""
+
+    def __init__(self, threshold=0.85, max_identities=100_000):
+        self.threshold = threshold
+        self.max_identities = max_identities
+        self._identities = OrderedDict()
+        self._by_listing = {}
+        self._by_upc = {}
+        self._postings = {}
+        self._stores = set()
+        self._next_id = 1
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._identities)
+
+    def identify(self, store, key, product):
+        """Identity of a store's listing, linking it to a matching listing of another store if there is one."""
+        with self._lock:
+            ident = self._by_listing.get((store, key))
+            if ident is not None and ident in self._identities:
+                self._identities.move_to_end(ident)
+                return ident
+            upc = normalize_upc(product.get("upc") or product.get("productId"))
+            tokens, sizes = name_signature(product.get("name", ""), product.get("brand", ""), product.get("size", ""))
+            found = self._by_upc.get(upc) if upc else None
+            if found is None and tokens and sizes and self._stores - {store}:
+                # (Nothing to link to while only one store has been seen, and without a size to confirm.)
+                found = self._match_name(store, upc, tokens, sizes)
+            if found is None:
+                found = self._new(upc, tokens, sizes)
+            elif upc and not found.upc:
+                found.upc = upc
+                self._by_upc[upc] = found
+            found.listings.add((store, key))
+            found.stores.add(store)
+            self._stores.add(store)
+            self._by_listing[(store, key)] = found.id
+            self._identities.move_to_end(found.id)
+            return found.id
+
+    def _match_name(self, store, upc, tokens, sizes):
+        # A match needs overlap >= t*n/(2-t) of our n tokens, so it contains one of our
+        # n - that + 1 rarest tokens: only their postings are looked at. It also has
+        # between t/(2-t) and (2-t)/t times as many tokens as we do.
+        n, t = len(tokens), self.threshold
+        required = math.ceil(t * n / (2 - t))
+        rarest = sorted(tokens, key=lambda tok: len(self._postings.get(tok, ())))[:n - required + 1]
+        min_len, max_len = t * n / (2 - t), (2 - t) * n / t
+        best, best_score = None, t
+        seen = set()
+        for token in rarest:
+            for ident in self._postings.get(token, ()):
+                if ident in seen:
+                    continue
+                seen.add(ident)
+                candidate = self._identities[ident]
+                if store in candidate.stores:
+                    # Two listings of one store are two products, however alike their names.
+                    continue
+                if not min_len <= len(candidate.tokens) <= max_len:
+                    continue
+                if candidate.sizes != sizes or (upc and candidate.upc):
+                    # Alike names are not enough: the sizes must be known and agree, and
+                    # two different UPCs (a UPC match was looked up first) are two products.
+                    continue
+                score = name_similarity(tokens, candidate.tokens)
+                if score >= best_score:
+                    best, best_score = candidate, score
+        return best
+
+    def _new(self, upc, tokens, sizes):
+        identity = _Identity(self._next_id, upc, tokens, sizes)
+        self._next_id += 1
+        self._identities[identity.id] = identity
+        if upc:
+            self._by_upc[upc] = identity
+        for token in tokens:
+            self._postings.setdefault(token, set()).add(identity.id)
+        while len(self._identities) > self.max_identities:
+            self._evict(next(iter(self._identities)))
+        return identity
+
+    def _evict(self, ident):
+        identity = self._identities.pop(ident)
+        if identity.upc and self._by_upc.get(identity.upc) is identity:
+            del self._by_upc[identity.upc]
+        for token in identity.tokens:
+            ids = self._postings.get(token)
+            if ids is not None:
+                ids.discard(ident)
+                if not ids:
+                    del self._postings[token]
+        for listing in identity.listings:
+            if self._by_listing.get(listing) == ident:
+                del self._by_listing[listing]
+
+    def set_ingredients(self, ident, ingredients):
+        """Remember ingredients found for any listing of an identity."""
+        with self._lock:
+            identity = self._identities.get(ident)
+            if identity is not None and ingredients:
+                identity.ingredients = ingredients
+
+    def ingredients(self, ident):
+        identity = self._identities.get(ident)
+        return identity.ingredients if identity is not None else ""
+
+    def listings(self, ident):
+        """[(store, product key)] linked to an identity."""
+        with self._lock:
+            identity = self._identities.get(ident)
+            return sorted(identity.listings) if identity is not None else []
@@ -0,0 +1,221 @@
+"""
+Local full-text index over every product we have received from upstream.
+
+Products are upserted into SQLite (LOCAL_INDEX_PATH, default
+backend/products.db) as searches come back from Kroger. The FTS5 table
+covers name, brand, categories and ingredients (porter stemming, accents
+folded) and results are ranked with bm25, weighting name matches highest.
+
+The search path uses it two ways:
+
+- head queries: when at least LOCAL_SEARCH_MIN_RESULTS products seen in the
+  last LOCAL_SEARCH_MAX_AGE_HOURS match, the search is answered locally with
+  no upstream call;
+- outages: when the upstream call fails, whatever the index has (any age) is
+  served instead of an error, marked stale.
+
+It also keeps the ingredients found by background enrichment (see
+enrichment.py) for products the API returned without any.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from queries import query_tokens
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS products (
+    id INTEGER PRIMARY KEY,
+    store TEXT NOT NULL,
+    product_key TEXT NOT NULL,
+    data TEXT NOT NULL,
+    filter_text TEXT NOT NULL,
+    seen_at REAL NOT NULL,
+    UNIQUE (store, product_key)
+);
+CREATE TABLE IF NOT EXISTS product_enrichment (
+    store TEXT NOT NULL,
+    product_key TEXT NOT NULL,
+    ingredients TEXT NOT NULL,
+    enriched_at REAL NOT NULL,
+    PRIMARY KEY (store, product_key)
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(
+    name, brand, categories, ingredients,
+    tokenize = 'porter unicode61 remove_diacritics 2'
+);
+"""
+
+# bm25 column weights: name, brand, categories, ingredients.
+_BM25_WEIGHTS = (10.0, 4.0, 2.0, 0.5)
+
+
+def product_key(product):
+    """Stable identity of a product within a store."""
+    return product.get("productId") or product.get("url") or product.get("name", "")
+
+
+class LocalProductIndex:
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+
+    def _connection(self):
+        # Reconnect after fork (gunicorn --preload) so workers don't share a handle.
+        if self._conn is None or self._pid != os.getpid():
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=10)
+            if self.path != ":memory:":
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            self._conn = conn
+            self._pid = os.getpid()
+        return self._conn
+
+    def add(self, store, products):
+        """Insert or refresh products (they must still carry _filter_text)."""
+        now = time.time()
+        rows = []
+        for p in products:
+            key = product_key(p)
+            if not key:
+                continue
+            data = {k: v for k, v in p.items() if not k.startswith("_")}
+            rows.append((key, p, json.dumps(data), p.get("_filter_text", "")))
+        if not rows:
+            return 0
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                for key, p, data, filter_text in rows:
+                    row = conn.execute(
+                        "SELECT id FROM products WHERE store = ? AND product_key = ?", (store, key)
+                    ).fetchone()
+                    if row:
+                        rowid = row[0]
+                        conn.execute(
+                            "UPDATE products SET data = ?, filter_text = ?, seen_at = ? WHERE id = ?",
+                            (data, filter_text, now, rowid),
+                        )
+                        conn.execute("DELETE FROM products_fts WHERE rowid = ?", (rowid,))
+                    else:
+                        rowid = conn.execute(
+                            "INSERT INTO products (store, product_key, data, filter_text, seen_at) "
+                            "VALUES (?, ?, ?, ?, ?)",
+                            (store, key, data, filter_text, now),
+                        ).lastrowid
+                    conn.execute(
+                        "INSERT INTO products_fts (rowid, name, brand, categories, ingredients) "
+                        "VALUES (?, ?, ?, ?, ?)",
+                        (rowid, p.get("name", ""), p.get("brand", ""),
+                         " ".join(p.get("categories") or ()), p.get("ingredients", "")),
+                    )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return len(rows)
+
+    def search(self, store, query, limit=20, max_age_s=None):
+        """Best bm25 matches for a query (all terms required), as product dicts with _filter_text."""
+        tokens = query_tokens(query)
+        if not tokens:
+            return []
+        match = " ".join('"' + t.replace('"', '""') + '"' for t in tokens)
+        sql = (
+            "SELECT p.data, p.filter_text FROM products_fts f JOIN products p ON p.id = f.rowid "
+            "WHERE products_fts MATCH ? AND p.store = ?"
+        )
+        params = [match, store]
+        if max_age_s is not None:
+            sql += " AND p.seen_at >= ?"
+            params.append(time.time() - max_age_s)
+        sql += " ORDER BY bm25(products_fts, ?, ?, ?, ?) LIMIT ?"
+        params.extend(_BM25_WEIGHTS)
+        params.append(limit)
+        with self._lock:
+            rows = self._connection().execute(sql, params).fetchall()
+        products = []
+        for data, filter_text in rows:
+            product = json.loads(data)
+            product["_filter_text"] = filter_text
+            products.append(product)
+        return products
+
+    def get_many(self, store, keys, max_age_s=None):
+        """{product_key: product dict with _filter_text} for the keys the index has."""
+        found = {}
+        keys = list(keys)
+        with self._lock:
+            conn = self._connection()
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                sql = (f"SELECT product_key, data, filter_text FROM products WHERE store = ? "
+                       f"AND product_key IN ({','.join('?' * len(chunk))})")
+                params = [store, *chunk]
+                if max_age_s is not None:
+                    sql += " AND seen_at >= ?"
+                    params.append(time.time() - max_age_s)
+                for key, data, filter_text in conn.execute(sql, params):
+                    product = json.loads(data)
+                    product["_filter_text"] = filter_text
+                    found[key] = product
+        return found
+
+    def enrichments(self, store, keys, empty_max_age_s=None):
+        """{product_key: enriched ingredients} ('' = page had none; left out once older than empty_max_age_s)."""
+        found = {}
+        keys = list(keys)
+        with self._lock:
+            conn = self._connection()
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                rows = conn.execute(
+                    f"SELECT product_key, ingredients, enriched_at FROM product_enrichment WHERE store = ? "
+                    f"AND product_key IN ({','.join('?' * len(chunk))})",
+                    [store, *chunk],
+                )
+                for key, ingredients, enriched_at in rows:
+                    if ingredients or empty_max_age_s is None or time.time() - enriched_at < empty_max_age_s:
+                        found[key] = ingredients
+        return found
+
+    def set_enrichment(self, store, key, ingredients):
+        """Record enriched ingredients and fold them into the indexed product, if we have it."""
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute(
+                    "INSERT INTO product_enrichment (store, product_key, ingredients, enriched_at) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT(store, product_key) DO UPDATE SET "
+                    "ingredients = excluded.ingredients, enriched_at = excluded.enriched_at",
+                    (store, key, ingredients, now),
+                )
+                row = conn.execute(
+                    "SELECT id, data, filter_text FROM products WHERE store = ? AND product_key = ?", (store, key)
+                ).fetchone()
+                if row and ingredients:
+                    rowid, data, filter_text = row
+                    product = json.loads(data)
+                    product["ingredients"] = ingredients
+                    product.pop("unverified", None)
+                    conn.execute(
+                        "UPDATE products SET data = ?, filter_text = ? WHERE id = ?",
+                        (json.dumps(product), f"{filter_text} {ingredients}".strip(), rowid),
+                    )
+                    conn.execute("UPDATE products_fts SET ingredients = ? WHERE rowid = ?", (ingredients, rowid))
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def count(self):
+        with self._lock:
+            return self._connection().execute("SELECT COUNT(*) FROM products").fetchone()[0]
@@ -0,0 +1,201 @@
+"""
+Store locations and nearest-store lookup.
+
+Locations come from a bulk file (KROGER_LOCATIONS_FILE: a saved Kroger
+Locations API response, i.e. {"data": [...]} or a plain list) and/or from the
+Kroger Locations API, fetched once per area on the first lookup there and
+kept in memory afterwards.
+
+`LocationIndex` buckets stores into a fixed lat/lon grid. A nearest-N lookup
+scans grid rings outward from the query point and stops as soon as the next
+ring cannot contain anything closer than the current N-th best, so it touches
+a handful of cells instead of every store (microseconds for the ~2.7k Kroger
+stores). ZIP codes resolve to the centroid of the stores in that ZIP (or its
+3-digit prefix), optionally backed by a ZIP centroid CSV (LOCATIONS_ZIP_FILE).
+"""
+import csv
+import json
+import math
+import os
+import sqlite3
+import threading
+
+EARTH_RADIUS_MILES = 3958.8
+MILES_PER_DEGREE_LAT = 69.05
+
+
+def haversine_miles(lat1, lon1, lat2, lon2):
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dp = p2 - p1
+    dl = math.radians(lon2 - lon1)
+    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 2 * EARTH_RADIUS_MILES * math.asin(min(1.0, math.sqrt(a)))
+
+
+def location_from_api(obj):
+    """Flatten a Kroger Locations API object; None if it has no usable coordinates."""
+    if not isinstance(obj, dict) or not obj.get("locationId"):
+        return None
+    geo = obj.get("geolocation") or {}
+    address = obj.get("address") or {}
+    try:
+        lat, lon = float(geo["latitude"]), float(geo["longitude"])
+    except (KeyError, TypeError, ValueError):
+        return None
+    return {
+        "locationId": str(obj["locationId"]),
+        "name": obj.get("name", ""),
+        "chain": obj.get("chain", ""),
+        "address": address.get("addressLine1", ""),
+        "city": address.get("city", ""),
+        "state": address.get("state", ""),
+        "zipCode": str(address.get("zipCode", ""))[:5],
+        "lat": lat,
+        "lon": lon,
+    }
+
+
+class LocationIndex:
+    def __init__(self, cell_degrees=0.5):
+        self.cell = cell_degrees
+        self._grid = {}
+        self._by_id = {}
+        self._zip_points = {}
+        self._zip_centroids = {}
+        self._bounds = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._by_id)
+
+    def _cell(self, lat, lon):
+        return int(math.floor(lat / self.cell)), int(math.floor(lon / self.cell))
+
+    def add(self, locations):
+        """Add or replace locations (flattened dicts). Returns how many were new."""
+        added = 0
+        with self._lock:
+            for loc in locations:
+                if not loc:
+                    continue
+                old = self._by_id.get(loc["locationId"])
+                if old is not None:
+                    self._grid[self._cell(old["lat"], old["lon"])].remove(old)
+                else:
+                    added += 1
+                self._by_id[loc["locationId"]] = loc
+                i, j = self._cell(loc["lat"], loc["lon"])
+                self._grid.setdefault((i, j), []).append(loc)
+                b = self._bounds
+                self._bounds = (i, i, j, j) if b is None else (min(b[0], i), max(b[1], i), min(b[2], j), max(b[3], j))
+                if loc.get("zipCode"):
+                    self._zip_points.setdefault(loc["zipCode"], {})[loc["locationId"]] = (loc["lat"], loc["lon"])
+        return added
+
+    def load_file(self, path):
+        """Load a saved Locations API response ({"data": [...]} or a list)."""
+        with open(path, encoding="utf-8") as fh:
+            payload = json.load(fh)
+        items = payload.get("data", []) if isinstance(payload, dict) else payload
+        return self.add(location_from_api(o) if "geolocation" in o else o for o in items if isinstance(o, dict))
+
+    def load_zip_file(self, path):
+        """ZIP centroids from a CSV with zip,lat,lon columns (header optional)."""
+        with open(path, encoding="utf-8", newline="") as fh:
+            for row in csv.reader(fh):
+                try:
+                    self._zip_centroids[row[0].strip()[:5]] = (float(row[1]), float(row[2]))
+                except (IndexError, ValueError):
+                    continue
+
+    def get(self, location_id):
+        return self._by_id.get(location_id)
+
+    def set_zip_point(self, zip_code, lat, lon):
+        self._zip_centroids[str(zip_code).strip()[:5]] = (lat, lon)
+
+    def zip_point(self, zip_code, exact=False):
+        """(lat, lon) for a ZIP code, or None if nothing local is known about it (or, if `exact`, about the ZIP itself)."""
+        zip_code = str(zip_code).strip()[:5]
+        if zip_code in self._zip_centroids:
+            return self._zip_centroids[zip_code]
+        with self._lock:
+            points = list(self._zip_points.get(zip_code, {}).values())
+            if not points and not exact:
+                # Same 3-digit sectional center: close enough to rank nearby stores.
+                points = [p for z, pts in self._zip_points.items() if z[:3] == zip_code[:3] for p in pts.values()]
+        if not points:
+            return None
+        return sum(p[0] for p in points) / len(points), sum(p[1] for p in points) / len(points)
+
+    def nearest(self, lat, lon, n=5, max_miles=None):
+        """Up to n (distance_miles, location) pairs, closest first."""
+        with self._lock:
+            total = len(self._by_id)
+            if not total:
+                return []
+            ci, cj = self._cell(lat, lon)
+            min_i, max_i, min_j, max_j = self._bounds
+            best = []
+            seen = 0
+            # Rings closer than the grid's bounding box are empty; start at its edge.
+            ring = max(0, min_i - ci, ci - max_i, min_j - cj, cj - max_j)
+            while True:
+                for di in range(-ring, ring + 1):
+                    step = 1 if abs(di) == ring else 2 * ring or 1
+                    for dj in range(-ring, ring + 1, step):
+                        for loc in self._grid.get((ci + di, cj + dj), ()):
+                            seen += 1
+                            best.append((haversine_miles(lat, lon, loc["lat"], loc["lon"]), loc))
+                best.sort(key=lambda pair: pair[0])
+                del best[n:]
+                if seen >= total:
+                    break
+                # Anything in the next ring is at least `ring` whole cells away; a degree of
+                # longitude is shortest at the highest latitude that ring reaches.
+                far_lat = min(abs(lat) + (ring + 1) * self.cell, 89.0)
+                bound = ring * self.cell * MILES_PER_DEGREE_LAT * math.cos(math.radians(far_lat))
+                if len(best) >= n and bound > best[-1][0]:
+                    break
+                if max_miles is not None and bound > max_miles:
+                    break
+                ring += 1
+        if max_miles is not None:
+            best = [pair for pair in best if pair[0] <= max_miles]
+        return best
+
+
+class PreferredLocations:
+    """Each user's chosen store, in the same SQLite database as their filters."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+
+    def _connection(self):
+        # Reconnect after fork (gunicorn --preload) so workers don't share a handle.
+        if self._conn is None or self._pid != os.getpid():
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=10)
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS user_locations (user_id TEXT PRIMARY KEY, location_id TEXT NOT NULL)"
+            )
+            self._conn = conn
+            self._pid = os.getpid()
+        return self._conn
+
+    def get(self, user_id):
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT location_id FROM user_locations WHERE user_id = ?", (user_id,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def set(self, user_id, location_id):
+        with self._lock:
+            self._connection().execute(
+                "INSERT INTO user_locations (user_id, location_id) VALUES (?, ?) "
+                "ON CONFLICT(user_id) DO UPDATE SET location_id = excluded.location_id",
+                (user_id, location_id),
+            )
@@ -0,0 +1,255 @@
+"""
+Minimal Prometheus-style metrics for the backend.
+
+Renders the Prometheus text exposition format (0.0.4) without pulling in an
+extra dependency. Metrics live in-process, so under gunicorn each worker
+reports its own series (scrape each worker, or aggregate on the Prometheus side).
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# Latency buckets (seconds) sized for everything from cache hits to Selenium scrapes.
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Label value used once a metric has reached its series cap (e.g. user-defined filter terms).
+OVERFLOW_LABEL = "__other__"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=None) -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.extend(f'{n}="{_escape(v)}"' for n, v in extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name, help_text, labelnames=(), max_series=None):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.max_series = max_series
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        key = tuple(str(labels[n]) for n in self.labelnames)
+        # Cap cardinality: new label sets past the limit are folded into one overflow series.
+        if self.max_series is not None and key not in self._series and len(self._series) >= self.max_series:
+            key = tuple(OVERFLOW_LABEL for _ in self.labelnames)
+        return key
+
+    def _header(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        with self._lock:
+            key = self._key(labels)
+            self._series[key] = self._series.get(key, 0) + amount
+
+    def value(self, **labels):
+        key = tuple(str(labels[n]) for n in self.labelnames)
+        return self._series.get(key, 0)
+
+    def render(self):
+        lines = self._header()
+        with self._lock:
+            for key, val in sorted(self._series.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(val)}")
+        return lines
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._series[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS, max_series=None):
+        super().__init__(name, help_text, labelnames, max_series)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            key = self._key(labels)
+            series = self._series.get(key)
+            if series is None:
+                # [per-bucket counts (+Inf last), sum, count]
+                series = [[0] * (len(self.buckets) + 1), 0.0, 0]
+                self._series[key] = series
+            series[0][idx] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the wall-clock duration of the wrapped block."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self):
+        lines = self._header()
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += bucket_count
+                    labels = _format_labels(self.labelnames, key, [("le", _format_value(bound))])
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                labels = _format_labels(self.labelnames, key)
+                lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+                lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help_text, labelnames=(), **kwargs):
+        return self.register(Counter(name, help_text, labelnames, **kwargs))
+
+    def gauge(self, name, help_text, labelnames=(), **kwargs):
+        return self.register(Gauge(name, help_text, labelnames, **kwargs))
+
+    def histogram(self, name, help_text, labelnames=(), **kwargs):
+        return self.register(Histogram(name, help_text, labelnames, **kwargs))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        for metric in self._metrics:
+            metric.clear()
+
+
+REGISTRY = Registry()
+
+# --- Search pipeline metrics -------------------------------------------------
+
+SEARCH_REQUEST_SECONDS = REGISTRY.histogram(
+    "hff_search_request_seconds",
+    "End-to-end latency of /api/search requests.",
+    ("store", "outcome"),
+)
+SEARCH_STAGE_SECONDS = REGISTRY.histogram(
+    "hff_search_stage_seconds",
+    "Latency of individual search pipeline stages.",
+    ("stage",),
+)
+CACHE_REQUESTS = REGISTRY.counter(
+    "hff_search_cache_requests_total",
+    "Search cache lookups by store and result (hit/miss).",
+    ("store", "result"),
+)
+UPSTREAM_RESPONSES = REGISTRY.counter(
+    "hff_upstream_responses_total",
+    "Upstream HTTP responses by endpoint and status code.",
+    ("endpoint", "status"),
+)
+FILTER_MATCHES = REGISTRY.counter(
+    "hff_filter_matches_total",
+    "Products removed by each filter term.",
+    ("term",),
+    max_series=200,
+)
+PRODUCTS_SEEN = REGISTRY.counter(
+    "hff_search_products_total",
+    "Products returned upstream vs. kept after filtering.",
+    ("store", "stage"),
+)
+SEARCH_RESPONSES = REGISTRY.counter(
+    "hff_search_responses_total",
+    "/api/search responses by content encoding.",
+    ("encoding",),
+)
+LOCAL_SEARCHES = REGISTRY.counter(
+    "hff_local_search_total",
+    "Searches answered from the local product index (served) or as an upstream-outage fallback.",
+    ("result",),
+)
+QUERY_KEYS = REGISTRY.gauge(
+    "hff_search_query_keys",
+    "Distinct search cache keys seen, as typed (raw) vs. after query canonicalization.",
+    ("kind",),
+)
+PRODUCT_DETAILS = REGISTRY.counter(
+    "hff_product_details_total",
+    "Products served by /api/products/details, by where they came from (cache/catalog/local/api/scrape/missing).",
+    ("source",),
+)
+ENRICHMENT = REGISTRY.counter(
+    "hff_enrichment_total",
+    "Background ingredient lookups by result (enriched/none/failed).",
+    ("result",),
+)
+ENRICHMENT_BACKLOG = REGISTRY.gauge(
+    "hff_enrichment_backlog",
+    "Products waiting for background ingredient enrichment.",
+)
+PRICE_OBSERVATIONS = REGISTRY.counter(
+    "hff_price_observations_total",
+    "Price observations queued for the price history (new or lower prices only).",
+    ("result",),
+)
+SELENIUM_DRIVERS_CREATED = REGISTRY.counter(
+    "hff_selenium_drivers_created_total",
+    "Selenium WebDriver sessions started.",
+)
+SELENIUM_DRIVER_FAILURES = REGISTRY.counter(
+    "hff_selenium_driver_failures_total",
+    "Selenium WebDriver sessions that failed to start.",
+)
+SELENIUM_DRIVERS_ACTIVE = REGISTRY.gauge(
+    "hff_selenium_drivers_active",
+    "Selenium WebDriver sessions currently open.",
+)
+
+
+def stage(name):
+    """Shorthand for timing one search pipeline stage."""
+    return SEARCH_STAGE_SECONDS.time(stage=name)
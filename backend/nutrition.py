@@ -0,0 +1,199 @@
+"""
+Nutrition facts and numeric nutrient rules.
+
+The Products API's `nutritionInformation` has the nutrition panel next to the
+ingredient statement. `nutrition_from_api` reads it into a compact per-product
+record of numbers per serving, in one unit per nutrient:
+
+    {"calories": 140.0, "sugar_g": 4.0, "added_sugar_g": 2.0, "sodium_mg": 310.0, ...}
+
+A filter term that reads as a threshold ("sodium < 300 mg", "added sugar <= 5g",
+"protein >= 10 g") is a rule instead of an ingredient term: products whose
+value breaks it are hidden, with the rule as the reason. Products without that
+nutrient on their panel pass, as products without ingredient text pass the
+ingredient terms.
+
+Rules are not checked product by product in Python. `compile_rules` turns a
+filter list's rules into one evaluator over a batch: each nutrient is read out
+of the records once into a column, and each rule is a C-level comparison over
+that column. `NutrientIndex` keeps each nutrient's known values for a cached
+result set sorted once, so there the products a rule hides are one bisection
+and a slice.
+"""
+import bisect
+import functools
+import operator
+import re
+from itertools import compress, repeat
+
+# Canonical nutrient key -> (unit the record holds it in, names it goes by on panels and in rules).
+NUTRIENTS = {
+    "calories": ("kcal", ("calories", "calorie", "energy", "kcal")),
+    "fat_g": ("g", ("total fat", "fat")),
+    "saturated_fat_g": ("g", ("saturated fat", "sat fat", "saturated")),
+    "trans_fat_g": ("g", ("trans fat",)),
+    "cholesterol_mg": ("mg", ("cholesterol",)),
+    "sodium_mg": ("mg", ("sodium",)),
+    "carbs_g": ("g", ("total carbohydrate", "total carbohydrates", "carbohydrate", "carbohydrates",
+                      "total carbs", "carbs")),
+    "fiber_g": ("g", ("dietary fiber", "fiber", "fibre")),
+    "sugar_g": ("g", ("total sugars", "total sugar", "sugars", "sugar")),
+    "added_sugar_g": ("g", ("added sugars", "added sugar", "includes added sugars")),
+    "protein_g": ("g", ("protein",)),
+}
+
+_NAMES = {name: key for key, (_, names) in NUTRIENTS.items() for name in names}
+
+# Unit spellings (panel abbreviations, Products API unit codes, rule text) -> (kind, factor to the base unit).
+_UNITS = {
+    "g": ("mass", 1.0), "gram": ("mass", 1.0), "grams": ("mass", 1.0), "grm": ("mass", 1.0),
+    "mg": ("mass", 1e-3), "milligram": ("mass", 1e-3), "milligrams": ("mass", 1e-3), "mgm": ("mass", 1e-3),
+    "mcg": ("mass", 1e-6), "ug": ("mass", 1e-6), "µg": ("mass", 1e-6), "microgram": ("mass", 1e-6),
+    "micrograms": ("mass", 1e-6), "mc": ("mass", 1e-6),
+    "kcal": ("energy", 1.0), "cal": ("energy", 1.0), "calorie": ("energy", 1.0), "calories": ("energy", 1.0),
+    "e14": ("energy", 1.0), "kj": ("energy", 1 / 4.184), "kjo": ("energy", 1 / 4.184),
+}
+
+_OPS = {"<": "<", "<=": "<=", "=<": "<=", "≤": "<=", ">": ">", ">=": ">=", "=>": ">=", "≥": ">="}
+# Rule operator -> comparison that is true when a value breaks the rule.
+_BREAKS = {"<": operator.ge, "<=": operator.gt, ">": operator.le, ">=": operator.lt}
+# Stands in for a missing value: NaN compares false with everything, so it breaks no rule.
+_MISSING = float("nan")
+_RULE = re.compile(r"^\s*([a-z][a-z ]*?)\s*(<=|>=|=<|=>|<|>|≤|≥)\s*(\d+(?:\.\d+)?)\s*([a-zµ]*)\s*$")
+
+
+def _convert(quantity, unit, key):
+    """`quantity` in `unit` expressed in the record's unit for `key`; None if the units don't go together."""
+    base_unit = NUTRIENTS[key][0]
+    if not unit:
+        return float(quantity)
+    have, want = _UNITS.get(unit), _UNITS[base_unit]
+    if have is None or have[0] != want[0]:
+        return None
+    return float(quantity) * have[1] / want[1]
+
+
+def _unit_of(measure):
+    """Lower-cased unit from a Products API unitOfMeasure ({abbreviation, code, name}) or a plain string."""
+    if isinstance(measure, str):
+        return measure.strip().lower()
+    if isinstance(measure, dict):
+        for field in ("abbreviation", "code", "name"):
+            value = measure.get(field)
+            if isinstance(value, str) and value.strip().lower() in _UNITS:
+                return value.strip().lower()
+    return ""
+
+
+def nutrition_from_api(info):
+    """Nutrient record (see NUTRIENTS) from one Products API nutritionInformation entry; {} if it has none."""
+    record = {}
+    nutrients = info.get("nutrients") if isinstance(info, dict) else None
+    if not isinstance(nutrients, list):
+        return record
+    for nutrient in nutrients:
+        if not isinstance(nutrient, dict):
+            continue
+        quantity = nutrient.get("quantity")
+        if isinstance(quantity, bool) or not isinstance(quantity, (int, float)) or quantity < 0:
+            continue
+        key = None
+        for field in ("displayName", "description", "code"):
+            name = nutrient.get(field)
+            if isinstance(name, str):
+                key = _NAMES.get(" ".join(name.lower().replace(",", " ").split()))
+                if key:
+                    break
+        if key is None or key in record:
+            continue
+        value = _convert(quantity, _unit_of(nutrient.get("unitOfMeasure")), key)
+        if value is not None:
+            record[key] = round(value, 3)
+    return record
+
+
+class NutrientRule:
+    """A threshold a product's nutrient must meet ("sodium < 300 mg"), by its normalized filter term."""
+    __slots__ = ("term", "nutrient", "op", "threshold")
+
+    def __init__(self, term, nutrient, op, threshold):
+        self.term = term
+        self.nutrient = nutrient
+        self.op = op
+        self.threshold = threshold
+
+
+def parse_rule(text):
+    """The NutrientRule a filter term spells, None if it isn't a threshold; ValueError for an unknown nutrient/unit."""
+    term = " ".join(str(text).lower().split())
+    m = _RULE.match(term)
+    if not m:
+        return None
+    name, op, number, unit = m.groups()
+    key = _NAMES.get(name)
+    if key is None:
+        known = ", ".join(names[0] for _, names in NUTRIENTS.values())
+        raise ValueError(f"Unknown nutrient '{name}'. Known: {known}")
+    threshold = _convert(number, unit, key)
+    if threshold is None:
+        raise ValueError(f"'{unit}' is not a unit for {name}")
+    return NutrientRule(str(text).lower().strip(), key, _OPS[op], threshold)
+
+
+@functools.lru_cache(maxsize=4096)
+def rule_for(normalized_term):
+    """The rule a normalized filter term spells, or None (plain ingredient term, or not a valid rule)."""
+    try:
+        return parse_rule(normalized_term)
+    except ValueError:
+        return None
+
+
+def nutrient_column(records, nutrient):
+    """One nutrient's value per record (NaN where missing)."""
+    return [r.get(nutrient, _MISSING) if r else _MISSING for r in records]
+
+
+def compile_rules(rules):
+    """One evaluator for a list of rules: records -> {rule term: indexes of the records breaking it}."""
+    checks = tuple((r.term, r.nutrient, _BREAKS[r.op], r.threshold) for r in rules)
+
+    def evaluate(records):
+        columns = {}
+        broken = {}
+        for term, nutrient, breaks, threshold in checks:
+            column = columns.get(nutrient)
+            if column is None:
+                column = columns[nutrient] = nutrient_column(records, nutrient)
+            broken[term] = list(compress(range(len(column)), map(breaks, column, repeat(threshold))))
+        return broken
+
+    return evaluate
+
+
+class NutrientIndex:
+    """Per nutrient, the known values of a result set's products sorted once, with their product indexes."""
+
+    def __init__(self, records):
+        self.records = records
+        self._columns = {}
+
+    def _column(self, nutrient):
+        column = self._columns.get(nutrient)
+        if column is None:
+            values = nutrient_column(self.records, nutrient)
+            order = [i for i, v in enumerate(values) if v == v]
+            order.sort(key=values.__getitem__)
+            column = self._columns[nutrient] = ([values[i] for i in order], order)
+        return column
+
+    def failing(self, rule):
+        """Indexes of the products whose value breaks `rule` (one bisection over the sorted column)."""
+        values, indexes = self._column(rule.nutrient)
+        if rule.op == "<":
+            return indexes[bisect.bisect_left(values, rule.threshold):]
+        if rule.op == "<=":
+            return indexes[bisect.bisect_right(values, rule.threshold):]
+        if rule.op == ">":
+            return indexes[:bisect.bisect_right(values, rule.threshold)]
+        return indexes[:bisect.bisect_left(values, rule.threshold)]
@@ -0,0 +1,239 @@
+"""
+Price history.
+
+Every price a search sees is an observation of (store, product, location,
+day) -> integer cents. Observations are stored in SQLite (PRICE_HISTORY_PATH,
+default backend/prices.db) as one row per product, location and day holding
+the lowest regular (and promo) price seen that day, in a WITHOUT ROWID table
+keyed by exactly that, so a product priced daily for a year is 365 small
+rows and "the last 30 days" is a range scan.
+
+Recording never touches SQLite on the request path: `record` folds the
+observations into an in-memory batch (repeats of an already-written price
+are dropped there) and a background thread writes the batch in one
+transaction every few seconds. Reads (`lowest`, `history`) go through a
+per-thread read connection of their own: in WAL mode they see the last
+committed batch without waiting for one being written.
+"""
+import atexit
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+log = logging.getLogger("healthy_food_finder")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS price_observations (
+    store TEXT NOT NULL,
+    product_key TEXT NOT NULL,
+    location_id TEXT NOT NULL,
+    day INTEGER NOT NULL,
+    price_cents INTEGER NOT NULL,
+    promo_cents INTEGER,
+    PRIMARY KEY (store, product_key, location_id, day)
+) WITHOUT ROWID;
+"""
+
+_UPSERT = """
+INSERT INTO price_observations (store, product_key, location_id, day, price_cents, promo_cents)
+VALUES (?, ?, ?, ?, ?, ?)
+ON CONFLICT (store, product_key, location_id, day) DO UPDATE SET
+    price_cents = min(price_cents, excluded.price_cents),
+    promo_cents = coalesce(min(promo_cents, excluded.promo_cents), promo_cents, excluded.promo_cents)
+"""
+
+def today():
+    """Days since 1970-01-01 (UTC), the `day` of an observation made now."""
+    return int(time.time() // 86400)
+
+
+def _lower(a, b):
+    if a is None:
+        return b
+    if b is None:
+        return a
+    return min(a, b)
+
+
+class PriceHistory:
+    def __init__(self, path, flush_every_s=5.0, max_pending=50_000):
+        self.path = path
+        self.flush_every_s = flush_every_s
+        self.max_pending = max_pending
+        self._db_lock = threading.Lock()
+        self._conn = None
+        self._conn_pid = None
+        self._readers = threading.local()
+        # (store, product_key, location_id, day) -> (price_cents, promo_cents)
+        self._pending = {}
+        self._written = {}
+        self._written_day = None
+        self._counts = {"written": 0, "unchanged": 0, "dropped": 0}
+        self._cond = threading.Condition()
+        self._thread_pid = None
+        self._stopped = False
+        atexit.register(self.close)
+
+    def _connection(self):
+        # Reconnect after fork (gunicorn --preload) so workers don't share a handle.
+        if self._conn is None or self._conn_pid != os.getpid():
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=10)
+            if self.path != ":memory:":
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            self._conn = conn
+            self._conn_pid = os.getpid()
+        return self._conn
+
+    def _reader(self):
+        # One read-only connection per thread (and process); only the writer takes _db_lock.
+        if self.path == ":memory:":
+            return None
+        reader = getattr(self._readers, "conn", None)
+        if reader is None or self._readers.pid != os.getpid():
+            if self._conn_pid != os.getpid():
+                with self._db_lock:
+                    self._connection()  # (creates the file and schema)
+            reader = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=10)
+            reader.execute("PRAGMA query_only=ON")
+            self._readers.conn, self._readers.pid = reader, os.getpid()
+        return reader
+
+    def _read(self, sql, params):
+        reader = self._reader()
+        if reader is not None:
+            return reader.execute(sql, params).fetchall()
+        with self._db_lock:
+            return self._connection().execute(sql, params).fetchall()
+
+    def _ensure_writer(self):
+        # Threads don't survive fork: start the writer in the process that records.
+        if self._thread_pid != os.getpid():
+            self._thread_pid = os.getpid()
+            threading.Thread(target=self._run, name="price-history", daemon=True).start()
+
+    def record(self, store, location_id, observations):
+        """Queue (product_key, price_cents, promo_cents) observations made now; returns how many were new."""
+        day = today()
+        added = 0
+        with self._cond:
+            if self._stopped:
+                return 0
+            if self._written_day != day:
+                # Only today's rows can still change; older ones need no dedup state.
+                self._written, self._written_day = {}, day
+            for key, price, promo in observations:
+                if not key or price is None:
+                    continue
+                k = (store, key, location_id or "", day)
+                current = self._pending.get(k) or self._written.get(k)
+                value = (price, promo) if current is None else (min(current[0], price), _lower(current[1], promo))
+                if value == current:
+                    self._counts["unchanged"] += 1
+                    continue
+                if k not in self._pending and len(self._pending) >= self.max_pending:
+                    self._counts["dropped"] += 1
+                    continue
+                self._pending[k] = value
+                added += 1
+            if added:
+                self._ensure_writer()
+        return added
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait(self.flush_every_s)
+                if self._stopped:
+                    return
+            try:
+                self.flush()
+            except Exception as e:
+                log.warning(f"Price history write failed ({e}); will retry")
+
+    def flush(self):
+        """Write pending observations in one transaction; returns the number of rows written."""
+        with self._cond:
+            batch, self._pending = self._pending, {}
+        if not batch:
+            return 0
+        rows = [(*k, price, promo) for k, (price, promo) in batch.items()]
+        try:
+            with self._db_lock:
+                conn = self._connection()
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    conn.executemany(_UPSERT, rows)
+                    conn.execute("COMMIT")
+                except Exception:
+                    conn.execute("ROLLBACK")
+                    raise
+        except Exception:
+            with self._cond:
+                # Put the batch back under anything recorded meanwhile.
+                for k, (price, promo) in batch.items():
+                    newer = self._pending.get(k)
+                    self._pending[k] = (price, promo) if newer is None else (min(newer[0], price), _lower(newer[1], promo))
+            raise
+        with self._cond:
+            if self._written_day == today():
+                self._written.update((k, v) for k, v in batch.items() if k[3] == self._written_day)
+            self._counts["written"] += len(rows)
+        return len(rows)
+
+    def pending(self):
+        with self._cond:
+            return len(self._pending)
+
+    def stats(self):
+        with self._cond:
+            return dict(self._counts, pending=len(self._pending))
+
+    def history(self, store, key, location_id=None, days=90):
+        """[(day, location_id, price_cents, promo_cents)] for one product, oldest first (queued observations included)."""
+        since = today() - days
+        sql = ("SELECT day, location_id, price_cents, promo_cents FROM price_observations "
+               "WHERE store = ? AND product_key = ? AND day >= ?")
+        params = [store, key, since]
+        if location_id is not None:
+            sql += " AND location_id = ?"
+            params.append(location_id)
+        rows = {(day, loc): (price, promo) for day, loc, price, promo in self._read(sql, params)}
+        with self._cond:
+            # Seen moments ago and not written yet: merged the way the writer's upsert will.
+            queued = [(k, v) for k, v in self._pending.items() if k[0] == store and k[1] == key]
+        for (_, _, loc, day), (price, promo) in queued:
+            if day < since or (location_id is not None and loc != location_id):
+                continue
+            current = rows.get((day, loc))
+            rows[(day, loc)] = (price, promo) if current is None else (min(current[0], price), _lower(current[1], promo))
+        return [(day, loc, price, promo) for (day, loc), (price, promo) in sorted(rows.items())]
+
+    def lowest(self, store, keys, days=30):
+        """{product_key: lowest cents (regular or promo, any location)} over the `days` days before today."""
+        keys = list(dict.fromkeys(k for k in keys if k))
+        found = {}
+        end = today()
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            found.update(self._read(
+                "SELECT product_key, min(coalesce(min(price_cents, promo_cents), price_cents)) "
+                "FROM price_observations WHERE store = ? AND day >= ? AND day < ? "
+                f"AND product_key IN ({','.join('?' * len(chunk))}) GROUP BY product_key",
+                [store, end - days, end, *chunk],
+            ))
+        return found
+
+    def close(self):
+        with self._cond:
+            if self._stopped:
+                return
+            self._stopped = True
+            self._cond.notify_all()
+        try:
+            self.flush()
+        except Exception as e:
+            log.warning(f"Price history write failed at exit ({e})")
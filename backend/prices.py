@@ -0,0 +1,136 @@
+"""
+Numeric prices.
+
+Products keep their display `price` ("$3.99"), and next to it the numbers
+sorting, price filters and the price history work on:
+
+- `price_cents`: regular price in integer cents;
+- `promo_price` / `promo_cents`: the sale price, when there is one below
+  the regular price;
+- `unit_price` / `unit_price_cents` / `unit`: price per lb (weights), per
+  gal (volumes) or each (counts), from the package size, in integer cents.
+
+`set_price_fields` fills these in from whatever a store gave us (numbers
+from the Kroger API, "$3.49/lb" or "2 for $5"-style strings from scraped
+pages). Unit prices need a package size field; sizes in names aren't used.
+"""
+import math
+import re
+
+_PRICE = re.compile(r"(-\s*)?\$?\s*(\d[\d,]*(?:\.\d+)?)")
+# Multi-buy offers: "2 for $5", "3/$10".
+_MULTI_BUY = re.compile(r"(\d+)\s*(?:for|/)\s*\$\s*(\d[\d,]*(?:\.\d+)?)", re.I)
+_PLAIN_PRICE = re.compile(r"\$?\s*\d[\d,]*(?:\.\d+)?|\$?\s*\.\d+")
+_PER_UNIT = re.compile(r"/\s*(lb|each|ea)\b", re.I)
+# A package size: "12 oz", "1/2 gal", "1 1/2 lb", ".5 l", "2 pounds" (not the "2 gal" inside "1/2 gal").
+_SIZE = re.compile(
+    r"(?<![\d/.])(?:(\d+)[\s-]+(?=\d+/\d))?(\d+/\d+|\d*\.?\d+)\s*"
+    r"(fl\.?\s*oz|fluid\s+ounces?|ounces?|oz|pounds?|lbs?|kilograms?|kg|grams?|g|milliliters?|millilitres?|ml"
+    r"|liters?|litres?|l|gallons?|gal|quarts?|qt|pints?|pt|count|ct|packs?|pk)\b",
+    re.I,
+)
+
+# Package size unit -> (unit price basis, how many of the basis one unit is).
+_UNIT_BASIS = {
+    "oz": ("lb", 1 / 16), "lb": ("lb", 1.0),
+    "g": ("lb", 1 / 453.592), "kg": ("lb", 2.20462),
+    "floz": ("gal", 1 / 128), "gal": ("gal", 1.0), "qt": ("gal", 0.25), "pt": ("gal", 0.125),
+    "l": ("gal", 1 / 3.78541), "ml": ("gal", 1 / 3785.41),
+    "ct": ("each", 1.0),
+}
+# Other spellings of those units (lower-cased, spaces and dots removed).
+_UNIT_ALIASES = {
+    "ounce": "oz", "ounces": "oz", "fluidounce": "floz", "fluidounces": "floz",
+    "lbs": "lb", "pound": "lb", "pounds": "lb", "gram": "g", "grams": "g", "kilogram": "kg", "kilograms": "kg",
+    "milliliter": "ml", "milliliters": "ml", "millilitre": "ml", "millilitres": "ml",
+    "liter": "l", "liters": "l", "litre": "l", "litres": "l", "gallon": "gal", "gallons": "gal",
+    "quart": "qt", "quarts": "qt", "pint": "pt", "pints": "pt",
+    "count": "ct", "pk": "ct", "pack": "ct", "packs": "ct",
+}
+
+PRICE_FIELDS = ("price", "price_cents", "promo_price", "promo_cents", "unit_price", "unit_price_cents", "unit")
+
+
+def to_cents(value, strict=False):
+    """
+    Integer cents for 3.49, "3.49", "$3.49", "$3.49/lb" or "2 for $5" (per item); None when there is no
+    (positive) price. `strict` accepts only a bare amount ("5", "$5.00"), as for a price typed by a user.
+    """
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        if not math.isfinite(value):
+            return None
+        cents = round(value * 100)
+    else:
+        text = str(value).strip()
+        if strict:
+            if not _PLAIN_PRICE.fullmatch(text):
+                return None
+            cents = round(float(text.lstrip("$").replace(",", "")) * 100)
+        elif m := _MULTI_BUY.search(text):
+            count = int(m.group(1))
+            cents = round(float(m.group(2).replace(",", "")) * 100 / count) if count else 0
+        else:
+            m = _PRICE.search(text)
+            if not m or m.group(1):
+                return None
+            cents = round(float(m.group(2).replace(",", "")) * 100)
+    return cents if cents > 0 else None
+
+
+def format_cents(cents):
+    return f"${cents / 100:.2f}"
+
+
+def effective_cents(product):
+    """What the product costs now: the promo price if there is one, else the regular price (None if unknown)."""
+    return product.get("promo_cents") or product.get("price_cents")
+
+
+def unit_quantity(size):
+    """(basis, quantity in that basis) for a package size like "12 oz", "1/2 gal" or "6 ct"; None if it can't be read."""
+    m = _SIZE.search(size or "")
+    if not m:
+        return None
+    whole, number, unit = m.groups()
+    if "/" in number:
+        numerator, denominator = (int(n) for n in number.split("/"))
+        if not denominator:
+            return None
+        amount = int(whole or 0) + numerator / denominator
+    else:
+        amount = float(number)
+    unit = re.sub(r"[\s.]", "", unit.lower())
+    basis, factor = _UNIT_BASIS[_UNIT_ALIASES.get(unit, unit)]
+    quantity = amount * factor
+    return (basis, quantity) if quantity > 0 else None
+
+
+def set_price_fields(product, regular=None, promo=None, size=None):
+    """Fill in the numeric price fields of a product dict (from `regular`/`promo`, else its display price)."""
+    cents = to_cents(regular if regular is not None else product.get("price"))
+    for field in PRICE_FIELDS[1:]:
+        product.pop(field, None)
+    if cents is None:
+        return product
+    product["price"] = format_cents(cents) if regular is not None else product.get("price") or format_cents(cents)
+    product["price_cents"] = cents
+    promo_cents = to_cents(promo)
+    if promo_cents and promo_cents < cents:
+        product["promo_price"] = format_cents(promo_cents)
+        product["promo_cents"] = promo_cents
+    # (Only a size field: a size in the name may be anything, "5 g protein".)
+    quantity = unit_quantity(size or product.get("size"))
+    per = _PER_UNIT.search(str(product.get("price") or "")) if regular is None else None
+    if per:
+        # Sold by weight / by the piece: "$8.99/lb" already is the unit price.
+        quantity = ("lb" if per.group(1).lower() == "lb" else "each", 1.0)
+    if quantity:
+        basis, amount = quantity
+        unit_cents = round(effective_cents(product) / amount)
+        if unit_cents > 0:
+            product["unit"] = basis
+            product["unit_price_cents"] = unit_cents
+            product["unit_price"] = f"{format_cents(unit_cents)}/{basis}"
+    return product
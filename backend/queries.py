@@ -0,0 +1,145 @@
+"""
+Search query canonicalization and request coalescing.
+
+`canonicalize_query` maps the many spellings of one search ("Milk",
+"milk ", "MILK", "Annie’s  mac & cheese!") to a single canonical form. That
+form is what the search caches and the single-flight table are keyed on, so
+equivalent searches share one Kroger call and one cache entry. It is only a
+key: upstream gets the query as the user typed it (`query_text`, whitespace
+collapsed), so punctuation that matters to the store ("A1", "M&M's") is kept.
+
+Canonicalization steps, in order:
+
+- Unicode compatibility folding (NFKD) with accents dropped, then casefold;
+- apostrophes removed ("annie's" -> "annies"), other punctuation treated
+  as a word break, except "&" inside a word ("m&ms"); letters and digits
+  stay together ("a1", "c4"), numbers keep their decimals and a trailing %
+  ("2% milk");
+- whitespace collapsed;
+- stop words dropped ("the", "and", "of", ...) unless nothing else is left;
+  single letters are kept ("vitamin a");
+- optionally (QUERY_FOLD_PLURALS=true) simple English plurals folded to the
+  singular ("eggs" -> "egg", "tomatoes" -> "tomato", "berries" -> "berry").
+"""
+import os
+import re
+import threading
+import unicodedata
+
+STOP_WORDS = frozenset({"an", "the", "and", "or", "of", "for", "with", "in", "on", "some", "any"})
+
+# Words that look plural but aren't, or whose singular the suffix rules get wrong.
+_PLURAL_EXCEPTIONS = {
+    "asparagus": "asparagus", "hummus": "hummus", "couscous": "couscous", "molasses": "molasses",
+    "swiss": "swiss", "grits": "grits", "oats": "oats", "cookies": "cookie", "brownies": "brownie",
+    "smoothies": "smoothie", "veggies": "veggie", "pies": "pie", "ties": "tie", "chips": "chips",
+    "fries": "fries", "nuts": "nuts", "greens": "greens", "noodles": "noodles", "sprinkles": "sprinkles",
+}
+
+_APOSTROPHES = str.maketrans("", "", "'‘’ʼ`")
+_TOKEN_RE = re.compile(r"\d+(?:\.\d+)+%?|[^\W_]+(?:&[^\W_]+)*%?")
+
+
+def fold_plurals_enabled():
+    return os.getenv("QUERY_FOLD_PLURALS", "False").lower() == "true"
+
+
+def singularize(word):
+    """Best-effort singular of a lowercase English word (grocery vocabulary)."""
+    if word in _PLURAL_EXCEPTIONS:
+        return _PLURAL_EXCEPTIONS[word]
+    if len(word) <= 3 or not word.endswith("s") or word.endswith(("ss", "us", "is")):
+        return word
+    if word.endswith("ies"):
+        # berries -> berry, but short/possessive-looking ones just drop the s (annies -> annie)
+        return word[:-3] + "y" if len(word) > 6 else word[:-1]
+    if word.endswith(("oes", "ches", "shes", "xes", "sses", "zes")):
+        return word[:-2]
+    return word[:-1]
+
+
+def query_tokens(text):
+    """Folded word tokens of a text (no stop-word removal or plural folding)."""
+    if not text:
+        return []
+    decomposed = unicodedata.normalize("NFKD", text)
+    folded = "".join(c for c in decomposed if not unicodedata.combining(c)).casefold()
+    return _TOKEN_RE.findall(folded.translate(_APOSTROPHES))
+
+
+def query_text(text):
+    """A query as typed, whitespace collapsed: what is sent upstream."""
+    return " ".join(str(text or "").split())
+
+
+def canonicalize_query(text, fold_plurals=None):
+    """Canonical form of a search query ('' if nothing searchable is left)."""
+    if fold_plurals is None:
+        fold_plurals = fold_plurals_enabled()
+    tokens = query_tokens(text)
+    kept = [t for t in tokens if t not in STOP_WORDS] or tokens
+    if fold_plurals:
+        kept = [singularize(t) for t in kept]
+    return " ".join(kept)
+
+
+class KeyCardinality:
+    """Distinct raw vs. canonical query keys seen (each capped at `limit` to bound memory)."""
+
+    def __init__(self, limit=100_000):
+        self.limit = limit
+        self._raw = set()
+        self._canonical = set()
+        self._lock = threading.Lock()
+
+    def observe(self, raw_key, canonical_key):
+        with self._lock:
+            if len(self._raw) < self.limit:
+                self._raw.add(raw_key)
+            if len(self._canonical) < self.limit:
+                self._canonical.add(canonical_key)
+            return len(self._raw), len(self._canonical)
+
+    def counts(self):
+        with self._lock:
+            return {"raw": len(self._raw), "canonical": len(self._canonical)}
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Run at most one call per key at a time; concurrent callers wait for and share its result."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn):
+        """Returns (result, shared); shared is True when another caller's execution was reused."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+        return call.result, False
@@ -0,0 +1,86 @@
+"""
+Pre-encoded JSON responses.
+
+A cached search result is serialized once (orjson when installed, else the
+stdlib encoder) and compressed once (gzip, plus brotli when the `brotli`
+package is installed). Serving it again is a variant pick by Accept-Encoding
+and a byte write. On GET/HEAD, a client that sends back the ETag it was
+given gets a 304 without a body (RFC 9110 defines 304 for those methods only,
+so POST responses are always sent in full).
+"""
+import gzip
+import hashlib
+import json
+
+from flask import Response, request
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Below this size compression costs more than it saves.
+COMPRESS_MIN_BYTES = 1024
+
+
+def dumps(obj):
+    """JSON bytes for a response body (compact, UTF-8)."""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class EncodedBody:
+    """One JSON body with its ETag and compressed variants, built once."""
+
+    __slots__ = ("identity", "gzip", "br", "etag")
+
+    def __init__(self, obj):
+        self.identity = dumps(obj)
+        # Weak: the gzip/br representations carry the same tag.
+        self.etag = 'W/"%s"' % hashlib.blake2b(self.identity, digest_size=12).hexdigest()
+        self.gzip = None
+        self.br = None
+        if len(self.identity) >= COMPRESS_MIN_BYTES:
+            self.gzip = gzip.compress(self.identity, compresslevel=6, mtime=0)
+            if brotli is not None:
+                self.br = brotli.compress(self.identity, quality=5)
+
+    def __len__(self):
+        return len(self.identity)
+
+
+def _accepted_encodings():
+    accepted = set()
+    for part in request.headers.get("Accept-Encoding", "").split(","):
+        name, _, params = part.strip().partition(";")
+        if params.replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            continue
+        accepted.add(name.strip().lower())
+    return accepted
+
+
+def send(body, status=200):
+    """Response for an EncodedBody: 304 on a matching If-None-Match (GET/HEAD), else the best accepted variant.
+
+    Returns (response, encoding) where encoding is "not_modified", "br", "gzip" or "identity".
+    """
+    headers = {"ETag": body.etag, "Vary": "Accept-Encoding", "Cache-Control": "private, no-cache"}
+    if status == 200 and request.method in ("GET", "HEAD"):
+        tags = [t.strip() for t in request.headers.get("If-None-Match", "").split(",")]
+        if body.etag in tags or body.etag[2:] in tags or "*" in tags:
+            return Response(status=304, headers=headers), "not_modified"
+    accepted = _accepted_encodings()
+    data, encoding = body.identity, "identity"
+    if body.br is not None and "br" in accepted:
+        data, encoding = body.br, "br"
+    elif body.gzip is not None and ("gzip" in accepted or "*" in accepted):
+        data, encoding = body.gzip, "gzip"
+    if encoding != "identity":
+        headers["Content-Encoding"] = encoding
+    return Response(data, status=status, headers=headers, mimetype="application/json"), encoding
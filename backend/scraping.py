@@ -0,0 +1,1102 @@
+"""
+Scraping subsystem: Selenium browser sessions and BeautifulSoup HTML parsing.
+
+Only needed when no Kroger API credentials are configured (search scrapes
+kroger.com instead) and for product-page ingredient lookups. app.py loads this
+module on first use through `app.scraper()`, so an API-only worker never
+imports selenium, webdriver-manager or bs4.
+
+What app.py uses:
+
+- scrape_kroger_product(search_term, limit) -> [product]
+- scrape_heb_product(search_term, limit) -> [product]  (the HEB store adapter)
+- extract_kroger_products(page_source, limit) -> [product]
+- get_product_details(product_url) -> {"ingredients": ...} or None
+- selenium_pool: the shared SeleniumDriverPool
+"""
+import atexit
+import json
+import logging
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import quote_plus
+
+import requests
+from bs4 import BeautifulSoup
+
+import metrics
+import tracing
+
+log = logging.getLogger("healthy_food_finder")
+
+# Import selenium for JavaScript-rendered pages (required for HEB)
+try:
+    from selenium import webdriver
+    from selenium.webdriver.firefox.options import Options as FirefoxOptions
+    from selenium.webdriver.common.by import By
+    SELENIUM_AVAILABLE = True
+except ImportError:
+    SELENIUM_AVAILABLE = False
+    log.warning("Selenium not installed; scraping fallback disabled. Install with: pip install selenium webdriver-manager")
+
+
+
+@tracing.traced("selenium.create_driver")
+def create_selenium_driver():
+    """Create a Selenium WebDriver using Firefox/LibreWolf with proper browser emulation"""
+    if not SELENIUM_AVAILABLE:
+        raise Exception("Selenium is not installed. Run: pip install selenium webdriver-manager")
+    
+    firefox_options = FirefoxOptions()
+    # Headless by default; allow opting out for manual CAPTCHA solving/debugging.
+    headless = os.getenv("HEADLESS", "true").lower() in ("1", "true", "yes", "y")
+    if headless:
+        firefox_options.add_argument('--headless')
+        log.debug("Using headless mode")
+    else:
+        log.debug("Using visible browser mode (HEADLESS=false)")
+    
+    # Stealth options to avoid detection
+    firefox_options.set_preference("dom.webdriver.enabled", False)
+    firefox_options.set_preference("useAutomationExtension", False)
+    
+    # Realistic user agent (use a more common one)
+    firefox_options.set_preference("general.useragent.override", 
+        "Mozilla/5.0 (X11; Linux x86_64; rv:121.0) Gecko/20100101 Firefox/121.0")
+    
+    # Accept language
+    firefox_options.set_preference("intl.accept_languages", "en-US,en")
+    
+    # Window size
+    firefox_options.set_preference("browser.window.size", "1920,1080")
+    
+    # Additional stealth preferences
+    firefox_options.set_preference("privacy.trackingprotection.enabled", False)
+    firefox_options.set_preference("media.navigator.permission.disabled", True)
+    firefox_options.set_preference("dom.push.enabled", False)
+    
+    # Try to find Firefox or LibreWolf binary
+    firefox_binary_paths = [
+        '/usr/bin/firefox',
+        '/usr/bin/librewolf',
+        '/usr/local/bin/firefox',
+        '/usr/local/bin/librewolf',
+        os.path.expanduser('~/.local/bin/firefox'),
+        os.path.expanduser('~/.local/bin/librewolf'),
+    ]
+    
+    firefox_binary = None
+    for path in firefox_binary_paths:
+        if os.path.exists(path):
+            firefox_binary = path
+            log.debug(f"Found Firefox/LibreWolf at: {path}")
+            break
+    
+    if firefox_binary:
+        firefox_options.binary_location = firefox_binary
+    
+    # webdriver-manager sometimes shells out to `firefox` to detect versions; on systems with
+    # LibreWolf but no `firefox` binary, that spams `/bin/sh: 1: firefox: not found` and can
+    # contribute to flakiness. Selenium 4+ can manage drivers automatically; prefer that path.
+    try:
+        driver = webdriver.Firefox(options=firefox_options)
+        metrics.SELENIUM_DRIVERS_CREATED.inc()
+        metrics.SELENIUM_DRIVERS_ACTIVE.inc()
+        
+        # Execute script to hide webdriver property
+        driver.execute_script("""
+            Object.defineProperty(navigator, 'webdriver', {
+                get: () => undefined
+            });
+        """)
+        
+        return driver
+    except Exception as e:
+        metrics.SELENIUM_DRIVER_FAILURES.inc()
+        error_msg = f"Failed to create Firefox driver: {e}."
+        if not firefox_binary:
+            error_msg += " Firefox/LibreWolf not found. Install with: sudo apt install firefox (or download LibreWolf)"
+        else:
+            error_msg += " Make sure geckodriver is installed."
+        raise Exception(error_msg)
+
+
+def quit_selenium_driver(driver):
+    """Quit a driver created by create_selenium_driver (never raises)"""
+    if not driver:
+        return
+    try:
+        driver.quit()
+    except Exception:
+        pass
+    metrics.SELENIUM_DRIVERS_ACTIVE.dec()
+
+
+class SeleniumDriverPool:
+    """Up to `size` Firefox drivers reused across page fetches instead of one browser per product."""
+
+    def __init__(self, size):
+        self._slots = threading.BoundedSemaphore(size)
+        self._idle = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def driver(self):
+        """Borrow a driver (blocks while all `size` are busy); one that raised is quit, not reused."""
+        with self._slots:
+            with self._lock:
+                driver = self._idle.pop() if self._idle else None
+            if driver is None:
+                driver = create_selenium_driver()
+            try:
+                yield driver
+            except BaseException:
+                quit_selenium_driver(driver)
+                raise
+            with self._lock:
+                self._idle.append(driver)
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for driver in idle:
+            quit_selenium_driver(driver)
+
+
+# Product-page scrapes (details fallback) share a few long-lived browsers.
+selenium_pool = SeleniumDriverPool(int(os.getenv("SELENIUM_POOL_SIZE", "2")))
+atexit.register(selenium_pool.close)
+
+
+def _looks_like_product_url(store: str, url: str) -> bool:
+    """Heuristic guardrail to avoid non-product links (cart, cookie consent, terms, etc.)."""
+    if not url:
+        return False
+    u = url.lower()
+    # Common non-product pages that frequently appear in search DOMs
+    if any(x in u for x in ["/cart", "/account", "/signin", "/login", "/terms", "/privacy", "onetrust.com"]):
+        return False
+    if store == "kroger":
+        # Kroger product detail pages are commonly /p/<name>/<id> but we also see
+        # search-result links under /products/... depending on site experiments.
+        return (("/p/" in u) or ("/products/" in u)) and ("kroger.com" in u or u.startswith("/"))
+    return True
+
+def scrape_heb_product_selenium(search_term, limit=20):
+    """Scrape HEB using Selenium with browser emulation"""
+    import time
+    
+    driver = None
+    start_time = time.time()
+    max_total_time = 25  # Maximum 25 seconds total
+    
+    def check_timeout():
+        if time.time() - start_time > max_total_time:
+            raise TimeoutError("Scraping operation timed out")
+    
+    try:
+        driver = create_selenium_driver()
+        # Set page load timeout
+        driver.set_page_load_timeout(12)
+        driver.implicitly_wait(2)  # Reduce implicit wait
+        
+        search_url = f"https://www.heb.com/search/?q={quote_plus(search_term)}"
+        
+        log.info(f"Loading HEB search page: {search_url}")
+        try:
+            driver.get(search_url)
+        except Exception as e:
+            log.warning(f"Page load timeout or error: {e}")
+            # Continue anyway - page might have partially loaded
+        
+        check_timeout()
+        
+        # Wait for page to load and bypass Incapsula challenge
+        # Incapsula may need more time to verify
+        time.sleep(3)  # Increased wait for Incapsula challenge
+        
+        # Check if we're blocked by Incapsula
+        page_source_check = driver.page_source
+        if 'Incapsula' in page_source_check[:1000]:
+            log.debug("Detected Incapsula challenge, waiting for it to complete...")
+            # Wait longer and try to interact with page
+            time.sleep(5)
+            check_timeout()
+            
+            # Try scrolling to trigger any lazy loading or verification
+            try:
+                driver.execute_script("window.scrollTo(0, 100);")
+                time.sleep(1)
+                driver.execute_script("window.scrollTo(0, 0);")
+                time.sleep(2)
+            except:
+                pass
+        
+        check_timeout()
+        
+        # Try to wait for product elements with multiple strategies
+        products = []
+        max_wait = 15
+        
+        # Skip element waiting - go straight to page source parsing (faster)
+        log.debug("Parsing page source directly (faster approach)...")
+        product_elements = []  # Skip element-based extraction for speed
+        
+        # If we only found one element, it might be a container - try to find children
+        if len(product_elements) == 1:
+            log.debug("Only one element found, looking for child product elements...")
+            try:
+                # Try to find child elements that might be individual products
+                child_selectors = [
+                    "article",
+                    "[data-testid*='product']",
+                    "[class*='product']",
+                    "a[href*='/product']",
+                    "a[href*='/p/']",
+                ]
+                for child_selector in child_selectors:
+                    children = product_elements[0].find_elements(By.CSS_SELECTOR, child_selector)
+                    if children and len(children) > 1:
+                        product_elements = children
+                        log.debug(f"Found {len(children)} child product elements")
+                        break
+            except:
+                pass
+        
+        # Parse page source for product links (primary method - faster)
+        check_timeout()
+        
+        # Get page source and check if we're blocked
+        page_source = driver.page_source
+        log.debug(f"Page source length: {len(page_source)} characters")
+        
+        # Check if page loaded properly (not just Incapsula block page)
+        if len(page_source) < 1000 or 'Incapsula' in page_source[:500]:
+            log.warning("Page may be blocked by Incapsula. Waiting longer and retrying...")
+            # Wait longer for Incapsula challenge to complete
+            time.sleep(5)
+            check_timeout()
+            page_source = driver.page_source
+            log.debug(f"After wait, page source length: {len(page_source)} characters")
+            
+            # Check again
+            if 'Incapsula' in page_source[:1000]:
+                log.error("Still blocked by Incapsula. Page may require manual verification.")
+                # Try scrolling to trigger any lazy loading
+                try:
+                    driver.execute_script("window.scrollTo(0, document.body.scrollHeight/2);")
+                    time.sleep(2)
+                    page_source = driver.page_source
+                except:
+                    pass
+        
+        soup = BeautifulSoup(page_source, 'html.parser')
+        
+        # Look for product links - HEB uses various patterns
+        product_link_patterns = [
+            r'/product/',
+            r'/p/',
+            r'/shop/product',
+            r'/product-detail',
+        ]
+        
+        all_product_links = []
+        for pattern in product_link_patterns:
+            links = soup.find_all('a', href=re.compile(pattern, re.I))
+            all_product_links.extend(links)
+        
+        # Remove duplicates based on href
+        seen_urls = set()
+        unique_links = []
+        for link in all_product_links:
+            href = link.get('href', '')
+            if href and href not in seen_urls:
+                seen_urls.add(href)
+                unique_links.append(link)
+        
+        log.debug(f"Found {len(unique_links)} unique product links in page source")
+        
+        # If no links found and page seems blocked, try alternative extraction
+        if len(unique_links) == 0:
+            log.debug("No product links found. Trying alternative extraction methods...")
+            # Try to find any links that might be products
+            all_links = soup.find_all('a', href=True)
+            log.debug(f"Total links on page: {len(all_links)}")
+            
+            # Look for links with product-like characteristics
+            for link in all_links[:100]:
+                href = link.get('href', '')
+                link_text = link.get_text(strip=True)
+                
+                # Skip obvious non-product links
+                if any(skip in href.lower() for skip in ['/cart', '/account', '/help', '/store', '/deals', '/recipes', '/categories']):
+                    continue
+                
+                # Look for links that might be products
+                if href and len(href) > 5 and len(link_text) > 5 and len(link_text) < 200:
+                    # Check if it's not just navigation text
+                    if not any(nav in link_text.lower() for nav in ['shop', 'cart', 'account', 'help', 'menu', 'search', 'browse']):
+                        unique_links.append(link)
+                        if len(unique_links) >= limit:
+                            break
+            
+            log.debug(f"Found {len(unique_links)} potential product links via alternative method")
+        
+        # Extract products from links (with timeout checks)
+        for link in unique_links[:limit*2]:
+            check_timeout()  # Check timeout periodically
+            try:
+                # Get product URL
+                url = link.get('href', '')
+                if not url:
+                    continue
+                if not url.startswith('http'):
+                    url = 'https://www.heb.com' + url
+                
+                # Find product name - try link text first
+                name = link.get_text(strip=True)
+                
+                # If link text is empty or too short, look in parent/sibling elements
+                if not name or len(name) < 3:
+                    # Walk up the DOM tree to find name
+                    parent = link.parent
+                    for _ in range(3):  # Check up to 3 levels up
+                        if parent:
+                            # Look for headings or spans with product name
+                            name_elem = parent.find(['h1', 'h2', 'h3', 'h4', 'span', 'div'], 
+                                                   class_=re.compile(r'name|title|product', re.I))
+                            if name_elem:
+                                name = name_elem.get_text(strip=True)
+                                if name and len(name) > 3:
+                                    break
+                            # Try any heading
+                            if not name or len(name) < 3:
+                                heading = parent.find(['h1', 'h2', 'h3', 'h4'])
+                                if heading:
+                                    name = heading.get_text(strip=True)
+                                    if name and len(name) > 3:
+                                        break
+                            parent = parent.parent if hasattr(parent, 'parent') else None
+                
+                # Clean up name - take first line, remove extra whitespace
+                if name:
+                    name = ' '.join(name.split()[:20])  # Limit to first 20 words
+                    if len(name) > 200:
+                        name = name[:200] + '...'
+                
+                if not name or len(name) < 3:
+                    continue
+                
+                # Find price - look in the same container as the link
+                price = 'N/A'
+                try:
+                    # Find parent container
+                    container = link.find_parent(['article', 'div', 'li'])
+                    if container:
+                        # Look for price patterns
+                        price_text = container.get_text()
+                        # Match price patterns like $4.99, $1.98, etc.
+                        price_match = re.search(r'\$[\d,]+\.?\d{0,2}', price_text)
+                        if price_match:
+                            price = price_match.group(0)
+                except:
+                    pass
+                
+                # Find image
+                image = ''
+                try:
+                    img = link.find('img')
+                    if not img:
+                        container = link.find_parent(['article', 'div'])
+                        if container:
+                            img = container.find('img')
+                    if img:
+                        image = img.get('src', img.get('data-src', ''))
+                        if image and not image.startswith('http'):
+                            image = 'https://www.heb.com' + image
+                except:
+                    pass
+                
+                product = {
+                    'name': name,
+                    'price': price,
+                    'url': url,
+                    'image': image,
+                    'ingredients': '',
+                    'store': 'HEB'
+                }
+                
+                # Avoid duplicates
+                if not any(p['name'].lower() == product['name'].lower() or 
+                          p['url'] == product['url'] for p in products):
+                    products.append(product)
+                    log.debug(f"Extracted product from link: {name[:60]}...")
+                    
+                if len(products) >= limit:
+                    break
+            except Exception as e:
+                log.warning(f"Error extracting product from link: {e}")
+                continue
+        else:
+            # Parse found elements
+            log.debug(f"Parsing {len(product_elements)} product elements...")
+            for i, element in enumerate(product_elements[:limit*2]):  # Get more to filter later
+                try:
+                    # Skip if element is too large (likely a container)
+                    try:
+                        element_text = element.text.strip()
+                        if len(element_text) > 1000:  # Too much text = probably a container
+                            log.debug(f"Element {i}: Skipping - too large (container?)")
+                            continue
+                    except:
+                        pass
+                    
+                    # Try to get product name - look for specific HEB patterns
+                    name = None
+                    
+                    # Method 1: Look for links with product URLs
+                    try:
+                        links = element.find_elements(By.CSS_SELECTOR, "a[href*='/product'], a[href*='/p/']")
+                        if links:
+                            link_text = links[0].text.strip()
+                            if link_text and len(link_text) > 3 and len(link_text) < 200:
+                                name = link_text.split('\n')[0].strip()
+                    except:
+                        pass
+                    
+                    # Method 2: Look for headings (h1-h4) which often contain product names
+                    if not name:
+                        try:
+                            for tag in ['h1', 'h2', 'h3', 'h4']:
+                                headings = element.find_elements(By.TAG_NAME, tag)
+                                if headings:
+                                    heading_text = headings[0].text.strip()
+                                    if heading_text and len(heading_text) > 3 and len(heading_text) < 200:
+                                        name = heading_text.split('\n')[0].strip()
+                                        break
+                        except:
+                            pass
+                    
+                    # Method 3: Get element HTML and parse with BeautifulSoup
+                    if not name:
+                        try:
+                            element_html = element.get_attribute('outerHTML')
+                            soup = BeautifulSoup(element_html, 'html.parser')
+                            
+                            # Try to find name in various places
+                            name_selectors = [
+                                soup.find(['h1', 'h2', 'h3', 'h4']),
+                                soup.find('a', href=re.compile(r'/product|/p/', re.I)),
+                                soup.find(['span', 'div'], class_=re.compile(r'name|title|product-name', re.I)),
+                                soup.find('a'),
+                            ]
+                            
+                            for name_elem in name_selectors:
+                                if name_elem:
+                                    name_text = name_elem.get_text(strip=True)
+                                    if name_text and len(name_text) > 3 and len(name_text) < 200:
+                                        name = name_text.split('\n')[0].strip()
+                                        break
+                        except Exception as e:
+                            log.warning(f"Error parsing element HTML: {e}")
+                            continue
+                    
+                    # Method 4: Last resort - use first line of element text
+                    if not name:
+                        try:
+                            element_text = element.text.strip()
+                            if element_text:
+                                first_line = element_text.split('\n')[0].strip()
+                                # Only use if it looks like a product name (not too long, has letters)
+                                if len(first_line) > 3 and len(first_line) < 200 and any(c.isalpha() for c in first_line):
+                                    name = first_line
+                        except:
+                            pass
+                    
+                    # Method 2: Get element HTML and parse with BeautifulSoup
+                    if not name or len(name) < 3:
+                        try:
+                            element_html = element.get_attribute('outerHTML')
+                            soup = BeautifulSoup(element_html, 'html.parser')
+                            
+                            # Try multiple ways to find name
+                            name_selectors = [
+                                soup.find(['h1', 'h2', 'h3', 'h4'], class_=re.compile(r'name|title|product-name', re.I)),
+                                soup.find('a', class_=re.compile(r'name|title', re.I)),
+                                soup.find(['span', 'div'], class_=re.compile(r'name|title|product-name', re.I)),
+                                soup.find(['h1', 'h2', 'h3', 'h4']),
+                                soup.find('a'),
+                            ]
+                            
+                            for name_elem in name_selectors:
+                                if name_elem:
+                                    name_text = name_elem.get_text(strip=True)
+                                    if name_text and len(name_text) > 3 and len(name_text) < 200:
+                                        name = name_text.split('\n')[0].strip()
+                                        break
+                        except Exception as e:
+                            log.warning(f"Error parsing element HTML: {e}")
+                            continue
+                    
+                    if not name or len(name) < 3:
+                        log.debug(f"Element {i}: Could not extract product name")
+                        continue
+                    
+                    log.debug(f"Element {i}: Found product name: {name[:50]}...")
+                    
+                    # Find price - try multiple methods
+                    price = 'N/A'
+                    try:
+                        # Try to find price in element directly
+                        price_elements = element.find_elements(By.CSS_SELECTOR, "[class*='price'], [class*='cost'], [class*='amount'], [data-testid*='price']")
+                        if price_elements:
+                            price = price_elements[0].text.strip()
+                        else:
+                            # Fall back to BeautifulSoup parsing
+                            if 'soup' in locals():
+                                price_elem = soup.find(['span', 'div'], class_=re.compile(r'price|cost|amount', re.I))
+                                if price_elem:
+                                    price = price_elem.get_text(strip=True)
+                    except:
+                        pass
+                    
+                    # Find URL - try multiple methods
+                    url = ''
+                    try:
+                        # Try to find link in element directly
+                        link_elements = element.find_elements(By.TAG_NAME, 'a')
+                        if link_elements:
+                            url = link_elements[0].get_attribute('href')
+                        else:
+                            # Fall back to BeautifulSoup
+                            if 'soup' in locals():
+                                link = soup.find('a', href=True)
+                                if link:
+                                    url = link.get('href', '')
+                        
+                        if url and not url.startswith('http'):
+                            url = 'https://www.heb.com' + url
+                    except:
+                        pass
+                    
+                    # Find image - try multiple methods
+                    image = ''
+                    try:
+                        # Try to find image in element directly
+                        img_elements = element.find_elements(By.TAG_NAME, 'img')
+                        if img_elements:
+                            image = img_elements[0].get_attribute('src') or img_elements[0].get_attribute('data-src')
+                        else:
+                            # Fall back to BeautifulSoup
+                            if 'soup' in locals():
+                                img = soup.find('img', src=True)
+                                if img:
+                                    image = img.get('src', img.get('data-src', ''))
+                        
+                        if image and not image.startswith('http'):
+                            image = 'https://www.heb.com' + image
+                    except:
+                        pass
+                    
+                    product = {
+                        'name': name,
+                        'price': price,
+                        'url': url,
+                        'image': image,
+                        'ingredients': '',
+                        'store': 'HEB'
+                    }
+                    
+                    # Avoid duplicates
+                    if not any(p['name'].lower() == product['name'].lower() for p in products):
+                        products.append(product)
+                        log.debug(f"Added product: {name[:50]}... (Price: {price}, URL: {url[:50] if url else 'N/A'}...)")
+                    else:
+                        log.debug(f"Skipped duplicate: {name[:50]}...")
+                        
+                except Exception as e:
+                    log.warning(f"Error parsing element: {e}")
+                    continue
+        
+        elapsed = time.time() - start_time
+        log.info(f"Total products extracted: {len(products)} (took {elapsed:.1f}s)")
+        if products:
+            log.debug(f"Sample product: {products[0]}")
+        return products[:limit]
+        
+    except TimeoutError:
+        log.warning(f"Scraping operation timed out after {max_total_time} seconds")
+        return []
+    except Exception as e:
+        log.exception(f"Selenium scraping error: {e}")
+        return []
+    finally:
+        quit_selenium_driver(driver)
+
+def scrape_heb_product(search_term, limit=20):
+    """
+    Scrape HEB website for products using Selenium browser emulation
+    """
+    if not SELENIUM_AVAILABLE:
+        log.error("Selenium not available. Install with: pip install selenium webdriver-manager")
+        return []
+    
+    # Use Selenium for real scraping
+    products = scrape_heb_product_selenium(search_term, limit)
+    
+    log.info(f"Scraped {len(products)} products from HEB")
+    
+    # Filter products to ensure they're relevant to the search term
+    # But be lenient - if HEB returned them, they're probably relevant
+    if products:
+        search_terms = search_term.lower().split()
+        relevant_products = []
+        
+        for product in products:
+            product_name_lower = product.get('name', '').lower()
+            # Check if any search term appears in the product name
+            if any(term in product_name_lower for term in search_terms if len(term) > 2):
+                relevant_products.append(product)
+            # Also include if the full search term is in the name
+            elif search_term.lower() in product_name_lower:
+                relevant_products.append(product)
+            # If search term is short or we have few results, include all products
+            # (HEB's search is usually good, so trust their results)
+            elif len(search_term) < 4 or len(products) <= 5:
+                relevant_products.append(product)
+        
+        log.info(f"After filtering: {len(relevant_products)} relevant products (out of {len(products)} total)")
+        # Return relevant products if found, otherwise return all products (they might still be valid)
+        return relevant_products[:limit] if relevant_products else products[:limit]
+    
+    log.info("No products found")
+    return []
+
+def get_product_details(product_url):
+    """Fetch detailed product information including ingredients using Selenium"""
+    if not product_url or not product_url.startswith('http'):
+        return None
+    
+    if not SELENIUM_AVAILABLE:
+        # Fallback to requests if Selenium not available (will likely fail due to bot protection)
+        try:
+            headers = {
+                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+                'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+                'Accept-Language': 'en-US,en;q=0.5',
+            }
+            response = requests.get(product_url, headers=headers, timeout=10)
+            if response.status_code != 200:
+                return None
+            soup = BeautifulSoup(response.content, 'html.parser')
+        except:
+            return None
+    else:
+        # Use Selenium to fetch product page (bypasses bot protection); drivers are pooled, not per product
+        try:
+            with selenium_pool.driver() as driver:
+                driver.set_page_load_timeout(10)  # 10 second timeout for ingredient pages
+                driver.implicitly_wait(2)
+                
+                log.info(f"Fetching ingredients from: {product_url}")
+                driver.get(product_url)
+                
+                # Wait a moment for page to load
+                time.sleep(1.5)
+                
+                # Get page source and parse
+                soup = BeautifulSoup(driver.page_source, 'html.parser')
+        except Exception as e:
+            log.warning(f"Error loading product page {product_url}: {e}")
+            return None
+    
+    # Now parse ingredients from the page
+    ingredients_text = ""
+    
+    # Strategy 1: Look for HEB's specific ingredients structure
+    # <div class="sc-578c3839-3 frvaxi"><h4>Ingredients</h4><span>...</span></div>
+    ingredients_div = soup.find('div', class_=re.compile(r'sc-578c3839-3|frvaxi', re.I))
+    if ingredients_div:
+        # Look for h4 with "Ingredients" text
+        h4 = ingredients_div.find('h4', string=re.compile(r'ingredients?', re.I))
+        if h4:
+            # Find the span with actual ingredients
+            span = ingredients_div.find('span')
+            if span:
+                ingredients_text = span.get_text(strip=True)
+                log.debug(f"Found ingredients using HEB structure: {ingredients_text[:100]}...")
+    
+    # Strategy 2: Look for any div containing "Ingredients" heading
+    if not ingredients_text:
+        ingredients_heading = soup.find(['h4', 'h3', 'h2'], string=re.compile(r'ingredients?', re.I))
+        if ingredients_heading:
+            # Look in parent or next sibling
+            parent = ingredients_heading.parent
+            if parent:
+                # Try to find span or div with ingredients text
+                ingredients_elem = parent.find(['span', 'div', 'p'])
+                if ingredients_elem:
+                    ingredients_text = ingredients_elem.get_text(strip=True)
+    
+    # Strategy 3: Look for structured data (JSON-LD)
+    if not ingredients_text:
+        script_tags = soup.find_all('script', type=re.compile(r'application/json|application/ld\+json'))
+        for script in script_tags:
+            try:
+                data = json.loads(script.string)
+                if isinstance(data, dict):
+                    ingredients = data.get('ingredients', data.get('nutrition', {}).get('ingredients', ''))
+                    if ingredients:
+                        ingredients_text = ingredients if isinstance(ingredients, str) else ', '.join(ingredients) if isinstance(ingredients, list) else str(ingredients)
+                        break
+            except (json.JSONDecodeError, AttributeError):
+                continue
+    
+    # Strategy 4: Generic search for ingredients section
+    if not ingredients_text:
+        # Look for any div with class containing "ingredient"
+        ingredient_divs = soup.find_all('div', class_=re.compile(r'ingredient', re.I))
+        for div in ingredient_divs:
+            text = div.get_text(strip=True)
+            if 'ingredient' in text.lower() and len(text) > 20:
+                # Extract text after "Ingredients" label
+                parts = re.split(r'ingredients?:?\s*', text, flags=re.I)
+                if len(parts) > 1:
+                    ingredients_text = parts[1].strip()
+                    break
+    
+    return {
+        'ingredients': ingredients_text.strip() if ingredients_text else ""
+    }
+
+
+def scrape_kroger_product(search_term, limit=20):
+    """Scrape Kroger website for products using Selenium"""
+    if not SELENIUM_AVAILABLE:
+        log.error("Selenium not available. Install with: pip install selenium webdriver-manager")
+        return []
+    
+    driver = None
+    start_time = time.time()
+    max_total_time = 25
+    
+    try:
+        driver = create_selenium_driver()
+        driver.set_page_load_timeout(15)
+        driver.implicitly_wait(3)
+        
+        # Kroger search URL
+        search_url = f"https://www.kroger.com/search?query={quote_plus(search_term)}"
+        
+        with tracing.span("selenium.page_load", url=search_url):
+            log.debug(f"Loading Kroger search page: {search_url}")
+            try:
+                driver.get(search_url)
+            except Exception as e:
+                log.warning(f"Page load timeout or error: {e}")
+            
+            # Wait for page to load and scroll to trigger lazy loading
+            time.sleep(3)
+            try:
+                driver.execute_script("window.scrollTo(0, 500);")
+                time.sleep(1)
+            except:
+                pass
+            
+            # Parse page source
+            page_source = driver.page_source
+        log.debug(f"Page source length: {len(page_source)} characters")
+        if "Access Denied" in page_source or "errors.edgesuite.net" in page_source:
+            raise Exception(
+                "Kroger blocked automated access (Akamai 'Access Denied'). "
+                "This can happen in headless mode or from restricted networks. "
+                "Try setting HEADLESS=false to solve any challenge manually, or try again from a different network."
+            )
+        products = extract_kroger_products(page_source, limit, deadline=start_time + max_total_time)
+        log.info(f"Scraped {len(products)} products from Kroger")
+        return products
+        
+    except Exception as e:
+        log.exception(f"Kroger scraping error: {e}")
+        return []
+    finally:
+        quit_selenium_driver(driver)
+
+
+def extract_kroger_products(page_source, limit=20, deadline=None):
+    """Extract products from a rendered Kroger search page (no browser required)"""
+    with tracing.span("html.parse", bytes=len(page_source)):
+        soup = BeautifulSoup(page_source, 'html.parser')
+    script_tags = soup.find_all('script', type=re.compile(r'application/json|application/ld\+json'))
+    products = []
+    
+    # Strategy 1: Look for JSON-LD structured data
+    with tracing.span("extract.json_ld") as sp:
+        _extract_kroger_json_ld(script_tags, products, limit)
+        sp.set(products=len(products))
+
+    # Strategy 1b (fallback): Parse embedded JSON blobs that contain product objects.
+    # Kroger often embeds data containing fields like upc/description/seoUrl without JSON-LD.
+    with tracing.span("extract.embedded_json") as sp:
+        _extract_kroger_embedded_json(script_tags, products, limit)
+        sp.set(products=len(products))
+    
+    # Strategies 2 + 3: product links and product containers
+    with tracing.span("extract.links") as sp:
+        unique_links = _find_kroger_product_links(soup, limit)
+        sp.set(links=len(unique_links))
+    
+    # Extract products from links
+    with tracing.span("extract.link_products") as sp:
+        _extract_kroger_link_products(unique_links, products, limit, deadline)
+        sp.set(products=len(products))
+    
+    return products[:limit]
+
+
+def _extract_kroger_json_ld(script_tags, products, limit):
+    for script in script_tags:
+        try:
+            blob = (script.string or script.get_text() or "").strip()
+            if not blob or blob[0] not in "{[":
+                continue
+            data = json.loads(blob)
+            if isinstance(data, dict):
+                # Look for product lists
+                items = data.get('itemListElement', data.get('@graph', []))
+                if isinstance(items, list):
+                    for item in items[:limit*2]:
+                        if isinstance(item, dict):
+                            name = item.get('name', '')
+                            url = item.get('url', item.get('@id', ''))
+                            if name and url:
+                                product = {
+                                    'name': name[:200],
+                                    'price': 'N/A',
+                                    'url': url if url.startswith('http') else 'https://www.kroger.com' + url,
+                                    'image': item.get('image', ''),
+                                    'ingredients': '',
+                                    'store': 'Kroger'
+                                }
+                                if not any(p['url'] == product['url'] for p in products):
+                                    products.append(product)
+                                    log.debug(f"Found product from JSON-LD: {name[:50]}...")
+        except (json.JSONDecodeError, AttributeError):
+            continue
+
+
+def _walk_json(obj):
+    if isinstance(obj, dict):
+        yield obj
+        for v in obj.values():
+            yield from _walk_json(v)
+    elif isinstance(obj, list):
+        for it in obj:
+            yield from _walk_json(it)
+
+
+def _kroger_product_from_obj(o):
+    if not isinstance(o, dict):
+        return None
+    name = o.get("description") or o.get("name") or ""
+    url = o.get("seoUrl") or o.get("url") or o.get("@id") or ""
+    upc = o.get("upc") or o.get("productId") or o.get("id") or ""
+    if not name or not url:
+        return None
+    # Require at least one Kroger-ish identifier to reduce false positives.
+    if not upc and "/p/" not in str(url) and "/products/" not in str(url):
+        return None
+    if not _looks_like_product_url("kroger", str(url)):
+        return None
+
+    price = "N/A"
+    try:
+        items = o.get("items")
+        if isinstance(items, list) and items:
+            price_val = items[0].get("price") if isinstance(items[0], dict) else None
+            if price_val:
+                price = f"${price_val}" if isinstance(price_val, (int, float)) else str(price_val)
+    except Exception:
+        pass
+
+    image = ""
+    try:
+        imgs = o.get("images") or o.get("image")
+        if isinstance(imgs, list) and imgs:
+            if isinstance(imgs[0], dict):
+                image = imgs[0].get("url") or imgs[0].get("sizes", {}).get("medium", "")
+            elif isinstance(imgs[0], str):
+                image = imgs[0]
+        elif isinstance(imgs, str):
+            image = imgs
+    except Exception:
+        pass
+
+    if isinstance(url, str) and not url.startswith("http"):
+        url = "https://www.kroger.com" + url
+    return {
+        "name": str(name)[:200],
+        "price": price,
+        "url": url,
+        "image": image,
+        "ingredients": "",
+        "store": "Kroger",
+    }
+
+
+def _extract_kroger_embedded_json(script_tags, products, limit):
+    for script in script_tags:
+        try:
+            blob = (script.string or script.get_text() or "").strip()
+            if not blob or ("\"upc\"" not in blob and "\"seoUrl\"" not in blob and "\"description\"" not in blob):
+                continue
+            if blob[0] not in "{[":
+                continue
+            data = json.loads(blob)
+            for o in _walk_json(data):
+                prod = _kroger_product_from_obj(o)
+                if prod and not any(p["url"] == prod["url"] for p in products):
+                    products.append(prod)
+                    if len(products) >= limit:
+                        break
+        except Exception:
+            continue
+
+
+def _find_kroger_product_links(soup, limit):
+    # Strategy 2: Look for product links with various patterns
+    # NOTE: Kroger sometimes uses /products/... in search results; include both.
+    product_link_patterns = [
+        r'/p/',
+        r'/products/',
+    ]
+    
+    all_product_links = []
+    for pattern in product_link_patterns:
+        links = soup.find_all('a', href=re.compile(pattern, re.I))
+        all_product_links.extend(links)
+        if links:
+            log.debug(f"Found {len(links)} links matching pattern: {pattern}")
+    
+    # Strategy 3: Look for product containers with data attributes or product classes
+    product_containers = []
+    # Try containers with data attributes
+    containers_with_data = soup.find_all(['div', 'article', 'li'], attrs={'data-product-id': True})
+    product_containers.extend(containers_with_data)
+    containers_with_sku = soup.find_all(['div', 'article', 'li'], attrs={'data-sku': True})
+    product_containers.extend(containers_with_sku)
+    # Try containers with product/item classes
+    containers_with_class = soup.find_all(['div', 'article', 'li'], 
+                                         class_=re.compile(r'product|item', re.I))
+    product_containers.extend(containers_with_class)
+    # Remove duplicates
+    seen_containers = set()
+    unique_containers = []
+    for container in product_containers:
+        container_id = id(container)
+        if container_id not in seen_containers:
+            seen_containers.add(container_id)
+            unique_containers.append(container)
+    product_containers = unique_containers
+    log.debug(f"Found {len(product_containers)} product containers")
+    
+    for container in product_containers[:limit*2]:
+        try:
+            link = container.find('a', href=re.compile(r'/p/|/products/', re.I))
+            if link:
+                all_product_links.append(link)
+        except:
+            pass
+    
+    # Remove duplicates
+    seen_urls = set()
+    unique_links = []
+    for link in all_product_links:
+        href = link.get('href', '')
+        if href and href not in seen_urls:
+            seen_urls.add(href)
+            unique_links.append(link)
+    
+    log.debug(f"Found {len(unique_links)} unique product links from Kroger")
+    return unique_links
+
+
+def _extract_kroger_link_products(unique_links, products, limit, deadline=None):
+    for link in unique_links[:limit*2]:
+        if deadline is not None and time.time() > deadline:
+            break
+        try:
+            url = link.get('href', '')
+            if not url:
+                continue
+            if not _looks_like_product_url("kroger", url):
+                continue
+            if not url.startswith('http'):
+                url = 'https://www.kroger.com' + url
+            if not _looks_like_product_url("kroger", url):
+                continue
+            
+            name = link.get_text(strip=True)
+            if not name or len(name) < 3:
+                # Try to find name in parent elements
+                parent = link.parent
+                for _ in range(3):
+                    if parent:
+                        name_elem = parent.find(['h1', 'h2', 'h3', 'h4', 'span', 'div'], 
+                                               class_=re.compile(r'name|title|product', re.I))
+                        if name_elem:
+                            name = name_elem.get_text(strip=True)
+                            if name and len(name) > 3:
+                                break
+                        parent = parent.parent if hasattr(parent, 'parent') else None
+            
+            if not name or len(name) < 3:
+                continue
+            
+            # Find price
+            price = 'N/A'
+            try:
+                container = link.find_parent(['article', 'div', 'li'])
+                if container:
+                    price_text = container.get_text()
+                    price_match = re.search(r'\$[\d,]+\.?\d{0,2}', price_text)
+                    if price_match:
+                        price = price_match.group(0)
+            except:
+                pass
+            
+            # Find image
+            image = ''
+            try:
+                img = link.find('img')
+                if not img:
+                    container = link.find_parent(['article', 'div'])
+                    if container:
+                        img = container.find('img')
+                if img:
+                    image = img.get('src', img.get('data-src', ''))
+                    if image and not image.startswith('http'):
+                        image = 'https://www.kroger.com' + image
+            except:
+                pass
+            
+            product = {
+                'name': name[:200],
+                'price': price,
+                'url': url,
+                'image': image,
+                'ingredients': '',
+                'store': 'Kroger'
+            }
+            
+            if not any(p['name'].lower() == product['name'].lower() or 
+                      p['url'] == product['url'] for p in products):
+                products.append(product)
+                if len(products) >= limit:
+                    break
+        except Exception as e:
+            log.warning(f"Error extracting product from Kroger: {e}")
+            continue
@@ -0,0 +1,106 @@
+"""
+Store adapters.
+
+Each grocery store the backend can search is a `StoreAdapter`: a name, what
+it can do (`capabilities`), how hard it may be hit (`rate_limit_per_minute`,
+`timeout_s`) and the calls behind it (`search`, `details`). Adapters are
+registered in a `StoreRegistry`; the API looks stores up there instead of
+branching on store names, and a `store=all` search fans out to every enabled
+adapter at once, so adding a store adds its latency to the slowest store,
+not to the total.
+"""
+from enrichment import RateLimiter
+
+# Capabilities an adapter can declare.
+SEARCH = "search"
+DETAILS = "details"          # products by ID (batched)
+LOCATIONS = "locations"      # per-location prices / availability (location_ids)
+INGREDIENTS = "ingredients"  # search results carry ingredient statements
+PAGES = "pages"              # search(start=) returns later upstream result pages
+
+
+class RateLimited(Exception):
+    """The adapter's rate limit has no call to spare right now."""
+
+
+class StoreAdapter:
+    """
+    One store. Subclasses set the class attributes and implement `search`
+    (and `details` if they declare it); everything else has a default.
+    """
+
+    name = ""
+    display_name = ""
+    capabilities = frozenset({SEARCH})
+    # Upstream calls per minute this process may make (None = no limit of our own).
+    rate_limit_per_minute = None
+    # Longest a search may take before a multi-store search gives up on this store.
+    timeout_s = 20.0
+
+    def __init__(self):
+        self._limiter = RateLimiter(self.rate_limit_per_minute, burst=3) if self.rate_limit_per_minute else None
+
+    def enabled(self):
+        """Whether the store can be searched in this deployment (credentials, drivers, settings)."""
+        return True
+
+    def default_location_id(self):
+        """Location a search without location_ids is priced for ("" if the store has one price list)."""
+        return ""
+
+    def supports(self, capability):
+        return capability in self.capabilities
+
+    def acquire(self):
+        """Take one upstream call from the rate limit; RateLimited if there is none left."""
+        if self._limiter is not None:
+            wait = self._limiter.wait_time()
+            if wait:
+                raise RateLimited(f"{self.name}: rate limit reached, retry in {wait:.1f}s")
+
+    def search(self, term, limit=20, location_id=None, start=0):
+        """
+        Products (dicts, with `_filter_text` where there is more to filter on than the name) for a query;
+        `start` skips that many upstream results (adapters declaring PAGES).
+        """
+        raise NotImplementedError
+
+    def details(self, product_ids, location_id=None):
+        """{productId: product} for the IDs the store knows."""
+        raise NotImplementedError(f"{self.name} has no product lookup")
+
+    def describe(self):
+        return {
+            "name": self.name,
+            "display_name": self.display_name or self.name,
+            "enabled": self.enabled(),
+            "capabilities": sorted(self.capabilities),
+            "rate_limit_per_minute": self.rate_limit_per_minute,
+            "timeout_s": self.timeout_s,
+        }
+
+
+class StoreRegistry:
+    """Adapters by name, in registration order (the order a multi-store search merges in)."""
+
+    def __init__(self):
+        self._adapters = {}
+
+    def register(self, adapter):
+        if not adapter.name or adapter.name == "all":
+            raise ValueError(f"Invalid store name: {adapter.name!r}")
+        self._adapters[adapter.name] = adapter
+        return adapter
+
+    def get(self, name):
+        """The adapter registered as `name`, or None."""
+        return self._adapters.get(name)
+
+    def names(self):
+        return list(self._adapters)
+
+    def enabled(self):
+        return [a for a in self._adapters.values() if a.enabled()]
+
+    def describe(self):
+        return [a.describe() for a in self._adapters.values()]
@@ -0,0 +1,131 @@
+"""
+In-memory prefix index for search-as-you-type suggestions.
+
+Entries come from two places, both already local:
+
+- past searches (matched on their canonical query, shown as last typed,
+  weighted by how often they ran);
+- product names from cached upstream results, indexed at every word start
+  so "milk" completes to "Horizon Organic Whole Milk".
+
+The index is a sorted list of (key, kind, text) tuples; a lookup is one
+bisect to the first key >= the typed prefix plus a bounded forward scan, so it
+stays well under a millisecond no matter how many entries there are. New
+searches and results are inserted as they happen (bisect.insort, or one
+sorted merge for a whole result page). Past `max_entries`, the queries and
+names not seen for longest are dropped (down to 90%, so the list is rebuilt
+once per many inserts, not on every one), with their weights.
+"""
+import bisect
+import threading
+from collections import OrderedDict
+
+from queries import query_tokens
+
+QUERY = "query"
+PRODUCT = "product"
+
+
+class SuggestIndex:
+    def __init__(self, max_entries=200_000, max_name_suffixes=6):
+        self.max_entries = max_entries
+        self.max_name_suffixes = max_name_suffixes
+        self._entries = []
+        self._present = set()
+        # (kind, text) -> [weight, display text, its entries], least recently seen first
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _seen(self, kind, text, display, entries):
+        item = self._items.get((kind, text))
+        if item is None:
+            item = self._items[(kind, text)] = [0, display, entries]
+        else:
+            self._items.move_to_end((kind, text))
+            item[1] = display
+        item[0] += 1
+
+    def _insert(self, entries):
+        new = [e for e in dict.fromkeys(entries) if e not in self._present]
+        self._present.update(new)
+        if len(new) > 16:
+            # One merge (timsort on two sorted runs) instead of a memmove per entry.
+            self._entries.extend(sorted(new))
+            self._entries.sort()
+        else:
+            for entry in new:
+                bisect.insort(self._entries, entry)
+        if len(self._entries) > self.max_entries:
+            self._evict(int(self.max_entries * 0.9))
+
+    def _evict(self, target):
+        dropped = set()
+        remaining = len(self._entries)
+        while remaining > target and len(self._items) > 1:
+            _, (_, _, entries) = self._items.popitem(last=False)
+            dropped.update(entries)
+            remaining -= len(entries)
+        self._present -= dropped
+        self._entries = [e for e in self._entries if e not in dropped]
+
+    def add_query(self, query, display=None):
+        """Record a search: its canonical query (what prefixes match) and how it was typed (what is shown)."""
+        if not query:
+            return
+        entry = (query, QUERY, query)
+        with self._lock:
+            self._seen(QUERY, query, display or query, [entry])
+            self._insert([entry])
+
+    def add_products(self, names):
+        """Index product names at each word start (up to max_name_suffixes words in)."""
+        entries = []
+        seen = {}
+        for name in names:
+            tokens = query_tokens(name)
+            if not tokens:
+                continue
+            name = " ".join(name.split())
+            seen[name] = [(" ".join(tokens[start:]), PRODUCT, name)
+                          for start in range(min(len(tokens), self.max_name_suffixes))]
+            entries.extend(seen[name])
+        with self._lock:
+            for name, name_entries in seen.items():
+                self._seen(PRODUCT, name, name, name_entries)
+            self._insert(entries)
+
+    def suggest(self, prefix, limit=8, is_cached=None, scan_limit=500):
+        """
+        Completions for a typed prefix, best first.
+
+        Queries whose results are still cached (per `is_cached(canonical query)`) rank
+        first, so picking a suggestion usually lands on a cache hit; then
+        queries before product names, then by popularity.
+        """
+        key = " ".join(query_tokens(prefix))
+        if not key:
+            return []
+        if prefix[-1:].isspace():
+            # "milk " should complete to "milk chocolate", not "milkshake".
+            key += " "
+        with self._lock:
+            start = bisect.bisect_left(self._entries, (key,))
+            matches = []
+            for entry in self._entries[start:start + scan_limit]:
+                if not entry[0].startswith(key):
+                    break
+                matches.append(entry)
+            items = {(kind, text): tuple(self._items.get((kind, text), (0, text))[:2]) for _, kind, text in matches}
+
+        candidates = []
+        for (kind, text), (weight, display) in items.items():
+            cached = kind == QUERY and bool(is_cached and is_cached(text))
+            candidates.append((not cached, kind != QUERY, -weight, len(display), display, kind, cached))
+        candidates.sort()
+        return [
+            {"text": display, "type": kind, "cached": cached}
+            for *_, display, kind, cached in candidates[:limit]
+        ]
@@ -0,0 +1,41 @@
+"""
+Shared fixtures. The backend modules are imported by plain name (as app.py does),
+and the app runs against throwaway SQLite files with no Kroger credentials.
+"""
+import os
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_DATA_DIR = tempfile.mkdtemp(prefix="hff-tests-")
+os.environ.update({
+    "FILTER_DB_PATH": os.path.join(_DATA_DIR, "filters.db"),
+    "LOCAL_INDEX_PATH": os.path.join(_DATA_DIR, "products.db"),
+    "PRICE_HISTORY_PATH": os.path.join(_DATA_DIR, "prices.db"),
+    "ENRICH_INGREDIENTS": "false",
+    "LOCAL_SEARCH_MIN_RESULTS": "0",
+    "LOG_LEVEL": "WARNING",
+})
+
+
+@pytest.fixture
+def app_module(monkeypatch):
+    """app.py with empty search caches, mock data off and no Kroger credentials (.env/demo_secrets ignored)."""
+    import app
+    monkeypatch.delenv("KROGER_CLIENT_ID", raising=False)
+    monkeypatch.delenv("KROGER_CLIENT_SECRET", raising=False)
+    monkeypatch.delenv("KROGER_LOCATION_ID", raising=False)
+    monkeypatch.setattr(app, "USE_MOCK_DATA", False)
+    for cache in (app.product_cache, app.results_cache, app.upstream_next, app.location_cache,
+                  app.product_details_cache):
+        cache.clear()
+    app._location_areas_fetched.clear()
+    return app
+
+
+@pytest.fixture
+def client(app_module):
+    return app_module.app.test_client()
@@ -0,0 +1,66 @@
+"""Bounded expiring caches (the search caches in app.py)."""
+from datetime import datetime, timedelta
+
+from caches import TTLCache
+
+
+def _later(minutes=5):
+    return datetime.now() + timedelta(minutes=minutes)
+
+
+def test_get_returns_fresh_entries_only():
+    cache = TTLCache(10)
+    cache.set("fresh", 1, _later())
+    cache.set("stale", 2, datetime.now() - timedelta(seconds=1))
+
+    assert cache.get("fresh") == 1
+    assert cache.get("stale") is None
+    assert "fresh" in cache and "stale" not in cache
+    assert len(cache) == 1  # the stale entry was dropped when read
+
+
+def test_size_is_bounded_by_evicting_least_recently_used():
+    cache = TTLCache(maxsize=100)
+    for i in range(1000):
+        cache.set(f"query {i}", i, _later())
+        if i % 10 == 0:
+            cache.get("query 0")  # keeps being used
+
+    assert len(cache) == 100
+    assert cache.get("query 0") == 0
+    assert cache.get("query 1") is None
+    assert cache.get("query 999") == 999
+
+
+def test_expired_entries_are_swept_on_insert():
+    cache = TTLCache(maxsize=1000, sweep_every_s=0)
+    for i in range(500):
+        cache.set(f"old {i}", i, datetime.now() - timedelta(seconds=1))
+    cache.set("new", "x", _later())
+
+    assert len(cache) == 1
+    assert cache.get("new") == "x"
+
+
+def test_replace_keeps_the_expiry():
+    cache = TTLCache(10)
+    expires = _later()
+    cache.set("k", "first", expires)
+
+    assert cache.replace("k", "second")
+    assert cache.get("k") == "second"
+    assert cache.expiry("k") == expires
+    assert not cache.replace("missing", "x")
+
+
+def test_search_cache_stays_bounded_across_distinct_queries(client, app_module, monkeypatch):
+    monkeypatch.setattr(app_module, "USE_MOCK_DATA", True)
+    monkeypatch.setattr(app_module.product_cache, "maxsize", 20)
+    monkeypatch.setattr(app_module.results_cache, "maxsize", 20)
+
+    for i in range(60):
+        assert client.post("/api/search", json={"query": f"milk {i}", "user_id": "bounded"}).status_code == 200
+
+    assert len(app_module.product_cache) == 20
+    assert len(app_module.results_cache) == 20
+    assert client.post("/api/search", json={"query": "milk 59", "user_id": "bounded"}).get_json()["total_found"] > 0
@@ -0,0 +1,73 @@
+"""/api/products/details: where each product comes from, and how much one request may scrape."""
+import threading
+
+
+def _details(client, ids):
+    return client.post("/api/products/details", json={"product_ids": ids})
+
+
+def test_scrapes_per_request_are_capped(client, app_module, monkeypatch):
+    scraped = []
+
+    def scrape(store, pid, product=None):
+        scraped.append(pid)
+        return {"productId": pid, "name": "Milk", "ingredients": "milk"}
+
+    monkeypatch.setattr(app_module, "SELENIUM_AVAILABLE", True)
+    monkeypatch.setattr(app_module, "DETAILS_MAX_SCRAPES_PER_REQUEST", 3)
+    monkeypatch.setattr(app_module, "_scrape_product_details", scrape)
+    ids = [f"unknown-{i}" for i in range(10)]
+
+    data = _details(client, ids).get_json()
+
+    assert scraped == ids[:3]
+    assert [p["productId"] for p in data["products"]] == ids[:3]
+    assert data["missing"] == ids[3:]
+
+
+def test_scrapes_wait_for_room_in_the_queue(client, app_module, monkeypatch):
+    release = threading.Event()
+    started = []
+
+    def scrape(store, pid, product=None):
+        started.append(pid)
+        release.wait(5)
+        return None
+
+    monkeypatch.setattr(app_module, "SELENIUM_AVAILABLE", True)
+    monkeypatch.setattr(app_module, "_scrape_product_details", scrape)
+    monkeypatch.setattr(app_module, "_details_scrape_slots", threading.BoundedSemaphore(2))
+    try:
+        first = app_module._product_details("kroger", ["a", "b", "c"], timeout=0.05)
+        second = app_module._product_details("kroger", ["d"], timeout=0.05)
+    finally:
+        release.set()
+
+    assert first == ({}, {}) and second == ({}, {})
+    assert sorted(started) == ["a", "b"]
+
+
+def test_catalog_hits_are_reported_as_catalog(client, app_module, monkeypatch):
+    monkeypatch.setattr(app_module, "SELENIUM_AVAILABLE", False)
+    monkeypatch.setitem(app_module._product_catalog, "0001111041700",
+                        {"productId": "0001111041700", "name": "Milk", "ingredients": "milk"})
+
+    data = _details(client, ["0001111041700"]).get_json()
+
+    assert data["products"][0]["source"] == "catalog"
+    assert data["sources"] == {"catalog": 1}
+    assert app_module.product_details_cache.get("0001111041700") is None
+
+
+def test_scraped_product_url_quotes_the_id(app_module, monkeypatch):
+    urls = []
+
+    class Scraper:
+        def get_product_details(self, url):
+            urls.append(url)
+            return None
+
+    monkeypatch.setattr(app_module, "scraper", lambda: Scraper())
+
+    assert app_module._scrape_product_details("kroger", "../search?q=x y") is None
+    assert urls == ["https://www.kroger.com/p/..%2Fsearch%3Fq%3Dx%20y"]
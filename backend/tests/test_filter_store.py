@@ -0,0 +1,88 @@
+"""Filter profiles + per-user deltas, shared filter sets, and sync between workers (connections)."""
+import pytest
+
+from filter_store import FilterStore, UnknownProfile
+
+PROFILES = {
+    "default": ["canola oil", "aspartame", "sodium benzoate"],
+    "keto": ["sugar", "wheat flour"],
+}
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "filters.db")
+
+
+@pytest.fixture
+def store(db_path):
+    return FilterStore(db_path, PROFILES)
+
+
+def test_untouched_users_get_the_default_profile(store):
+    assert store.describe("new") == {
+        "filters": ["canola oil", "aspartame", "sodium benzoate"], "profile": "default", "added": [], "removed": [],
+    }
+
+
+def test_added_and_removed_terms_are_deltas_on_the_profile(store):
+    store.add("u", "Palm Oil")
+    store.remove("u", "aspartame")
+
+    assert store.describe("u") == {
+        "filters": ["canola oil", "sodium benzoate", "Palm Oil"], "profile": "default",
+        "added": ["Palm Oil"], "removed": ["aspartame"],
+    }
+
+
+def test_adding_back_a_removed_profile_term_drops_the_removal(store):
+    store.remove("u", "aspartame")
+    store.add("u", "ASPARTAME")
+
+    assert store.describe("u")["removed"] == []
+    assert store.describe("u")["added"] == []
+
+
+def test_writes_that_change_nothing(store):
+    assert store.add("u", "Canola Oil")[1] is False
+    assert store.remove("u", "not a filter")[1] is False
+
+
+def test_switching_profile_keeps_additions_not_removals(store):
+    store.add("u", "palm oil")
+    store.remove("u", "aspartame")
+    store.set_profile("u", "keto")
+
+    assert store.describe("u") == {
+        "filters": ["sugar", "wheat flour", "palm oil"], "profile": "keto", "added": ["palm oil"], "removed": [],
+    }
+    with pytest.raises(UnknownProfile):
+        store.set_profile("u", "paleo")
+
+
+def test_users_with_the_same_terms_share_one_filter_set(store):
+    store.add("a", "palm oil")
+    store.add("b", "Palm Oil")
+
+    assert store.filter_set("a") is store.filter_set("b")
+    assert store.filter_set("a") is not store.filter_set("untouched")
+    assert store.filter_set("untouched") is store.filter_set("also untouched")
+
+
+def test_changes_survive_a_restart(db_path, store):
+    store.add("u", "palm oil")
+
+    assert "palm oil" in FilterStore(db_path, PROFILES).describe("u")["filters"]
+
+
+def test_another_workers_change_is_picked_up(db_path, store):
+    other = FilterStore(db_path, PROFILES)
+    assert "palm oil" not in other.describe("u")["filters"]  # (now cached in `other`)
+    before = other.filter_set("u")
+
+    store.add("u", "palm oil")
+
+    assert "palm oil" in other.describe("u")["filters"]
+    assert other.filter_set("u") is not before
+    other.remove("u", "palm oil")
+    assert "palm oil" not in store.describe("u")["filters"]
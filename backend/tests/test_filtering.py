@@ -0,0 +1,67 @@
+"""Filter edits applied as deltas to cached result views match evaluating the filters from scratch."""
+import pytest
+
+from filtering import IndexedResults, batch_filter, compile_filters
+
+PRODUCTS = [
+    {"name": "Crackers", "ingredients": "wheat flour, canola oil, salt", "nutrition": {"sodium_mg": 300}},
+    {"name": "Diet Soda", "ingredients": "carbonated water, aspartame", "nutrition": {"sodium_mg": 40}},
+    {"name": "Oats", "ingredients": "whole grain oats", "nutrition": {"sodium_mg": 0}},
+    {"name": "Chips", "ingredients": "potatoes, canola oil, sea salt", "nutrition": {"sodium_mg": 170}},
+    {"name": "Pickles", "ingredients": "cucumbers, vinegar, sodium benzoate", "nutrition": {"sodium_mg": 600}},
+    {"name": "Apples", "ingredients": ""},
+]
+
+EDITS = [
+    ["canola oil"],
+    ["canola oil", "aspartame"],
+    ["canola oil", "aspartame", "sodium < 200 mg"],
+    ["aspartame", "sodium < 200 mg"],
+    ["Sodium Benzoate", "sodium < 200 mg"],
+    [],
+    ["canola oil"],
+]
+
+
+def _fresh(filters):
+    mask, matched = batch_filter([dict(p) for p in PRODUCTS], compile_filters(filters))
+    kept = [p["name"] for p, ok in zip(PRODUCTS, mask) if ok]
+    hidden = [(p["name"], terms) for p, ok, terms in zip(PRODUCTS, mask, matched) if not ok]
+    return kept, hidden
+
+
+def _summary(kept, hidden):
+    return [p["name"] for p in kept], [(p["name"], terms) for p, terms in hidden]
+
+
+def test_filter_edits_match_a_fresh_evaluation():
+    results = IndexedResults([dict(p) for p in PRODUCTS])
+    for filters in EDITS:
+        assert _summary(*results.evaluate(compile_filters(filters))) == _fresh(filters), filters
+
+
+@pytest.mark.parametrize("filters", EDITS[1:5])
+def test_each_filter_set_matches_when_evaluated_first(filters):
+    results = IndexedResults([dict(p) for p in PRODUCTS])
+    assert _summary(*results.evaluate(compile_filters(filters))) == _fresh(filters)
+
+
+def test_nutrient_rule_edits_hide_and_bring_back_products():
+    results = IndexedResults([dict(p) for p in PRODUCTS])
+    kept, hidden = _summary(*results.evaluate(compile_filters(["sodium < 200 mg"])))
+    assert hidden == [("Crackers", ["sodium < 200 mg"]), ("Pickles", ["sodium < 200 mg"])]
+    assert _fresh(["sodium < 200 mg"])[1] == hidden
+    kept, hidden = _summary(*results.evaluate(compile_filters(["canola oil", "sodium < 200 mg"])))
+    assert hidden == [
+        ("Crackers", ["canola oil", "sodium < 200 mg"]),
+        ("Chips", ["canola oil"]),
+        ("Pickles", ["sodium < 200 mg"]),
+    ]
+    kept, hidden = _summary(*results.evaluate(compile_filters(["canola oil"])))
+    assert "Pickles" in kept
+
+
+def test_hidden_terms_keep_the_filter_spelling_and_order():
+    results = IndexedResults([dict(p) for p in PRODUCTS])
+    hidden = results.hidden_by(compile_filters(["Sodium Benzoate", "CANOLA OIL"]))
+    assert hidden == {0: ["CANOLA OIL"], 3: ["CANOLA OIL"], 4: ["Sodium Benzoate"]}
@@ -0,0 +1,48 @@
+"""Cross-store identity: listings are linked by UPC, or by name only with a confirmed pack size."""
+from identity import ProductIdentityIndex, name_signature
+
+
+def test_signature_keeps_numbers_percentages_and_variants():
+    tokens, sizes = name_signature("Horizon Organic 2% Milk 1/2 Gallon", size="1/2 gal")
+    assert "2%" in tokens
+    assert sizes == ("0.5gal",)
+    assert "c" in name_signature("Vitamin C Gummies")[0]
+
+
+def test_whole_and_2_percent_milk_stay_apart():
+    index = ProductIdentityIndex()
+    whole = index.identify("kroger", "1", {"name": "Horizon Organic Whole Milk", "size": "1/2 gal"})
+    reduced = index.identify("heb", "a", {"name": "Horizon Organic 2% Milk", "size": "1/2 gal"})
+    assert whole != reduced
+
+
+def test_alike_names_with_the_same_size_are_linked():
+    index = ProductIdentityIndex()
+    kroger = index.identify("kroger", "1", {"name": "Horizon Organic Whole Milk", "size": "1/2 gal"})
+    heb = index.identify("heb", "a", {"name": "Horizon Organic Whole Milk, 1/2 gal"})
+    assert kroger == heb
+    assert index.listings(kroger) == [("heb", "a"), ("kroger", "1")]
+
+
+def test_alike_names_need_a_size_on_both_sides():
+    index = ProductIdentityIndex()
+    kroger = index.identify("kroger", "1", {"name": "Horizon Organic Whole Milk"})
+    heb = index.identify("heb", "a", {"name": "Horizon Organic Whole Milk"})
+    assert kroger != heb
+
+
+def test_alike_names_with_different_sizes_or_upcs_are_not_linked():
+    index = ProductIdentityIndex()
+    half = index.identify("kroger", "1", {"name": "Horizon Organic Whole Milk", "size": "1/2 gal"})
+    gallon = index.identify("heb", "a", {"name": "Horizon Organic Whole Milk", "size": "1 gal"})
+    assert half != gallon
+    first = index.identify("kroger", "0074236500011", {"productId": "0074236500011", "name": "Greek Yogurt", "size": "32 oz"})
+    other = index.identify("heb", "b", {"name": "Greek Yogurt", "size": "32 oz", "upc": "0074236599999"})
+    assert first != other
+
+
+def test_same_upc_is_linked_whatever_the_name():
+    index = ProductIdentityIndex()
+    kroger = index.identify("kroger", "0001111041700", {"productId": "0001111041700", "name": "Kroger 2% Milk"})
+    heb = index.identify("heb", "c", {"name": "Reduced Fat Milk", "upc": "1111041700"})
+    assert kroger == heb
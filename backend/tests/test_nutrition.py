@@ -0,0 +1,68 @@
+"""Nutrition facts parsing and nutrient threshold rules ("sodium < 300 mg")."""
+import pytest
+
+from nutrition import NutrientIndex, compile_rules, nutrition_from_api, parse_rule
+
+RECORDS = [
+    {"sodium_mg": 100.0},
+    {"sodium_mg": 300.0},
+    {"sodium_mg": 300.0, "protein_g": 10.0},
+    {"sodium_mg": 500.0, "protein_g": 2.0},
+    {},  # no panel: breaks no rule
+    None,
+]
+
+
+def test_nutrition_from_api():
+    info = {"nutrients": [
+        {"displayName": "Sodium", "quantity": 0.31, "unitOfMeasure": {"code": "GRM"}},
+        {"description": "Total Sugars", "quantity": 4, "unitOfMeasure": {"abbreviation": "g"}},
+        {"displayName": "Calories", "quantity": 586, "unitOfMeasure": {"code": "KJO"}},
+        {"displayName": "Vitamin D", "quantity": 2, "unitOfMeasure": "mcg"},
+        {"displayName": "Protein", "quantity": -1},
+    ]}
+
+    assert nutrition_from_api(info) == {"sodium_mg": 310.0, "sugar_g": 4.0, "calories": pytest.approx(140.057)}
+    assert nutrition_from_api({}) == {}
+    assert nutrition_from_api(None) == {}
+
+
+@pytest.mark.parametrize("text, nutrient, op, threshold", [
+    ("sodium < 300 mg", "sodium_mg", "<", 300.0),
+    ("Sodium<300mg", "sodium_mg", "<", 300.0),
+    ("sodium < 0.3 g", "sodium_mg", "<", 300.0),
+    ("added sugar <= 5g", "added_sugar_g", "<=", 5.0),
+    ("protein >= 10", "protein_g", ">=", 10.0),
+    ("calories ≤ 200 kcal", "calories", "<=", 200.0),
+    ("fiber => 3 g", "fiber_g", ">=", 3.0),
+])
+def test_parse_rule(text, nutrient, op, threshold):
+    rule = parse_rule(text)
+
+    assert (rule.nutrient, rule.op) == (nutrient, op)
+    assert rule.threshold == pytest.approx(threshold)
+
+
+@pytest.mark.parametrize("text", ["canola oil", "sugar", "2% milk", "red 40"])
+def test_plain_terms_are_not_rules(text):
+    assert parse_rule(text) is None
+
+
+@pytest.mark.parametrize("text", ["vitamin q < 5 mg", "sodium < 300 kcal", "protein > 5 furlongs"])
+def test_invalid_rules_raise(text):
+    with pytest.raises(ValueError):
+        parse_rule(text)
+
+
+@pytest.mark.parametrize("text, failing", [
+    ("sodium < 300 mg", [1, 2, 3]),   # 300 itself breaks "< 300"
+    ("sodium <= 300 mg", [3]),        # ... but not "<= 300"
+    ("sodium > 300 mg", [0, 1, 2]),
+    ("sodium >= 300 mg", [0]),
+    ("protein >= 10 g", [3]),         # products without protein on their panel pass
+])
+def test_failing_boundaries(text, failing):
+    rule = parse_rule(text)
+
+    assert sorted(NutrientIndex(RECORDS).failing(rule)) == failing
+    assert compile_rules([rule])(RECORDS) == {rule.term: failing}
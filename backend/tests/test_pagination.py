@@ -0,0 +1,86 @@
+"""Cursor pagination over cached search results, growing one upstream page at a time."""
+import pytest
+
+
+def _catalog(n):
+    return [{"productId": f"{i:013d}", "name": f"Milk {i}", "price": "$1.00", "ingredients": "milk",
+             "store": "Kroger"} for i in range(n)]
+
+
+@pytest.fixture
+def upstream(app_module, monkeypatch):
+    """The Kroger adapter's search over a 60-product catalog; records the `start` of each call."""
+    starts = []
+
+    def search(term, limit=20, location_id=None, start=0):
+        starts.append(start)
+        return _catalog(60)[start:start + limit]
+
+    monkeypatch.setattr(app_module.store_registry.get("kroger"), "search", search)
+    return starts
+
+
+def test_cursor_round_trip(app_module):
+    state = {"k": "kroger_milk_fsabc", "g": 3, "o": 20, "h": 4, "n": 10, "s": "price", "m": 500, "c": 42}
+
+    cursor = app_module._encode_cursor(state)
+
+    assert app_module._decode_cursor(cursor) == state
+
+
+@pytest.mark.parametrize("cursor", ["not a cursor", "", "e30", "eyJrIjoxfQ"])
+def test_invalid_cursor(app_module, cursor):
+    with pytest.raises(ValueError):
+        app_module._decode_cursor(cursor)
+
+
+def test_pages_cover_every_product_once(client, upstream):
+    first = client.post("/api/search", json={"query": "milk", "user_id": "pages", "page_size": 15}).get_json()
+    seen = [p["productId"] for p in first["products"]]
+    cursor = first["next_cursor"]
+    while cursor:
+        page = client.post("/api/search", json={"cursor": cursor}).get_json()
+        assert len(page["products"]) <= 15
+        seen += [p["productId"] for p in page["products"]]
+        cursor = page["next_cursor"]
+
+    assert seen == [p["productId"] for p in _catalog(60)]
+    assert sorted(set(upstream)) == [0, 20, 40, 60]  # (the last, empty page ends the walk)
+
+
+def test_get_page_by_cursor_is_304_when_unchanged(client, upstream):
+    first = client.post("/api/search", json={"query": "milk", "user_id": "pages", "page_size": 5}).get_json()
+    url = f"/api/search?cursor={first['next_cursor']}&compact=true"
+
+    page = client.get(url)
+    again = client.get(url, headers={"If-None-Match": page.headers["ETag"]})
+
+    assert page.status_code == 200
+    assert page.get_json() == client.post("/api/search", json={"cursor": first["next_cursor"], "compact": True}).get_json()
+    assert (again.status_code, again.get_data()) == (304, b"")
+    assert again.headers["ETag"] == page.headers["ETag"]
+
+
+def test_get_search_needs_a_cursor(client):
+    assert client.get("/api/search?query=milk").status_code == 400
+
+
+def test_expired_cursor_is_410(client, app_module, upstream):
+    first = client.post("/api/search", json={"query": "milk", "user_id": "pages", "page_size": 5}).get_json()
+    app_module.product_cache.clear()
+
+    resp = client.post("/api/search", json={"cursor": first["next_cursor"]})
+
+    assert resp.status_code == 410
+
+
+def test_pending_upstream_page_goes_with_its_results(client, app_module, upstream, monkeypatch):
+    monkeypatch.setattr(app_module.results_cache, "maxsize", 1)
+
+    client.post("/api/search", json={"query": "milk", "user_id": "pages", "page_size": 5})
+    assert app_module.upstream_next.get("kroger_milk") == ("kroger", "milk", 20, 20)
+    client.post("/api/search", json={"query": "bread", "user_id": "pages", "page_size": 5})
+
+    assert "kroger_milk" not in app_module.results_cache
+    assert app_module.upstream_next.get("kroger_milk") is None
+    assert len(app_module.upstream_next) == 1
@@ -0,0 +1,59 @@
+"""Price history: queued observations, batched writes, and reads that don't wait on the writer."""
+import threading
+
+import pytest
+
+from price_history import PriceHistory, today
+
+
+@pytest.fixture
+def history(tmp_path):
+    h = PriceHistory(str(tmp_path / "prices.db"), flush_every_s=3600)
+    yield h
+    h.close()
+
+
+def _yesterday(h, store, key, price):
+    # Observations are made "now": move a written row back a day for lowest() (which skips today).
+    h.record(store, "loc", [(key, price, None)])
+    h.flush()
+    with h._db_lock:
+        h._connection().execute("UPDATE price_observations SET day = day - 1 WHERE product_key = ?", (key,))
+
+
+def test_lowest_reads_do_not_wait_on_a_write(history):
+    _yesterday(history, "kroger", "p1", 399)
+    assert history.lowest("kroger", ["p1"]) == {"p1": 399}
+
+    result = []
+    with history._db_lock:  # (held by flush() for a whole batch)
+        reader = threading.Thread(target=lambda: result.append(history.lowest("kroger", ["p1", "p2"])))
+        reader.start()
+        reader.join(timeout=2)
+
+    assert result == [{"p1": 399}]
+
+
+def test_history_includes_queued_observations(history):
+    history.record("kroger", "loc", [("p1", 399, 299)])
+    history.record("kroger", "loc", [("p1", 349, None)])
+
+    assert history.pending() == 1
+    assert history.history("kroger", "p1") == [(today(), "loc", 349, 299)]
+    history.flush()
+    history.record("kroger", "loc", [("p1", 329, None)])
+    assert history.history("kroger", "p1") == [(today(), "loc", 329, 299)]
+    assert history.history("kroger", "p1", location_id="other") == []
+
+
+def test_price_endpoint_does_not_flush(client, app_module, monkeypatch):
+    def flush():
+        raise AssertionError("flushed on the request thread")
+
+    monkeypatch.setattr(app_module.price_history, "flush", flush)
+    app_module.price_history.record("kroger", "", [("0001111041700", 259, None)])
+
+    resp = client.get("/api/products/0001111041700/prices")
+
+    assert resp.status_code == 200
+    assert [p["price_cents"] for p in resp.get_json()["prices"]] == [259]
@@ -0,0 +1,102 @@
+"""Price parsing: integer cents and unit prices from package sizes."""
+import pytest
+
+from prices import set_price_fields, to_cents, unit_quantity
+
+
+@pytest.mark.parametrize("value, cents", [
+    (3.49, 349), ("3.49", 349), ("$3.49", 349), ("$3.49/lb", 349), ("$1,299.00", 129900),
+    (0, None), ("N/A", None), (None, None), (True, None),
+])
+def test_to_cents(value, cents):
+    assert to_cents(value) == cents
+
+
+@pytest.mark.parametrize("value, cents", [
+    ("2 for $5", 250), ("2 for $5.00", 250), ("3/$10", 333), ("10 FOR $10", 100),
+    ("-5", None), ("-$5.00", None), (-5, None), (float("inf"), None), (float("nan"), None),
+])
+def test_to_cents_multi_buy_and_negative(value, cents):
+    assert to_cents(value) == cents
+
+
+@pytest.mark.parametrize("value, cents", [
+    ("5", 500), ("$5.00", 500), (" 4.5 ", 450), (".99", 99), (5, 500),
+    ("-5", None), ("5 dollars", None), ("abc", None), ("2 for $5", None), ("0", None),
+])
+def test_strict_to_cents(value, cents):
+    assert to_cents(value, strict=True) == cents
+
+
+@pytest.mark.parametrize("size, basis, quantity", [
+    ("12 oz", "lb", 0.75),
+    ("2 lb", "lb", 2.0),
+    ("2 lbs", "lb", 2.0),
+    ("2 pounds", "lb", 2.0),
+    ("1 pound", "lb", 1.0),
+    ("16 ounce", "lb", 1.0),
+    ("8 ounces", "lb", 0.5),
+    ("1 gallon", "gal", 1.0),
+    ("2 gallons", "gal", 2.0),
+    ("64 fl oz", "gal", 0.5),
+    ("64 fluid ounces", "gal", 0.5),
+    ("2 quarts", "gal", 0.5),
+    ("6 ct", "each", 6.0),
+    ("12 pack", "each", 12.0),
+    ("1.5 lb", "lb", 1.5),
+    (".5 gal", "gal", 0.5),
+])
+def test_unit_quantity_units_and_spellings(size, basis, quantity):
+    assert unit_quantity(size) == (basis, pytest.approx(quantity))
+
+
+@pytest.mark.parametrize("size, basis, quantity", [
+    ("1/2 gal", "gal", 0.5),
+    ("Horizon Organic Whole Milk 1/2 Gallon", "gal", 0.5),
+    ("3/4 lb", "lb", 0.75),
+    ("1 1/2 lb", "lb", 1.5),
+    ("1-1/2 lb", "lb", 1.5),
+    ("2 1/4 pounds", "lb", 2.25),
+])
+def test_unit_quantity_fractions_and_mixed_numbers(size, basis, quantity):
+    assert unit_quantity(size) == (basis, pytest.approx(quantity))
+
+
+@pytest.mark.parametrize("size", ["", None, "Bananas", "3/0 lb", "0 oz"])
+def test_unit_quantity_unreadable(size):
+    assert unit_quantity(size) is None
+
+
+def test_unit_price_of_a_half_gallon():
+    product = set_price_fields({"name": "Whole Milk"}, regular=3.0, size="1/2 gal")
+
+    assert product["unit_price_cents"] == 600
+    assert product["unit_price"] == "$6.00/gal"
+
+
+def test_unit_price_uses_the_promo_price():
+    product = set_price_fields({"name": "Ground Beef"}, regular=10.0, promo=8.0, size="2 pounds")
+
+    assert product["promo_cents"] == 800
+    assert product["unit_price"] == "$4.00/lb"
+
+
+def test_sold_by_weight_price_is_the_unit_price():
+    product = set_price_fields({"name": "Bananas", "price": "$0.59/lb"})
+
+    assert product["price_cents"] == 59
+    assert (product["unit"], product["unit_price_cents"]) == ("lb", 59)
+
+
+def test_unit_price_needs_a_size_field():
+    product = set_price_fields({"name": "Protein Bar 5 g protein"}, regular=2.0)
+
+    assert product["price_cents"] == 200
+    assert "unit_price" not in product
+
+
+@pytest.mark.parametrize("max_price", ["-5", "abc", "5 dollars", 0])
+def test_bad_max_price_is_400(client, max_price):
+    resp = client.post("/api/search", json={"query": "milk", "max_price": max_price})
+
+    assert resp.status_code == 400
@@ -0,0 +1,40 @@
+"""Query canonicalization: cache keys vs. what is sent upstream."""
+import pytest
+
+from queries import canonicalize_query, query_text
+
+
+@pytest.mark.parametrize("typed, key", [
+    ("Milk", "milk"),
+    ("  MILK!  ", "milk"),
+    ("Annie’s  mac & cheese!", "annies mac cheese"),
+    ("Crème Fraîche", "creme fraiche"),
+    ("2% milk", "2% milk"),
+    ("2.5 lb ground beef", "2.5 lb ground beef"),
+    ("the", "the"),
+])
+def test_equivalent_spellings_share_a_key(typed, key):
+    assert canonicalize_query(typed, fold_plurals=False) == key
+
+
+@pytest.mark.parametrize("typed, key", [
+    ("A1 Sauce", "a1 sauce"),
+    ("C4 energy", "c4 energy"),
+    ("M&Ms", "m&ms"),
+    ("M&M's", "m&ms"),
+    ("vitamin a", "vitamin a"),
+])
+def test_letter_digit_words_and_single_letters_are_kept(typed, key):
+    assert canonicalize_query(typed, fold_plurals=False) == key
+
+
+def test_plural_folding():
+    assert canonicalize_query("Eggs", fold_plurals=True) == "egg"
+    assert canonicalize_query("berries", fold_plurals=True) == "berry"
+    assert canonicalize_query("oats", fold_plurals=True) == "oats"
+
+
+def test_query_text_only_collapses_whitespace():
+    assert query_text("  A1   Sauce ") == "A1 Sauce"
+    assert query_text("M&M's") == "M&M's"
+
@@ -0,0 +1,52 @@
+"""Pre-encoded responses: compression, conditional GETs, and views kept on the search cache entry."""
+import gzip
+
+from flask import Flask
+
+import responses
+
+
+def _body():
+    return responses.EncodedBody({"products": [{"name": f"Milk {i}"} for i in range(100)]})
+
+
+def test_gzip_variant_when_accepted():
+    body = _body()
+    with Flask(__name__).test_request_context("/", headers={"Accept-Encoding": "gzip"}):
+        resp, encoding = responses.send(body)
+
+    assert encoding == "gzip"
+    assert gzip.decompress(resp.get_data()) == body.identity
+
+
+def test_matching_etag_on_get_is_304():
+    body = _body()
+    with Flask(__name__).test_request_context("/", method="GET", headers={"If-None-Match": body.etag}):
+        resp, encoding = responses.send(body)
+
+    assert (resp.status_code, encoding) == (304, "not_modified")
+
+
+def test_post_is_never_304():
+    body = _body()
+    with Flask(__name__).test_request_context("/", method="POST", headers={"If-None-Match": body.etag}):
+        resp, encoding = responses.send(body)
+
+    assert resp.status_code == 200
+    assert resp.get_data() == body.identity
+
+
+def test_search_views_are_evicted_with_their_entry(client, app_module, monkeypatch):
+    monkeypatch.setattr(app_module, "USE_MOCK_DATA", True)
+    monkeypatch.setattr(app_module.product_cache, "maxsize", 1)
+    cache_key = f"kroger_milk_fs{app_module.filter_store.filter_set('views').fingerprint}"
+
+    client.post("/api/search", json={"query": "milk", "user_id": "views"})
+    client.post("/api/search", json={"query": "milk", "user_id": "views", "sort": "price", "compact": True})
+    entry = app_module.product_cache.get(cache_key)
+    assert len(entry["_views"]) == 2 and "price" in entry["_orders"]
+
+    client.post("/api/search", json={"query": "bread", "user_id": "views"})
+
+    assert cache_key not in app_module.product_cache
+    assert len(app_module.product_cache) == 1
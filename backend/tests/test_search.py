@@ -0,0 +1,132 @@
+"""/api/search without Kroger API credentials: mock data, and saved or requested store locations."""
+
+
+def _search(client, **body):
+    return client.post("/api/search", json={"query": "milk", "user_id": "search-test", **body})
+
+
+def test_mock_search_ignores_saved_location(client, app_module, monkeypatch):
+    monkeypatch.setattr(app_module, "USE_MOCK_DATA", True)
+    app_module.preferred_locations.set("search-test", "01400943")
+
+    resp = _search(client)
+
+    assert resp.status_code == 200
+    data = resp.get_json()
+    assert data["total_found"] > 0
+    assert "locations" not in data
+
+
+def test_mock_search_with_credentials_ignores_saved_location(client, app_module, monkeypatch):
+    monkeypatch.setattr(app_module, "USE_MOCK_DATA", True)
+    monkeypatch.setenv("KROGER_CLIENT_ID", "id")
+    monkeypatch.setenv("KROGER_CLIENT_SECRET", "secret")
+    monkeypatch.setattr(app_module, "kroger_api_product_search", lambda *a, **kw: app_module.get_mock_products("milk"))
+    app_module.preferred_locations.set("search-test", "01400943")
+
+    assert _search(client).status_code == 200
+
+
+def test_search_without_credentials_uses_default_location(client, app_module, monkeypatch):
+    app_module.preferred_locations.set("search-test", "01400943")
+    seen = []
+
+    def search(term, limit=20, location_id=None, start=0):
+        seen.append(location_id)
+        return app_module.get_mock_products(term, limit, start)
+
+    monkeypatch.setattr(app_module.store_registry.get("kroger"), "search", search)
+
+    resp = _search(client)
+
+    assert resp.status_code == 200
+    assert resp.get_json()["total_found"] > 0
+    assert seen == [None]
+
+
+def test_explicit_locations_without_credentials_is_400(client):
+    resp = _search(client, location_ids=["01400943"])
+
+    assert resp.status_code == 400
+
+
+def test_zip_on_search_does_not_save_location(client, app_module, monkeypatch):
+    monkeypatch.setenv("KROGER_CLIENT_ID", "id")
+    monkeypatch.setenv("KROGER_CLIENT_SECRET", "secret")
+    store = {"locationId": "01499999", "name": "Test", "zipCode": "45202", "lat": 39.1, "lon": -84.5}
+    monkeypatch.setattr(app_module, "kroger_api_locations_near", lambda *a, **kw: [store])
+    searched = []
+
+    def search(term, limit=20, location_id=None, start=0):
+        searched.append(location_id)
+        return [dict(p, productId=str(i)) for i, p in enumerate(app_module.get_mock_products(term, limit))]
+
+    monkeypatch.setattr(app_module, "kroger_api_product_search", search)
+
+    resp = _search(client, user_id="zip-user", zip="45202")
+
+    assert resp.status_code == 200
+    assert searched == ["01499999"]
+    assert app_module.preferred_locations.get("zip-user") is None
+
+
+def test_preferred_location_must_be_known(client, app_module, monkeypatch):
+    app_module.location_index.add([{"locationId": "01498888", "name": "Known", "zipCode": "45202",
+                                    "lat": 39.1, "lon": -84.5}])
+
+    unknown = client.post("/api/locations/preferred", json={"user_id": "pref", "location_id": "nope"})
+    known = client.post("/api/locations/preferred", json={"user_id": "pref", "location_id": "01498888"})
+
+    assert unknown.status_code == 400
+    assert known.status_code == 200
+    assert app_module.preferred_locations.get("pref") == "01498888"
+
+
+def test_preferred_location_checked_with_locations_api(client, app_module, monkeypatch):
+    monkeypatch.setenv("KROGER_CLIENT_ID", "id")
+    monkeypatch.setenv("KROGER_CLIENT_SECRET", "secret")
+    api = {"01497777": {"locationId": "01497777", "name": "Remote", "zipCode": "30301", "lat": 33.7, "lon": -84.4}}
+    monkeypatch.setattr(app_module, "kroger_api_location", api.get)
+
+    assert client.post("/api/locations/preferred", json={"user_id": "api", "location_id": "01497776"}).status_code == 400
+    assert client.post("/api/locations/preferred", json={"user_id": "api", "location_id": "01497777"}).status_code == 200
+    assert app_module.location_index.get("01497777")["name"] == "Remote"
+
+
+def test_upstream_gets_the_query_as_typed(client, app_module, monkeypatch):
+    sent = []
+
+    def search(term, limit=20, location_id=None, start=0):
+        sent.append(term)
+        return app_module.get_mock_products(term, limit, start)
+
+    monkeypatch.setattr(app_module.store_registry.get("kroger"), "search", search)
+
+    first = client.post("/api/search", json={"query": "  A1   Sauce ", "user_id": "typed"})
+    second = client.post("/api/search", json={"query": "a1 sauce!", "user_id": "typed"})
+
+    assert first.status_code == second.status_code == 200
+    assert sent == ["A1 Sauce"]
+
+
+def test_area_is_fetched_even_with_a_farther_store_indexed(app_module, monkeypatch):
+    monkeypatch.setenv("KROGER_CLIENT_ID", "id")
+    monkeypatch.setenv("KROGER_CLIENT_SECRET", "secret")
+    # Indexed by another area's fetch: same 3-digit ZIP prefix, about 45 miles away.
+    app_module.location_index.add([{"locationId": "01497777", "name": "Far", "zipCode": "45299",
+                                    "lat": 39.75, "lon": -84.5}])
+    near = {"locationId": "01496666", "name": "Near", "zipCode": "45298", "lat": 39.11, "lon": -84.51}
+    fetched = []
+
+    def locations_near(zip_code, lat, lon, radius_miles=None):
+        fetched.append(zip_code)
+        return [near]
+
+    monkeypatch.setattr(app_module, "kroger_api_locations_near", locations_near)
+
+    first = app_module._nearest_locations("45298", limit=1)
+    again = app_module._nearest_locations("45298", limit=1)
+
+    assert first[0][1]["locationId"] == "01496666"
+    assert again[0][1]["locationId"] == "01496666"
+    assert fetched == ["45298"]
@@ -0,0 +1,51 @@
+"""Search-as-you-type index: display forms, bounded size, and the cached flag for location searches."""
+from datetime import datetime, timedelta
+
+from suggest import SuggestIndex
+
+
+def test_query_suggestions_show_what_was_typed():
+    index = SuggestIndex()
+    index.add_query("annies mac cheese", "Annie's Mac & Cheese")
+
+    assert index.suggest("annie") == [{"text": "Annie's Mac & Cheese", "type": "query", "cached": False}]
+
+
+def test_full_index_keeps_taking_new_entries():
+    index = SuggestIndex(max_entries=10)
+    for i in range(30):
+        index.add_query(f"query {i:02d}")
+    index.add_query("query 00")  # (seen again: recent, so kept)
+    index.add_query("zucchini")
+
+    assert len(index) <= 10
+    assert [s["text"] for s in index.suggest("zucch")] == ["zucchini"]
+    assert [s["text"] for s in index.suggest("query 29")] == ["query 29"]
+    assert index.suggest("query 05") == []
+    assert len(index._items) == len(index)
+
+
+def test_product_names_are_evicted_with_all_their_word_starts():
+    index = SuggestIndex(max_entries=8, max_name_suffixes=3)
+    index.add_products(["Horizon Organic Whole Milk"])
+    index.add_products(["Fresh Baked Bread", "Blue Corn Chips"])
+
+    assert index.suggest("milk") == []
+    assert index.suggest("organic") == []
+    assert [s["text"] for s in index.suggest("corn")] == ["Blue Corn Chips"]
+
+
+def test_cached_flag_checks_the_users_saved_location(client, app_module, monkeypatch):
+    monkeypatch.setenv("KROGER_CLIENT_ID", "id")
+    monkeypatch.setenv("KROGER_CLIENT_SECRET", "secret")
+    app_module.preferred_locations.set("suggest-user", "01400943")
+    app_module.suggest_index.add_query("oat milk", "Oat Milk")
+    app_module.results_cache.set("kroger@01400943_oat milk", object(), datetime.now() + timedelta(minutes=5))
+
+    def cached(**params):
+        resp = client.get("/api/suggest", query_string={"q": "oat m", **params})
+        return {s["text"]: s["cached"] for s in resp.get_json()["suggestions"]}["Oat Milk"]
+
+    assert cached(user_id="suggest-user") is True
+    assert cached(user_id="someone-else") is False
+    assert cached(location_ids="01400943") is True
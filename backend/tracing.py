@@ -0,0 +1,189 @@
+"""
+Lightweight request tracing for the search pipeline.
+
+A trace is started per request with `trace()`; code inside it opens nested
+`span()`s. Finished traces are emitted as structured JSON log lines:
+
+- TRACE_ENABLED=true      -> one JSON line per span on the `hff.trace` logger
+- TRACE_SLOW_REQUEST_MS=N -> the full span tree of any request slower than N ms
+                             on the `hff.slow_request` logger
+
+With both unset no trace is started, and `span()` returns a shared no-op
+context manager after a single ContextVar lookup.
+"""
+import contextvars
+import functools
+import itertools
+import json
+import logging
+import os
+import sys
+import time
+import uuid
+
+TRACE_ENABLED = os.getenv("TRACE_ENABLED", "false").lower() in ("1", "true", "yes", "y")
+SLOW_REQUEST_MS = float(os.getenv("TRACE_SLOW_REQUEST_MS", "0") or 0)
+
+trace_log = logging.getLogger("hff.trace")
+slow_log = logging.getLogger("hff.slow_request")
+
+_current_trace = contextvars.ContextVar("hff_trace", default=None)
+_current_span = contextvars.ContextVar("hff_span", default=None)
+_span_ids = itertools.count(1)
+
+
+def _configure_json_logger(logger):
+    # Trace output is one JSON document per line; keep it off the root logger's formatting.
+    if not logger.handlers:
+        handler = logging.StreamHandler(sys.stderr)
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+
+_configure_json_logger(trace_log)
+_configure_json_logger(slow_log)
+
+
+def enabled() -> bool:
+    return TRACE_ENABLED or SLOW_REQUEST_MS > 0
+
+
+class Span:
+    __slots__ = ("trace", "span_id", "parent_id", "name", "attrs", "start", "duration_ms", "error", "_tokens")
+
+    def __init__(self, trace, name, parent_id, attrs):
+        self.trace = trace
+        self.span_id = next(_span_ids)
+        self.parent_id = parent_id
+        self.name = name
+        self.attrs = attrs
+        self.start = None
+        self.duration_ms = None
+        self.error = None
+        self._tokens = None
+
+    def set(self, **attrs):
+        """Attach attributes (result counts, status codes, ...) to the span."""
+        self.attrs.update(attrs)
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        self._tokens = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.duration_ms = (time.perf_counter() - self.start) * 1000.0
+        if exc_type is not None:
+            self.error = f"{exc_type.__name__}: {exc}"
+        _current_span.reset(self._tokens)
+        self.trace.spans.append(self)
+        return False
+
+    def to_dict(self):
+        out = {
+            "trace_id": self.trace.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_ms": round((self.start - self.trace.start) * 1000.0, 3),
+            "duration_ms": round(self.duration_ms, 3),
+        }
+        if self.attrs:
+            out["attrs"] = self.attrs
+        if self.error:
+            out["error"] = self.error
+        return out
+
+
+class _NoopSpan:
+    """Returned when no trace is active; every operation is a no-op."""
+
+    def set(self, **attrs):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP = _NoopSpan()
+
+
+class Trace:
+    def __init__(self, name, attrs):
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.name = name
+        self.start = time.perf_counter()
+        self.spans = []
+        self.root = Span(self, name, None, attrs)
+        self._token = None
+
+    def __enter__(self):
+        self._token = _current_trace.set(self)
+        self.root.__enter__()
+        self.start = self.root.start
+        return self.root
+
+    def __exit__(self, exc_type, exc, tb):
+        self.root.__exit__(exc_type, exc, tb)
+        _current_trace.reset(self._token)
+        self._emit()
+        return False
+
+    def tree(self):
+        """Nest finished spans under their parents (children in start order)."""
+        nodes = {s.span_id: dict(s.to_dict(), children=[]) for s in self.spans}
+        for s in sorted(self.spans, key=lambda s: s.start):
+            if s.parent_id in nodes:
+                nodes[s.parent_id]["children"].append(nodes[s.span_id])
+        return nodes[self.root.span_id]
+
+    def _emit(self):
+        if TRACE_ENABLED:
+            for s in self.spans:
+                trace_log.info(json.dumps(s.to_dict(), default=str))
+        if SLOW_REQUEST_MS > 0 and self.root.duration_ms >= SLOW_REQUEST_MS:
+            slow_log.warning(json.dumps({
+                "event": "slow_request",
+                "trace_id": self.trace_id,
+                "name": self.name,
+                "duration_ms": round(self.root.duration_ms, 3),
+                "threshold_ms": SLOW_REQUEST_MS,
+                "spans": self.tree(),
+            }, default=str))
+
+
+def trace(name, **attrs):
+    """Start a request-level trace (no-op unless tracing or the slow-request log is enabled)."""
+    if not enabled() or _current_trace.get() is not None:
+        return span(name, **attrs)
+    return Trace(name, attrs)
+
+
+def span(name, **attrs):
+    """Open a child span of the current span (no-op outside a trace)."""
+    t = _current_trace.get()
+    if t is None:
+        return _NOOP
+    parent = _current_span.get()
+    return Span(t, name, parent.span_id if parent is not None else None, attrs)
+
+
+def current_span():
+    """The innermost open span, or a no-op span outside a trace."""
+    return _current_span.get() or _NOOP
+
+
+def traced(name):
+    """Decorator form of span()."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
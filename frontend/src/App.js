@@ -4,16 +4,24 @@ import SearchBar from './components/SearchBar';
 import ProductList from './components/ProductList';
 import FilterManager from './components/FilterManager';
 
+const PAGE_SIZE = 24;
+
 function App() {
   const [products, setProducts] = useState([]);
+  const [hiddenProducts, setHiddenProducts] = useState([]);
   const [loading, setLoading] = useState(false);
   const [filters, setFilters] = useState([]);
+  const [profile, setProfile] = useState('default');
+  const [profiles, setProfiles] = useState([]);
   const [showFilters, setShowFilters] = useState(false);
   const [stats, setStats] = useState({ total_found: 0, filtered_count: 0 });
+  const [nextCursor, setNextCursor] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
 
   useEffect(() => {
     // Load user filters on mount
     loadFilters();
+    loadProfiles();
   }, []);
 
   const loadFilters = async () => {
@@ -21,12 +29,45 @@ function App() {
       const response = await fetch('/api/filters?user_id=default');
       const data = await response.json();
       setFilters(data.filters || []);
+      setProfile(data.profile || 'default');
     } catch (error) {
       console.error('Error loading filters:', error);
     }
   };
 
-  const handleSearch = async (searchTerm, store = 'kroger') => {
+  const loadProfiles = async () => {
+    try {
+      const response = await fetch('/api/profiles');
+      const data = await response.json();
+      setProfiles((data.profiles || []).map((p) => p.name));
+    } catch (error) {
+      console.error('Error loading profiles:', error);
+    }
+  };
+
+  const handleProfileChange = async (profileName) => {
+    try {
+      const response = await fetch('/api/filters/profile', {
+        method: 'POST',
+        headers: {
+          'Content-Type': 'application/json',
+        },
+        body: JSON.stringify({
+          profile: profileName,
+          user_id: 'default'
+        }),
+      });
+
+      const data = await response.json();
+      setFilters(data.filters || []);
+      setProfile(data.profile || profileName);
+    } catch (error) {
+      console.error('Error changing profile:', error);
+      alert('Error changing filter profile. Please try again.');
+    }
+  };
+
+  const handleSearch = async (searchTerm, store = 'kroger', zipCode = '', { sort = 'relevance', maxPrice = '' } = {}) => {
     if (!searchTerm.trim()) return;
 
     setLoading(true);
@@ -39,7 +80,13 @@ function App() {
         body: JSON.stringify({
           query: searchTerm,
           user_id: 'default',
-          store: store
+          store: store,
+          include_hidden: true,
+          compact: true,
+          page_size: PAGE_SIZE,
+          sort: sort,
+          ...(maxPrice ? { max_price: maxPrice } : {}),
+          ...(zipCode ? { zip: zipCode } : {})
         }),
       });
 
@@ -55,13 +102,17 @@ function App() {
       
       if (data.products) {
         setProducts(data.products);
+        setHiddenProducts(data.hidden || []);
         setStats({
           total_found: data.total_found || 0,
           filtered_count: data.filtered_count || 0
         });
+        setNextCursor(data.next_cursor || null);
       } else {
         setProducts([]);
+        setHiddenProducts([]);
         setStats({ total_found: 0, filtered_count: 0 });
+        setNextCursor(null);
       }
     } catch (error) {
       console.error('Error searching products:', error);
@@ -71,6 +122,45 @@ function App() {
     }
   };
 
+  const handleLoadMore = async () => {
+    if (!nextCursor || loadingMore) return;
+
+    setLoadingMore(true);
+    try {
+      const response = await fetch('/api/search', {
+        method: 'POST',
+        headers: {
+          'Content-Type': 'application/json',
+        },
+        body: JSON.stringify({
+          cursor: nextCursor,
+          include_hidden: true,
+          compact: true
+        }),
+      });
+
+      const data = await response.json().catch(() => ({ error: 'Unknown error occurred' }));
+      if (!response.ok || data.error) {
+        // 410: the cached results expired; the next page needs a new search.
+        setNextCursor(null);
+        throw new Error(data.error || `HTTP error! status: ${response.status}`);
+      }
+
+      setProducts((current) => current.concat(data.products || []));
+      setHiddenProducts((current) => current.concat(data.hidden || []));
+      setStats({
+        total_found: data.total_found || 0,
+        filtered_count: data.filtered_count || 0
+      });
+      setNextCursor(data.next_cursor || null);
+    } catch (error) {
+      console.error('Error loading more products:', error);
+      alert(`Error loading more products: ${error.message || 'Please try again.'}`);
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   const handleAddFilter = async (filterTerm) => {
     try {
       const response = await fetch('/api/filters', {
@@ -85,6 +175,11 @@ function App() {
       });
 
       const data = await response.json();
+      if (!response.ok) {
+        // e.g. a nutrient rule with an unknown nutrient or unit
+        alert(data.error || 'Error adding filter. Please try again.');
+        return;
+      }
       setFilters(data.filters || []);
     } catch (error) {
       console.error('Error adding filter:', error);
@@ -133,6 +228,9 @@ function App() {
         {showFilters && (
           <FilterManager
             filters={filters}
+            profile={profile}
+            profiles={profiles}
+            onProfileChange={handleProfileChange}
             onAddFilter={handleAddFilter}
             onRemoveFilter={handleRemoveFilter}
           />
@@ -148,7 +246,14 @@ function App() {
           </div>
         )}
 
-        <ProductList products={products} loading={loading} />
+        <ProductList
+          products={products}
+          hiddenProducts={hiddenProducts}
+          loading={loading}
+          hasMore={Boolean(nextCursor)}
+          loadingMore={loadingMore}
+          onLoadMore={handleLoadMore}
+        />
       </main>
     </div>
   );
@@ -1,7 +1,7 @@
 import React, { useState } from 'react';
 import './FilterManager.css';
 
-function FilterManager({ filters, onAddFilter, onRemoveFilter }) {
+function FilterManager({ filters, profile, profiles, onProfileChange, onAddFilter, onRemoveFilter }) {
   const [newFilter, setNewFilter] = useState('');
 
   const handleAddFilter = (e) => {
@@ -16,15 +16,31 @@ function FilterManager({ filters, onAddFilter, onRemoveFilter }) {
     <div className="filter-manager">
       <h2>Active Filters</h2>
       <p className="filter-description">
-        Products containing these ingredients will be filtered out:
+        Products containing these ingredients, or breaking these nutrient limits, will be filtered out:
       </p>
 
+      {profiles && profiles.length > 0 && (
+        <div className="profile-select">
+          <label htmlFor="filter-profile">Filter profile:</label>
+          <select
+            id="filter-profile"
+            value={profile}
+            onChange={(e) => onProfileChange(e.target.value)}
+            className="profile-dropdown"
+          >
+            {profiles.map((name) => (
+              <option key={name} value={name}>{name}</option>
+            ))}
+          </select>
+        </div>
+      )}
+
       <form onSubmit={handleAddFilter} className="add-filter-form">
         <input
           type="text"
           value={newFilter}
           onChange={(e) => setNewFilter(e.target.value)}
-          placeholder="Add a filter (e.g., 'sugar', 'preservatives')..."
+          placeholder="Add a filter (e.g., 'preservatives', 'sodium < 300 mg')..."
           className="filter-input"
         />
         <button type="submit" className="add-filter-button">
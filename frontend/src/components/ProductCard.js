@@ -1,8 +1,53 @@
 import React, { useState } from 'react';
 import './ProductCard.css';
 
+// Nutrition record keys (per serving) shown under the ingredients
+const NUTRITION_LABELS = [
+  ['calories', 'Calories', ''],
+  ['sodium_mg', 'Sodium', 'mg'],
+  ['sugar_g', 'Sugars', 'g'],
+  ['added_sugar_g', 'Added sugars', 'g'],
+  ['protein_g', 'Protein', 'g'],
+];
+
 function ProductCard({ product }) {
   const [addingToCart, setAddingToCart] = useState(false);
+  // Search results are compact (no ingredients); they're fetched when the card is expanded
+  const [ingredients, setIngredients] = useState(product.ingredients);
+  const [nutrition, setNutrition] = useState(product.nutrition);
+  const [showIngredients, setShowIngredients] = useState(false);
+  const [loadingIngredients, setLoadingIngredients] = useState(false);
+
+  const handleToggleIngredients = async () => {
+    if (showIngredients) {
+      setShowIngredients(false);
+      return;
+    }
+    setShowIngredients(true);
+    if (ingredients !== undefined || !product.productId) return;
+    setLoadingIngredients(true);
+    try {
+      const response = await fetch('/api/products/details', {
+        method: 'POST',
+        headers: {
+          'Content-Type': 'application/json',
+        },
+        body: JSON.stringify({
+          product_ids: [product.productId],
+          store: product.store || 'kroger',
+          fields: ['ingredients', 'nutrition']
+        }),
+      });
+      const data = await response.json();
+      const details = (data.products || [])[0];
+      setIngredients(details ? details.ingredients || '' : '');
+      setNutrition(details ? details.nutrition : undefined);
+    } catch (error) {
+      console.error('Error loading ingredients:', error);
+    } finally {
+      setLoadingIngredients(false);
+    }
+  };
 
   const handleAddToCart = async () => {
     setAddingToCart(true);
@@ -32,7 +77,7 @@ function ProductCard({ product }) {
   };
 
   return (
-    <div className="product-card">
+    <div className={product.hidden_because ? 'product-card product-card-hidden' : 'product-card'}>
       {product.image && (
         <div className="product-image">
           <img src={product.image} alt={product.name} />
@@ -40,13 +85,56 @@ function ProductCard({ product }) {
       )}
       <div className="product-info">
         <h3 className="product-name">{product.name}</h3>
-        {product.price && product.price !== 'N/A' && (
-          <p className="product-price">{product.price}</p>
+        {product.store && !product.offers && <p className="product-store">{product.store}</p>}
+        {product.offers ? (
+          // The same item at several stores (store=all): one line per store
+          <ul className="product-offers">
+            {product.offers.map((offer) => (
+              <li key={offer.store}>
+                <span className="offer-store">{offer.store}</span>{' '}
+                <span className="product-price">{offer.price || 'N/A'}</span>
+              </li>
+            ))}
+          </ul>
+        ) : product.price && product.price !== 'N/A' && (
+          <p className="product-price">
+            {product.promo_price ? (
+              <>
+                {product.promo_price} <s className="regular-price">{product.price}</s>
+              </>
+            ) : product.price}
+            {product.unit_price && <span className="unit-price"> ({product.unit_price})</span>}
+          </p>
+        )}
+        {product.lowest_recent_price && product.lowest_recent_price !== product.price && (
+          <p className="lowest-price-note">Lowest in 30 days: {product.lowest_recent_price}</p>
+        )}
+        {product.hidden_because && (
+          <p className="hidden-because">
+            Hidden because: {product.hidden_because.join(', ')}
+          </p>
+        )}
+        {product.unverified && (
+          <p className="unverified-note">
+            Ingredients not checked yet (filtered on name and category only)
+          </p>
         )}
-        {product.ingredients && (
+        <button className="ingredients-toggle" onClick={handleToggleIngredients}>
+          {showIngredients ? 'Hide ingredients' : 'Show ingredients'}
+        </button>
+        {showIngredients && (
           <div className="product-ingredients">
             <strong>Ingredients:</strong>
-            <p className="ingredients-text">{product.ingredients}</p>
+            <p className="ingredients-text">
+              {loadingIngredients ? 'Loading...' : ingredients || 'Not available'}
+            </p>
+            {nutrition && (
+              <p className="nutrition-text">
+                {NUTRITION_LABELS.filter(([key]) => nutrition[key] !== undefined)
+                  .map(([key, label, unit]) => `${label} ${nutrition[key]}${unit}`)
+                  .join(' · ')}
+              </p>
+            )}
           </div>
         )}
         <div className="product-actions">
@@ -1,8 +1,13 @@
-import React from 'react';
+import React, { useState } from 'react';
 import './ProductList.css';
 import ProductCard from './ProductCard';
 
-function ProductList({ products, loading }) {
+// Stable per product (not its position), so a card's fetched ingredients stay with their product
+const productKey = (product, index) => `${product.store || ''}:${product.productId || product.url || index}`;
+
+function ProductList({ products, hiddenProducts = [], loading, hasMore = false, loadingMore = false, onLoadMore }) {
+  const [showHidden, setShowHidden] = useState(false);
+
   if (loading) {
     return (
       <div className="loading-container">
@@ -12,7 +17,7 @@ function ProductList({ products, loading }) {
     );
   }
 
-  if (products.length === 0) {
+  if (products.length === 0 && hiddenProducts.length === 0) {
     return (
       <div className="empty-state">
         <p>No products found. Try searching for something!</p>
@@ -21,11 +26,34 @@ function ProductList({ products, loading }) {
   }
 
   return (
-    <div className="product-list">
-      {products.map((product, index) => (
-        <ProductCard key={index} product={product} />
-      ))}
-    </div>
+    <>
+      <div className="product-list">
+        {products.map((product, index) => (
+          <ProductCard key={productKey(product, index)} product={product} />
+        ))}
+      </div>
+      {hasMore && (
+        <div className="load-more">
+          <button className="load-more-button" onClick={onLoadMore} disabled={loadingMore}>
+            {loadingMore ? 'Loading...' : 'Load more products'}
+          </button>
+        </div>
+      )}
+      {hiddenProducts.length > 0 && (
+        <div className="hidden-products">
+          <button className="hidden-toggle" onClick={() => setShowHidden(!showHidden)}>
+            {showHidden ? 'Hide' : 'Show'} filtered-out products ({hiddenProducts.length})
+          </button>
+          {showHidden && (
+            <div className="product-list">
+              {hiddenProducts.map((product, index) => (
+                <ProductCard key={productKey(product, index)} product={product} />
+              ))}
+            </div>
+          )}
+        </div>
+      )}
+    </>
   );
 }
 
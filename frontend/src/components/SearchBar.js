@@ -1,14 +1,57 @@
-import React, { useState } from 'react';
+import React, { useState, useEffect } from 'react';
 import './SearchBar.css';
 
 function SearchBar({ onSearch, loading }) {
   const [searchTerm, setSearchTerm] = useState('');
   const [selectedStore, setSelectedStore] = useState('kroger');
+  const [suggestions, setSuggestions] = useState([]);
+  const [zipCode, setZipCode] = useState('');
+  const [sort, setSort] = useState('relevance');
+  const [maxPrice, setMaxPrice] = useState('');
+  const [stores, setStores] = useState([{ name: 'kroger', display_name: 'Kroger' }]);
+
+  useEffect(() => {
+    // Stores the backend has enabled; "All stores" searches them at once
+    fetch('/api/stores')
+      .then((response) => response.json())
+      .then((data) => setStores((data.stores || []).filter((s) => s.enabled)))
+      .catch((error) => console.error('Error loading stores:', error));
+  }, []);
+
+  useEffect(() => {
+    // Completions come from the backend's in-memory index (past searches + cached products)
+    if (!searchTerm.trim()) {
+      setSuggestions([]);
+      return undefined;
+    }
+    const controller = new AbortController();
+    const timer = setTimeout(async () => {
+      try {
+        // (user_id and zip: "cached" is checked for the store this search would go to)
+        const params = new URLSearchParams({ q: searchTerm, store: selectedStore, user_id: 'default' });
+        if (zipCode.trim()) {
+          params.set('zip', zipCode.trim());
+        }
+        const response = await fetch(`/api/suggest?${params}`, { signal: controller.signal });
+        const data = await response.json();
+        setSuggestions(data.suggestions || []);
+      } catch (error) {
+        if (error.name !== 'AbortError') {
+          console.error('Error loading suggestions:', error);
+        }
+      }
+    }, 120);
+    return () => {
+      clearTimeout(timer);
+      controller.abort();
+    };
+  }, [searchTerm, selectedStore, zipCode]);
 
   const handleSubmit = (e) => {
     e.preventDefault();
     if (searchTerm.trim()) {
-      onSearch(searchTerm, selectedStore);
+      // A ZIP searches its nearest store (this search only, nothing is saved); blank uses the saved one
+      onSearch(searchTerm, selectedStore, zipCode.trim(), { sort, maxPrice: maxPrice.trim() });
     }
   };
 
@@ -24,9 +67,43 @@ function SearchBar({ onSearch, loading }) {
             className="store-select"
             disabled={loading}
           >
-            <option value="kroger">Kroger</option>
+            {stores.map((s) => (
+              <option key={s.name} value={s.name}>{s.display_name}</option>
+            ))}
+            {stores.length > 1 && <option value="all">All stores</option>}
           </select>
         </div>
+        <input
+          type="text"
+          value={zipCode}
+          onChange={(e) => setZipCode(e.target.value.replace(/[^0-9]/g, '').slice(0, 5))}
+          placeholder="ZIP"
+          className="zip-input"
+          disabled={loading}
+          inputMode="numeric"
+          aria-label="ZIP code for nearest store"
+        />
+        <select
+          value={sort}
+          onChange={(e) => setSort(e.target.value)}
+          className="sort-select"
+          disabled={loading}
+          aria-label="Sort results"
+        >
+          <option value="relevance">Best match</option>
+          <option value="price">Price</option>
+          <option value="unit_price">Unit price</option>
+        </select>
+        <input
+          type="text"
+          value={maxPrice}
+          onChange={(e) => setMaxPrice(e.target.value.replace(/[^0-9.]/g, '').slice(0, 7))}
+          placeholder="Max $"
+          className="max-price-input"
+          disabled={loading}
+          inputMode="decimal"
+          aria-label="Maximum price"
+        />
         <input
           type="text"
           value={searchTerm}
@@ -34,7 +111,14 @@ function SearchBar({ onSearch, loading }) {
           placeholder="Search for products (e.g., 'chicken', 'bread', 'milk')..."
           className="search-input"
           disabled={loading}
+          list="search-suggestions"
+          autoComplete="off"
         />
+        <datalist id="search-suggestions">
+          {suggestions.map((suggestion) => (
+            <option key={`${suggestion.type}:${suggestion.text}`} value={suggestion.text} />
+          ))}
+        </datalist>
         <button
           type="submit"
           className="search-button"